@@ -11,6 +11,12 @@ class Bus:
             self._wait_states: int = 0
             self._device: device.Device = None
 
+    # granularity of the address decoder; 256 bytes keeps the MDA and ROM windows aligned
+    PAGE_SHIFT: int = 8
+    PAGE_SIZE: int = 1 << PAGE_SHIFT
+    ADDRESS_SPACE: int = 1 << 20
+    FETCH_WINDOW_PAGES: int = 16  # at most, see GetFetchWindow
+
     def __init__(self, size: int, devices: List[device], roms: List[rom.Rom]):
         self._size = size
         self._m = memory.Memory(size)
@@ -19,6 +25,13 @@ class Bus:
         self._roms = roms
 
         self._cache: List[Bus.CacheEntry] = None
+        self._pages: List[Bus.CacheEntry] = None
+        # 1 for each page that is plain RAM without wait states, covers the full 1 MB
+        self._ram_pages: bytearray = bytearray(Bus.ADDRESS_SPACE >> Bus.PAGE_SHIFT)
+        # same, but without the pages that hold decoded instructions: those must see every write
+        self._ram_write_pages: bytearray = bytearray(Bus.ADDRESS_SPACE >> Bus.PAGE_SHIFT)
+        self._code_pages: bytearray = bytearray(Bus.ADDRESS_SPACE >> Bus.PAGE_SHIFT)
+        self._code_write_callback = None
         self.RecreateCache()
 
     def GetState(self) -> List[str]:
@@ -48,14 +61,109 @@ class Bus:
         # last! because it is a full 1 MB
         self._AddEntries((self._m,))
 
-    def ClearMemory(self):
-        self._m = memory.Memory(self._size)
-        self.RecreateCache()
+        self._RecreatePageTable()
+
+    def _RecreatePageTable(self):
+        # one entry per page pointing straight to the device that handles it;
+        # None if a page is shared by multiple devices (handled by _ScanCache)
+        n_pages = (self._size + Bus.PAGE_SIZE - 1) >> Bus.PAGE_SHIFT
+        self._pages = [ None ] * n_pages
+
+        # walk each entry's own pages; the first entry touching a page decides it, as in _ScanCache
+        decided = bytearray(n_pages)
 
-    def ReadByte(self, address: int) -> Tuple[int, int]:
+        for entry in self._cache:
+            first_page = entry.start_addr >> Bus.PAGE_SHIFT
+            last_page = min((entry.end_addr + Bus.PAGE_SIZE - 1) >> Bus.PAGE_SHIFT, n_pages)
+
+            for page in range(first_page, last_page):
+                if decided[page]:
+                    continue
+                decided[page] = 1
+
+                start_addr = page << Bus.PAGE_SHIFT
+                if entry.start_addr <= start_addr and entry.end_addr >= start_addr + Bus.PAGE_SIZE:
+                    self._pages[page] = entry
+
+        # updated in place so that references handed out by GetRamPages() stay valid
+        for page in range(len(self._ram_pages)):
+            entry = self._pages[page] if page < n_pages else None
+            self._ram_pages[page] = entry != None and entry.device == self._m and entry.wait_states == 0
+            self._ram_write_pages[page] = self._ram_pages[page] and not self._code_pages[page]
+
+    def _ScanCache(self, address: int) -> CacheEntry:
         for entry in self._cache:
             if address >= entry.start_addr and address < entry.end_addr:
-                return (entry.device.ReadByte(address), entry.wait_states)
+                return entry
+
+        return None
+
+    def ClearMemory(self):
+        # in place, so the device entries and page table stay valid
+        self._m.Clear()
+
+        for page in range(len(self._code_pages)):
+            if self._code_pages[page]:
+                self._InvalidateCodePage(page)
+
+    def GetRam(self) -> bytearray:
+        return self._m.GetBuffer()
+
+    def GetRamPages(self) -> bytearray:
+        return self._ram_pages
+
+    def GetRamWritePages(self) -> bytearray:
+        return self._ram_write_pages
+
+    # a view on the memory that holds 'address' for reading instructions, and the address of its first byte
+    # it ends at the first page that is handled by another device, None if there is no such memory (MMIO,
+    # wait states); the view sees the writes to it
+    def GetFetchWindow(self, address: int) -> Tuple[memoryview, int]:
+        page = address >> Bus.PAGE_SHIFT
+        entry = self._pages[page] if page < len(self._pages) else None
+        if entry == None or entry.wait_states != 0:
+            return None
+
+        fetch = entry.device.GetFetchBuffer()
+        if fetch == None:
+            return None
+        buffer, offset = fetch
+
+        end = page + 1
+        while end < len(self._pages) and end - page < Bus.FETCH_WINDOW_PAGES and self._pages[end] is entry:
+            end += 1
+
+        start = page << Bus.PAGE_SHIFT
+        return (memoryview(buffer)[start - offset:(end << Bus.PAGE_SHIFT) - offset], start)
+
+    def SetCodeWriteCallback(self, callback):
+        self._code_write_callback = callback
+
+    def CanCacheCode(self, page: int) -> bool:
+        # contents only change by writes through the bus and reading costs no extra cycles
+        entry = self._pages[page] if page < len(self._pages) else None
+        return entry != None and entry.wait_states == 0
+
+    def MarkCodePage(self, page: int):
+        self._code_pages[page] = 1
+        self._ram_write_pages[page] = 0
+
+    def ClearCodePages(self):
+        for page in range(len(self._code_pages)):
+            self._code_pages[page] = 0
+            self._ram_write_pages[page] = self._ram_pages[page]
+
+    def _InvalidateCodePage(self, page: int):
+        self._code_pages[page] = 0
+        self._ram_write_pages[page] = self._ram_pages[page]
+
+        if self._code_write_callback != None:
+            self._code_write_callback(page)
+
+    def ReadByte(self, address: int) -> Tuple[int, int]:
+        entry = self._pages[address >> Bus.PAGE_SHIFT] if address < self._size else None
+        if entry != None or (entry := self._ScanCache(address)) != None:
+            return (entry.device.ReadByte(address), entry.wait_states)
 
         print(f'ReadByte from {address:06x} UNHANDLED')
 
@@ -63,11 +171,34 @@ class Bus:
 
     def WriteByte(self, address: int, v: int) -> int:
         assert v >= 0 and v <= 255
-        for entry in self._cache:
-            if address >= entry.start_addr and address < entry.end_addr:
-                entry.device.WriteByte(address, v)
-                return entry.wait_states
+        entry = self._pages[address >> Bus.PAGE_SHIFT] if address < self._size else None
+        if entry != None or (entry := self._ScanCache(address)) != None:
+            entry.device.WriteByte(address, v)
+            if self._code_pages[address >> Bus.PAGE_SHIFT]:
+                self._InvalidateCodePage(address >> Bus.PAGE_SHIFT)
+            return entry.wait_states
 
         print(f'WriteByte to {address:06x} ({v:02x}) UNHANDLED')
 
         return 1  #  TODO
+
+    # 'address' + 1 must be below 1 MB; a word access takes two bus cycles, both with wait states
+    def ReadWord(self, address: int) -> Tuple[int, int]:
+        entry = self._pages[address >> Bus.PAGE_SHIFT] if address < self._size else None
+        if entry != None and (address & (Bus.PAGE_SIZE - 1)) != Bus.PAGE_SIZE - 1:
+            return (entry.device.ReadWord(address), entry.wait_states * 2)
+
+        low = self.ReadByte(address)
+        high = self.ReadByte(address + 1)
+        return (low[0] | (high[0] << 8), low[1] + high[1])
+
+    def WriteWord(self, address: int, v: int) -> int:
+        assert v >= 0 and v <= 65535
+        entry = self._pages[address >> Bus.PAGE_SHIFT] if address < self._size else None
+        if entry != None and (address & (Bus.PAGE_SIZE - 1)) != Bus.PAGE_SIZE - 1:
+            entry.device.WriteWord(address, v)
+            if self._code_pages[address >> Bus.PAGE_SHIFT]:
+                self._InvalidateCodePage(address >> Bus.PAGE_SHIFT)
+            return entry.wait_states * 2
+
+        return self.WriteByte(address, v & 0xff) + self.WriteByte(address + 1, v >> 8)
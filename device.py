@@ -5,7 +5,9 @@ class Device(abc.ABC):
     def __init__(self):
         self._pic: i8259 = None
         self._b = None  # cannot ': bus.Bus' because of circular dependencies
+        self._scheduler = None  # cannot ': pc_io.IO' because of circular dependencies
         self._next_interrupt: List[int] = []
+        self._next_interrupt_clock = 0  # when the first of _next_interrupt is due
         self._clock = 0
 
     @abc.abstractmethod
@@ -42,10 +44,25 @@ class Device(abc.ABC):
     def ReadByte(self, offset: int) -> int:
         pass
 
+    # little endian, 'offset' + 1 is handled by this device too
+    def WriteWord(self, offset: int, value: int):
+        self.WriteByte(offset, value & 0xff)
+        self.WriteByte(offset + 1, value >> 8)
+
+    def ReadWord(self, offset: int) -> int:
+        return self.ReadByte(offset) | (self.ReadByte(offset + 1) << 8)
+
+    # memory that the CPU may fetch instructions from directly: (buffer, address of its first byte)
+    # None if reading it has side effects or it changes other than by WriteByte/WriteWord
+    def GetFetchBuffer(self) -> Tuple[bytes, int]:
+        return None
+
     @abc.abstractmethod
     def Ticks(self) -> bool:
         pass
 
+    # invoked with the cycles passed since the previous invocation; not after every instruction
+    # but when an event scheduled with ScheduleEvent() is due and before I/O port accesses
     def Tick(self, cycles: int, clock: int) -> bool:
         self._clock = clock
         return False
@@ -57,15 +74,30 @@ class Device(abc.ABC):
     def SetDma(self, dma_instance):
         pass
 
+    def SetScheduler(self, scheduler_instance):
+        self._scheduler = scheduler_instance
+
+    # asks for Tick() to be invoked once the CPU clock reaches 'clock'
+    def ScheduleEvent(self, clock: int):
+        self._scheduler.ScheduleEvent(self, clock)
+
+    # each delay counts from when the previous scheduled interrupt went off
     def ScheduleInterrupt(self, cycles_delay: int):
         self._next_interrupt.append(cycles_delay)
 
-    def CheckScheduledInterrupt(self, cycles: int) -> bool:
-        if len(self._next_interrupt) > 0:
-            self._next_interrupt[0] -= cycles
-            if self._next_interrupt[0] <= 0:
-                del self._next_interrupt[0]
-                return True
+        if len(self._next_interrupt) == 1:
+            self._next_interrupt_clock = self._scheduler.GetClock() + cycles_delay
+            self.ScheduleEvent(self._next_interrupt_clock)
+
+    def CheckScheduledInterrupt(self, clock: int) -> bool:
+        if len(self._next_interrupt) > 0 and clock >= self._next_interrupt_clock:
+            del self._next_interrupt[0]
+
+            if len(self._next_interrupt) > 0:
+                self._next_interrupt_clock = clock + self._next_interrupt[0]
+                self.ScheduleEvent(self._next_interrupt_clock)
+
+            return True
         return False
 
     def SetPic(self, pic_instance):
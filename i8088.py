@@ -1,11 +1,102 @@
 from typing import List, Tuple
 import bus
 import device
+import hashlib
+import json
+import os
 import pc_io
+import rom
+import specializer
 import state8088
 
 
+# O (0x800), S (0x80), Z (0x40), P (0x04) and C (0x01) are the flags the conditional jumps look at
+JCC_FLAGS = 0x08c5
+# condition 16 is 'always', for LOOP
+JCC_ALWAYS = 16
+
+# taken (1) or not (0) for each condition of the Jcc opcodes (0x70-0x7f) and each combination of the
+# flags in JCC_FLAGS, indexed by condition << 12 | flags & JCC_FLAGS
+def _build_jcc_table() -> bytes:
+    table = bytearray((JCC_ALWAYS + 1) << 12)
+    for f in range(0x1000):
+        if f & ~JCC_FLAGS:
+            continue
+        o = (f >> 11) & 1
+        s = (f >> 7) & 1
+        z = (f >> 6) & 1
+        p = (f >> 2) & 1
+        c = f & 1
+        conditions = [ o, not o, c, not c, z, not z, c or z, not c and not z,
+                       s, not s, p, not p, s != o, s == o, z or s != o, not z and s == o, True ]
+        for condition, taken in enumerate(conditions):
+            table[condition << 12 | f] = taken
+    return bytes(table)
+
+_jcc_taken = _build_jcc_table()
+
+# shared by all instances, the generated handlers only depend on the source of the generic ones
+_specializer = specializer.Specializer()
+
 class i8088:
+    # a fully decoded instruction, as cached by linear address of its first (prefix) byte
+    class Instruction:
+        def __init__(self):
+            self.opcode: int = 0
+            self.prefixes: Tuple[Tuple[int, int], ...] = ()  # (prefix, byte following it)
+            self.modrm: int = 0
+            self.mod: int = 0
+            self.reg: int = 0
+            self.rm: int = 0
+            self.disp: int = 0  # signed displacement, or the address for mod 0/rm 6
+            self.imm: int = 0
+            self.imm2: int = 0  # segment of far pointers
+            self.length: int = 0
+            self.handler = None
+            self.address_mode = None  # ModRM table entry
+            self.inline: int = 0  # case of the flat interpreter that runs it without calling 'handler', 0 for none
+            self.parts: Tuple = None  # for a fused pair (see FuseInstructions): the two instructions it runs and their block
+
+    # what a ModRM byte selects: registers, effective address function, default segment and base cycles
+    class ModRM:
+        def __init__(self, modrm: int, ea, ss: bool, disp_size: int, cycles: int):
+            self.mod: int = modrm >> 6
+            self.reg: int = (modrm >> 3) & 7
+            self.rm: int = modrm & 7
+            self.ea = ea  # returns the offset for an instruction, None for register operands
+            self.ss: bool = ss  # BP based, the default segment is SS instead of DS
+            self.disp_size: int = disp_size
+            self.cycles: int = cycles
+            self.read_cycles: int = cycles + 6 if ea != None else 0  # of reading the operand (see ReadOperand)
+
+    # a straight-line run of decoded instructions, ending at the first one that can change CS:IP
+    class Block:
+        MAX_INSTRUCTIONS = 64
+
+        def __init__(self, address: int, instructions: Tuple, length: int):
+            self.address: int = address
+            self.instructions: Tuple = instructions
+            self.length: int = length  # in bytes
+            self.run = None  # None when no block can start at this address
+            self.valid: bool = True
+            self.backward: bool = False  # ends in a relative jump to a lower address
+            self.idle: bool = False  # jumps back to itself without writing memory or doing I/O
+
+    # a loop of basic blocks, compiled from Python source into one function
+    class Trace:
+        THRESHOLD = 16  # backward jumps to an address before it gets traced
+        MAX_BLOCKS = 16
+        CYCLE_BUDGET = 10000  # the loop returns to the caller after at least this many cycles
+
+        def __init__(self, address: int, cs: int, ip: int, blocks: List):
+            self.address: int = address
+            self.cs: int = cs
+            self.ip: int = ip
+            self.blocks: List = blocks
+            self.source: str = ''
+            self.run = None
+            self.valid: bool = True
+
     def __init__(self, b: bus.Bus, devices: List[device.Device], run_IO: bool):
         self._terminate_on_off_the_rails: bool = False
         self._MemMask: int = 0x000fffff
@@ -13,12 +104,18 @@ class i8088:
         self._breakpoints = set()
         self._ignore_breakpoints: bool = False
         self._stop_reason: str = ''
+        self._interrupt_started: bool = False  # a hardware interrupt was invoked, ends Run()
 
         self._state: state8088.State8088 = state8088.State8088()
 
         self._b = b
+        # direct access to RAM for pages that are plain memory (no MMIO, no wait states)
+        self._ram: bytearray = b.GetRam()
+        self._ram_pages: bytearray = b.GetRamPages()
+        self._ram_write_pages: bytearray = b.GetRamWritePages()
         self._devices = devices
-        self._io = pc_io.IO(b, devices, not run_IO)
+        self._io = pc_io.IO(b, devices, not run_IO, self._state)
+        self._pic = self._io.GetPIC()
         self._terminate_on_off_the_rails = run_IO
 
         self._ops = [ None ] * 256
@@ -202,10 +299,122 @@ class i8088:
         self._ops[0xfe] = self.Op_fe_ff
         self._ops[0xff] = self.Op_fe_ff
 
+        # operand layout for the decoder: is there a ModRM byte, size of the immediate
+        self._has_modrm = [ False ] * 256
+        for opcode in (0x00, 0x08, 0x10, 0x18, 0x20, 0x28, 0x30, 0x38):
+            for i in range(4):
+                self._has_modrm[opcode + i] = True
+        for i in list(range(0x80, 0x90)) + [ 0xc4, 0xc5, 0xc6, 0xc7, 0xd0, 0xd1, 0xd2, 0xd3 ] + list(range(0xd8, 0xe0)) + [ 0xf6, 0xf7, 0xfe, 0xff ]:
+            self._has_modrm[i] = True
+
+        self._imm_size = [ 0 ] * 256
+        for i in [ 0x04, 0x0c, 0x14, 0x1c, 0x24, 0x2c, 0x34, 0x3c ] + list(range(0x60, 0x80)) + [ 0x80, 0x82, 0x83, 0xa8 ] + list(range(0xb0, 0xb8)) + [ 0xc6, 0xcd, 0xd4, 0xd5 ] + list(range(0xe0, 0xe8)) + [ 0xeb ]:
+            self._imm_size[i] = 1
+        for i in [ 0x05, 0x0d, 0x15, 0x1d, 0x25, 0x2d, 0x35, 0x3d, 0x81, 0xa0, 0xa1, 0xa2, 0xa3, 0xa9 ] + list(range(0xb8, 0xc0)) + [ 0xc0, 0xc2, 0xc7, 0xc8, 0xca, 0xe8, 0xe9 ]:
+            self._imm_size[i] = 2
+        self._imm_size[0x9a] = 4
+        self._imm_size[0xea] = 4
+
+        # cycles of one element of the string instructions, without those of the prefixes
+        self._rep_cycles = [ 0 ] * 256
+        for opcode, cycles in ((0xa4, 18), (0xa5, 26), (0xa6, 30), (0xa7, 30), (0xaa, 11), (0xab, 11), (0xac, 5), (0xad, 5), (0xae, 15), (0xaf, 15)):
+            self._rep_cycles[opcode] = cycles
+
+        # all 256 ModRM bytes, indexed by the byte itself
+        ea_functions = [ self.EA_BX_SI, self.EA_BX_DI, self.EA_BP_SI, self.EA_BP_DI, self.EA_SI, self.EA_DI, self.EA_BP, self.EA_BX ]
+        ea_cycles = [ 7, 8, 8, 7, 5, 5, 5, 5 ]
+        self._modrm_table = [ None ] * 256
+        for modrm in range(256):
+            mod = modrm >> 6
+            rm = modrm & 7
+            if mod == 3:
+                self._modrm_table[modrm] = i8088.ModRM(modrm, None, False, 0, 0)
+            elif mod == 0 and rm == 6:
+                self._modrm_table[modrm] = i8088.ModRM(modrm, self.EA_direct, False, 2, 6)
+            else:
+                self._modrm_table[modrm] = i8088.ModRM(modrm, ea_functions[rm], rm in (2, 3, 6), mod, ea_cycles[rm])
+
+        # instructions that end a basic block: branches, calls, returns, interrupts, segment register loads, HLT, STI
+        # (AAM and, see TranslateBlock, DIV/IDIV too as these can invoke interrupt 0)
+        self._block_end = [ False ] * 256
+        for i in [ 0x07, 0x0f, 0x17, 0x1f ] + list(range(0x60, 0x80)) + [ 0x8e, 0x9a ] + list(range(0xc0, 0xc6)) + list(range(0xc8, 0xd0)) + [ 0xd4, 0xe0, 0xe1, 0xe2, 0xe3, 0xe8, 0xe9, 0xea, 0xeb, 0xf4, 0xfb, 0xfe, 0xff ]:
+            self._block_end[i] = True
+
+        # instructions that only read memory, so a loop of them can only be ended by an interrupt
+        # (ModRM instructions that may write, see IsIdleSafe)
+        self._idle_safe = [ False ] * 256
+        for i in [ 0x02, 0x03, 0x04, 0x05, 0x0a, 0x0b, 0x0c, 0x0d, 0x12, 0x13, 0x14, 0x15, 0x1a, 0x1b, 0x1c, 0x1d, 0x22, 0x23, 0x24, 0x25, 0x2a, 0x2b, 0x2c, 0x2d, 0x32, 0x33, 0x34, 0x35, 0x38, 0x39, 0x3a, 0x3b, 0x3c, 0x3d ] + list(range(0x40, 0x50)) + list(range(0x60, 0x80)) + [ 0x80, 0x81, 0x82, 0x83, 0x84, 0x85, 0x88, 0x89, 0x8a, 0x8b, 0x90, 0xa0, 0xa1, 0xa8, 0xa9 ] + list(range(0xb0, 0xc0)) + [ 0xe0, 0xe1, 0xe2, 0xe3, 0xeb, 0xf5, 0xf6, 0xf7, 0xf8, 0xf9, 0xfc, 0xfd ]:
+            self._idle_safe[i] = True
+        self._idle_cycles: int = 0  # skipped while halted or in an idle loop
+
+        # decoded instructions by linear address, and which of those are in each page
+        self._icache: dict = dict()
+        self._icache_pages: dict = dict()
+        # translated basic blocks and compiled traces by linear address, and which of those are in each page
+        self._blocks: dict = dict()
+        self._traces: dict = dict()
+        self._block_pages: dict = dict()
+        # backward jump counts by target address, and the blocks seen so far while recording a trace
+        self._loop_counts: dict = dict()
+        self._trace_recording = None
+        self._b.SetCodeWriteCallback(self.InvalidateCodePage)
+
+        # handlers of the instructions with a ModRM byte, indexed by opcode << 3 | reg: for the ALU
+        # instructions copies with the decoding of the opcode (and for the groups the reg field) folded away,
+        # None until one gets decoded (see GetModRMHandler)
+        self._modrm_ops = [ None ] * 2048
+        self.UseSpecializedHandlers(True)
+
+        # see UseFlatInterpreter
+        self._interpreter = None
+        self._inline_cases = [ 0 ] * 2048
+
+        # see FuseInstructions
+        self._fuse: bool = True
+
+        # the memory operand of the instruction that runs, set by ReadOperand for WriteOperand
+        self._operand_base: int = 0
+        self._operand_offset: int = 0
+
+        # the memory that instructions are fetched from, see GetPcByte
+        self._fetch: memoryview = None
+        self._fetch_start: int = 0  # linear address of its first byte
+        self._fetch_size: int = 0
+
         # bit 1 of the flags register is always 1
         # https://www.righto.com/2023/02/silicon-reverse-engineering-intel-8086.html
         self._state.SetFlagBit(1)
 
+    # ALU handlers that get a copy per opcode, and the groups that also get one per ModRM reg field
+    _specialize = [ 0x00, 0x01, 0x02, 0x03, 0x08, 0x09, 0x0a, 0x0b, 0x10, 0x11, 0x12, 0x13, 0x18, 0x19, 0x1a, 0x1b,
+                    0x20, 0x21, 0x22, 0x23, 0x28, 0x29, 0x2a, 0x2b, 0x30, 0x31, 0x32, 0x33, 0x38, 0x39, 0x3a, 0x3b, 0x84, 0x85 ]
+    _specialize_groups = [ 0x80, 0x81, 0x82, 0x83, 0xd0, 0xd1, 0xd2, 0xd3, 0xf6, 0xf7, 0xfe, 0xff ]
+
+    # installs the generated handlers or, with 'enable' False, the generic ones they're made from (the
+    # reference to test them against); decoded instructions hold on to their handler so these are dropped
+    # the handlers are generated when an instruction that uses them is first decoded, generating all of them
+    # up front would make creating an i8088 take most of a second
+    def UseSpecializedHandlers(self, enable: bool):
+        for opcode in range(256):
+            specialize = enable and (opcode in i8088._specialize_groups or opcode in i8088._specialize)
+            for reg in range(8):
+                self._modrm_ops[opcode << 3 | reg] = None if specialize else self._ops[opcode]
+
+        self.ClearInstructionCache()
+
+    # the handler for 'key' (opcode << 3 | reg) in _modrm_ops, generated if it is not there yet
+    def GetModRMHandler(self, key: int):
+        handler = self._modrm_ops[key]
+        if handler == None:
+            opcode = key >> 3
+            if opcode in i8088._specialize_groups:
+                handler = _specializer.Specialize(self._ops[opcode], { 'opcode': opcode, 'reg': key & 7 })
+            else:
+                handler = _specializer.Specialize(self._ops[opcode], { 'opcode': opcode })
+            self._modrm_ops[key] = handler
+
+        return handler
+
     def ToSigned8(self, n):
         n &= 0xff
         return (n ^ 0x80) - 0x80
@@ -217,404 +426,717 @@ class i8088:
     def GetState(self) -> state8088.State8088:
         return self._state
 
-    def ReadMemByte(self, segment: int, offset: int) -> int:
-        a = ((segment << 4) + offset) & self._MemMask
+    # 'base' is the linear address at which the segment starts, see State8088
+    def ReadMemByte(self, base: int, offset: int) -> int:
+        a = (base + offset) & self._MemMask
+        if self._ram_pages[a >> bus.Bus.PAGE_SHIFT]:
+            return self._ram[a]
         rc = self._b.ReadByte(a)
         self._state._clock += rc[1]
         return rc[0]
 
-    def ReadMemWord(self, segment: int, offset: int) -> int:
-        return self.ReadMemByte(segment, offset) + (self.ReadMemByte(segment, (offset + 1) & 0xffff) << 8)
+    def ReadMemWord(self, base: int, offset: int) -> int:
+        a = (base + offset) & self._MemMask
+        # the second byte wraps around in the segment or at the end of the address space
+        if offset == 0xffff or a == self._MemMask:
+            return self.ReadMemByte(base, offset) + (self.ReadMemByte(base, (offset + 1) & 0xffff) << 8)
+        if self._ram_pages[a >> bus.Bus.PAGE_SHIFT] and self._ram_pages[(a + 1) >> bus.Bus.PAGE_SHIFT]:
+            return self._ram[a] | (self._ram[a + 1] << 8)
+        rc = self._b.ReadWord(a)
+        self._state._clock += rc[1]
+        return rc[0]
 
-    def WriteMemByte(self, segment: int, offset: int, v: int):
-        a = ((segment << 4) + offset) & self._MemMask
+    def WriteMemByte(self, base: int, offset: int, v: int):
+        a = (base + offset) & self._MemMask
+        if self._ram_write_pages[a >> bus.Bus.PAGE_SHIFT]:
+            self._ram[a] = v
+            return
         self._state._clock += self._b.WriteByte(a, v)
 
-    def WriteMemWord(self, segment: int, offset: int, v: int):
-        self.WriteMemByte(segment, offset, v & 0xff);
-        self.WriteMemByte(segment, (offset + 1) & 0xffff, v >> 8)
-
-    def GetPcByte(self) -> int:
-        ip = self._state._ip
-        self._state._ip += 1
-        self._state._ip &= 0xffff
-        return self.ReadMemByte(self._state._cs, ip)
-
-    def GetPcWord(self) -> int:
-        v = self.GetPcByte()
-        v |= self.GetPcByte() << 8
-        return v
-
-    def SetAddSubFlags(self, word: bool, r1: int, r2: int, result: int, issub: bool, flag_c: bool):
-        assert r1 >= 0 and r1 <= (65535 if word else 255)
-        assert r2 >= 0 and r2 <= (65535 if word else 255)
-
-        in_reg_result = (result & 0xffff) if word else (result & 0xff)
-        u_result = result & 0xffffffff
-
-        mask = 0x8000 if word else 0x80
-
-        temp_r2 = ((r2 - flag_c) if issub else (r2 + flag_c)) & 0xffff
-
-        before_sign = (r1 & mask) == mask
-        value_sign = (r2 & mask) == mask
-        after_sign = (u_result & mask) == mask
-
-        self._state.SetFlagO(after_sign != before_sign and ((before_sign != value_sign and issub == True) or (before_sign == value_sign and issub == False)))
-        self._state.SetFlagC(u_result >= 0x10000 if word else u_result >= 0x100)
-        self._state.SetFlagS((in_reg_result & mask) != 0)
-        self._state.SetFlagZ(in_reg_result == 0)
-
-        if issub:
-            self._state.SetFlagA((((r1 & 0x0f) - (r2 & 0x0f) - flag_c) & 0x10) > 0)
+    def WriteMemWord(self, base: int, offset: int, v: int):
+        a = (base + offset) & self._MemMask
+        if offset == 0xffff or a == self._MemMask:
+            self.WriteMemByte(base, offset, v & 0xff);
+            self.WriteMemByte(base, (offset + 1) & 0xffff, v >> 8)
+            return
+        if self._ram_write_pages[a >> bus.Bus.PAGE_SHIFT] and self._ram_write_pages[(a + 1) >> bus.Bus.PAGE_SHIFT]:
+            self._ram[a] = v & 0xff
+            self._ram[a + 1] = v >> 8
+            return
+        self._state._clock += self._b.WriteWord(a, v)
+
+    # points the fetch window at the memory around linear 'address', or at nothing if that can't be read directly
+    def SetFetchWindow(self, address: int):
+        window = self._b.GetFetchWindow(address)
+        if window == None:
+            self._fetch = None
+            self._fetch_start = 0
+            self._fetch_size = 0
         else:
-            self._state.SetFlagA((((r1 & 0x0f) + (r2 & 0x0f) + flag_c) & 0x10) > 0)
-
-        self._state.SetFlagP(result & 0xff)
+            self._fetch, self._fetch_start = window
+            self._fetch_size = len(self._fetch)
 
-    def GetRegister(self, reg: int, w: bool) -> int:
-        if w:
-            if reg == 0:
-                return self._state.GetAX()
-            if reg == 1:
-                return self._state.GetCX()
-            if reg == 2:
-                return self._state.GetDX()
-            if reg == 3:
-                return self._state.GetBX()
-            if reg == 4:
-                return self._state._sp
-            if reg == 5:
-                return self._state._bp
-            if reg == 6:
-                return self._state._si
-            if reg == 7:
-                return self._state._di
-        else:
-            if reg == 0:
-                return self._state.GetAL()
-            if reg == 1:
-                return self._state._cl
-            if reg == 2:
-                return self._state._dl
-            if reg == 3:
-                return self._state._bl
-            if reg == 4:
-                return self._state.GetAH()
-            if reg == 5:
-                return self._state._ch
-            if reg == 6:
-                return self._state._dh
-            if reg == 7:
-                return self._state._bh
-
-    def GetSRegister(self, reg: int) -> int:
-        reg &= 0b00000011
+    # instruction bytes come from the fetch window, which is only moved when CS:IP leaves it (a jump, or IP
+    # wrapping in the segment); outside of RAM and ROM they are read through the bus, with its wait states
+    def GetPcByte(self) -> int:
+        state = self._state
+        ip = state._ip
+        state._ip = (ip + 1) & 0xffff
 
-        if reg == 0b000:
-            return self._state._es
-        if reg == 0b001:
-            return self._state._cs
-        if reg == 0b010:
-            return self._state._ss
-        if reg == 0b011:
-            return self._state._ds
+        offset = ((state._cs_base + ip) & self._MemMask) - self._fetch_start
+        if offset < 0 or offset >= self._fetch_size:
+            self.SetFetchWindow((state._cs_base + ip) & self._MemMask)
+            offset = ((state._cs_base + ip) & self._MemMask) - self._fetch_start
+            if offset < 0 or offset >= self._fetch_size:
+                return self.ReadMemByte(state._cs_base, ip)
 
-    # value, cycles
-    def GetDoubleRegisterMod01_02(self, reg: int, word: bool) -> Tuple[int, int, bool, int]:
-        a = 0
-        cycles = 0
-        override_segment = False
-        new_segment = 0
+        return self._fetch[offset]
 
-        if reg == 6:
-            a = self._state._bp
-            cycles = 5
-            override_segment = True
-            new_segment = self._state._ss
+    def GetPcWord(self) -> int:
+        state = self._state
+        ip = state._ip
 
-        else:
-            a, cycles = self.GetDoubleRegisterMod00(reg)
+        offset = ((state._cs_base + ip) & self._MemMask) - self._fetch_start
+        if offset >= 0 and offset + 1 < self._fetch_size and ip != 0xffff:
+            state._ip = ip + 2
+            return self._fetch[offset] | (self._fetch[offset + 1] << 8)
 
-        disp = self.ToSigned16(self.GetPcWord()) if word else self.ToSigned8(self.GetPcByte())
+        return self.GetPcByte() | (self.GetPcByte() << 8)
 
-        return ((a + disp) & 0xffff, cycles, override_segment, new_segment)
+    # fetches and decodes the instruction at CS:IP, leaves IP after it
+    def Decode(self) -> Instruction:
+        i = i8088.Instruction()
+        instr_start = self._state._ip
 
-    # value, segment_a_valid, segment/, address of value, number of cycles
-    def GetRegisterMem(self, reg: int, mod: int, w: bool) -> Tuple[int, bool, int, int, int]:
-        if mod == 0:
-            (a, cycles) = self.GetDoubleRegisterMod00(reg)
+        prefixes = []
+        opcode = self.GetPcByte()
+        while opcode in (0x26, 0x2e, 0x36, 0x3e, 0xf2, 0xf3):
+            next_opcode = self.GetPcByte()
+            prefixes.append((opcode, next_opcode))
+            opcode = next_opcode
 
-            segment =  self._state._segment_override if self._state._segment_override_set else self._state._ds
+        i.opcode = opcode
+        i.prefixes = tuple(prefixes)
+        i.handler = self._ops[opcode]
+        i.inline = self._inline_cases[opcode << 3]
+
+        imm_size = self._imm_size[opcode]
+
+        if self._has_modrm[opcode]:
+            m = self.SetModRM(i, self.GetPcByte())
+
+            if m.disp_size == 1:
+                i.disp = self.ToSigned8(self.GetPcByte())
+            elif m.disp_size == 2:
+                i.disp = self.GetPcWord() if m.mod == 0 else self.ToSigned16(self.GetPcWord())
+
+            if opcode in (0xf6, 0xf7) and i.reg <= 1:  # TEST r/m,imm
+                imm_size = 2 if opcode == 0xf7 else 1
+
+        if imm_size == 1:
+            i.imm = self.GetPcByte()
+        elif imm_size == 2:
+            i.imm = self.GetPcWord()
+        elif imm_size == 4:
+            i.imm = self.GetPcWord()
+            i.imm2 = self.GetPcWord()
+
+        i.address_mode = self._modrm_table[i.modrm]
+        i.length = (self._state._ip - instr_start) & 0xffff
+
+        return i
+
+    # sets the ModRM byte of 'i' and what follows from it (the handler for the groups), returns its table entry
+    def SetModRM(self, i: Instruction, modrm: int) -> ModRM:
+        m = self._modrm_table[modrm]
+        i.modrm = modrm
+        i.handler = self.GetModRMHandler(i.opcode << 3 | m.reg)
+        i.inline = self._inline_cases[i.opcode << 3 | m.reg]
+        i.mod = m.mod
+        i.reg = m.reg
+        i.rm = m.rm
+        return m
+
+    def GetInstruction(self, address: int) -> Instruction:
+        i = self._icache.get(address)
+        # the same linear address can be reached through a CS:IP that wraps inside the instruction
+        if i != None and self._state._ip + i.length <= 0x10000:
+            self._state._ip = (self._state._ip + i.length) & 0xffff
+            return i
 
-            if self._state._segment_override_set == False and (reg == 2 or reg == 3):  # BP uses SS
-                segment = self._state._ss
+        instr_start = self._state._ip
+        i = self.Decode()
+
+        # instructions that wrap around in their segment are not cached
+        if instr_start + i.length > 0x10000:
+            return i
+
+        self.AddToInstructionCache(address, i)
+
+        return i
+
+    # caches 'i' (at linear 'address') if the bus allows it for all its bytes, returns if it did
+    def AddToInstructionCache(self, address: int, i: Instruction) -> bool:
+        pages = set()
+        for offset in range(i.length):
+            pages.add(((address + offset) & self._MemMask) >> bus.Bus.PAGE_SHIFT)
+
+        for page in pages:
+            if not self._b.CanCacheCode(page):
+                return False
+
+        self._icache[address] = i
+
+        for page in pages:
+            if page not in self._icache_pages:
+                self._icache_pages[page] = []
+                self._b.MarkCodePage(page)
+            self._icache_pages[page].append(address)
+
+        return True
+
+    # what the decoded instructions of ROM 'r' in a cache file are valid for: the contents of the ROM,
+    # where it is mapped and the decoder (this file)
+    def GetRomCacheKey(self, r: rom.Rom) -> str:
+        if i8088._decoder_hash == None:
+            i8088._decoder_hash = hashlib.sha256(open(__file__, 'rb').read()).hexdigest()
+        start, size = r.GetAddressList()[0]
+        return f'{r.GetHash()}-{start:05x}-{size:x}-{i8088._decoder_hash}'
+
+    # writes the instructions of ROM 'r' that were decoded so far to 'filename', see LoadRomCache
+    def SaveRomCache(self, r: rom.Rom, filename: str):
+        start, size = r.GetAddressList()[0]
+        instructions = []
+        for address, i in self._icache.items():
+            if address >= start and address + i.length <= start + size:
+                instructions.append([ address, i.opcode, i.prefixes, i.modrm, i.disp, i.imm, i.imm2, i.length ])
+
+        # a run that gets killed while writing leaves the previous file, not a truncated one
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'w') as fh:
+            json.dump({ 'key': self.GetRomCacheKey(r), 'instructions': instructions }, fh)
+        os.replace(temp_filename, filename)
+
+    # puts the instructions that SaveRomCache wrote for ROM 'r' in the instruction cache, so that its code
+    # doesn't have to be decoded again; returns how many, 0 if 'filename' is missing, unreadable or for
+    # another ROM, mapping or version of the decoder. RAM is not affected, code there is decoded as it runs
+    def LoadRomCache(self, r: rom.Rom, filename: str) -> int:
+        start, size = r.GetAddressList()[0]
+
+        try:
+            with open(filename, 'r') as fh:
+                cache = json.load(fh)
+            if cache['key'] != self.GetRomCacheKey(r):
+                return 0
+
+            instructions = []
+            for address, opcode, prefixes, modrm, disp, imm, imm2, length in cache['instructions']:
+                if address < start or address + length > start + size:
+                    continue
+
+                i = i8088.Instruction()
+                i.opcode = opcode
+                i.prefixes = tuple((prefix, next_opcode) for prefix, next_opcode in prefixes)
+                i.handler = self._ops[opcode]
+                i.inline = self._inline_cases[opcode << 3]
+                if self._has_modrm[opcode]:
+                    self.SetModRM(i, modrm)
+                i.disp = disp
+                i.imm = imm
+                i.imm2 = imm2
+                i.address_mode = self._modrm_table[i.modrm]
+                i.length = length
+                instructions.append((address, i))
+
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            return 0
+
+        count = 0
+        for address, i in instructions:
+            count += self.AddToInstructionCache(address, i)
+
+        return count
+
+    # invoked by the bus when a page holding decoded instructions is written to
+    def InvalidateCodePage(self, page: int):
+        for address in self._icache_pages.pop(page, ()):
+            self._icache.pop(address, None)
+
+        for block in self._block_pages.pop(page, ()):
+            block.valid = False
+            if self._blocks.get(block.address) is block:
+                del self._blocks[block.address]
+            if self._traces.get(block.address) is block:
+                del self._traces[block.address]
+
+        self._trace_recording = None
+
+    def ClearInstructionCache(self):
+        for block in list(self._blocks.values()) + list(self._traces.values()):
+            block.valid = False
+
+        self._icache = dict()
+        self._icache_pages = dict()
+        self._blocks = dict()
+        self._traces = dict()
+        self._block_pages = dict()
+        self._loop_counts = dict()
+        self._trace_recording = None
+        self._b.ClearCodePages()
+        self.SetFetchWindow(0)
+
+    # decodes the basic block at CS:IP (at linear 'address'), returns None if its code can't be cached
+    def TranslateBlock(self, address: int) -> Block:
+        ip = self._state._ip
+        clock = self._state._clock
 
-            v = self.ReadMemWord(segment, a) if w else self.ReadMemByte(segment, a)
+        instructions = []
+        length = 0
+        while len(instructions) < i8088.Block.MAX_INSTRUCTIONS and ip + length < 0x10000:
+            a = (address + length) & self._MemMask
+            self._state._ip = ip + length
+            i = self.GetInstruction(a)
 
-            cycles += 6
+            if self._icache.get(a) is not i:
+                break
 
-            return (v, True, segment, a, cycles)
+            if i.handler == None or (i.opcode == 0x00 and self._terminate_on_off_the_rails):
+                break
 
-        if mod == 1 or mod == 2:
-            word = mod == 2
+            # REP repeats by jumping back to its prefix, leave that to Tick()
+            if any(prefix in (0xf2, 0xf3) for prefix, next_opcode in i.prefixes):
+                break
 
-            (a, cycles, override_segment, new_segment) = self.GetDoubleRegisterMod01_02(reg, word)
+            instructions.append(i)
+            length += i.length
 
-            segment = self._state._segment_override if self._state._segment_override_set else self._state._ds
+            if self._block_end[i.opcode] or (i.opcode in (0xf6, 0xf7) and i.reg >= 6):
+                break
 
-            if self._state._segment_override_set == False and override_segment:
-                segment = new_segment
+        self._state._ip = ip
+        self._state._clock = clock
 
-            if self._state._segment_override_set == False and (reg == 2 or reg == 3):  # BP uses SS
-                segment = self._state._ss
+        if len(instructions) == 0:
+            first = self._icache.get(address)
+            if first == None:
+                return None
 
-            v = self.ReadMemWord(segment, a) if w else self.ReadMemByte(segment, a)
+            # remember that no block starts here
+            span = first.length
 
-            cycles += 6
+        else:
+            span = length
+
+        block = i8088.Block(address, tuple(instructions), length)
+        if len(instructions) > 0:
+            block.run = self.MakeBlockFunction(block)
+
+            last = instructions[-1]
+            if (last.opcode >= 0x60 and last.opcode <= 0x7f) or (last.opcode >= 0xe0 and last.opcode <= 0xe3) or last.opcode == 0xeb:
+                block.backward = last.imm >= 0x80
+                block.idle = length + self.ToSigned8(last.imm) == 0 and all(self.IsIdleSafe(i) for i in instructions)
+            elif last.opcode == 0xe9:
+                block.backward = last.imm >= 0x8000
+
+        self._blocks[address] = block
+
+        pages = set()
+        for offset in range(span):
+            pages.add(((address + offset) & self._MemMask) >> bus.Bus.PAGE_SHIFT)
+        self.AddToBlockPages(block, pages)
+
+        return block
+
+    def IsIdleSafe(self, i: Instruction) -> bool:
+        if self._idle_safe[i.opcode] == False:
+            return False
+        if i.opcode >= 0x80 and i.opcode <= 0x83:
+            return i.reg == 7 or i.mod == 3  # CMP, or a register operand
+        if i.opcode == 0x88 or i.opcode == 0x89:
+            return i.mod == 3
+        if i.opcode == 0xf6 or i.opcode == 0xf7:
+            return i.reg <= 1  # TEST
+        return True
+
+    def AddToBlockPages(self, block, pages: set):
+        for page in pages:
+            if page not in self._block_pages:
+                self._block_pages[page] = []
+            self._block_pages[page].append(block)
+
+    # returns a function that runs all instructions of 'block' and returns the cycles used
+    # it stops early when an interrupt becomes deliverable or when the block got invalidated
+    def MakeBlockFunction(self, block: Block):
+        state = self._state
+        io = self._io
+        pic = io.GetPIC()
+        instructions = self.FuseInstructions(block) if self._fuse else block.instructions
+
+        def run() -> int:
+            total = 0
+
+            for i in instructions:
+                if i.prefixes:
+                    cycles = self.ApplyPrefixes(i, state._ip)
+                    state._ip += i.length
+                    cycles += i.handler(i)
+                    state._segment_override_set = False
 
-            return (v, True, segment, a, cycles)
+                else:
+                    state._ip += i.length
+                    cycles = i.handler(i)
+
+                if cycles == 0:
+                    cycles = 1  # TODO workaround
+
+                state._clock += cycles
+                if state._clock >= io._next_event:
+                    io.RunEvents()
+                total += cycles
+
+                if block.valid == False:
+                    break
+
+                if state._flags & 0x200 and pic._pending != 255:
+                    break
+
+            return total
+
+        return run
+
+    # switches the block functions between running fused pairs as one and running each instruction
+    # by itself (to compare the two)
+    def UseFusedInstructions(self, enable: bool):
+        self._fuse = enable
+        self.ClearInstructionCache()
+
+    # returns the instructions of 'block' with the pairs that have a fused handler replaced by one instruction
+    # that runs both; the block loop only checks events, interrupts and invalidation once for such a pair
+    # Block.instructions itself is left as is for traces, the flat interpreter and IsIdleSafe
+    def FuseInstructions(self, block: Block) -> Tuple:
+        instructions = block.instructions
+        out = []
+        n = 0
+        while n < len(instructions):
+            first = instructions[n]
+            handler = self.GetFusedHandler(first, instructions[n + 1]) if n + 1 < len(instructions) else None
+            if handler == None:
+                out.append(first)
+                n += 1
+                continue
+
+            second = instructions[n + 1]
+            fused = i8088.Instruction()
+            fused.opcode = first.opcode
+            fused.length = first.length + second.length
+            fused.handler = handler
+            fused.parts = (first, second, block)
+            out.append(fused)
+            n += 2
+
+        return tuple(out)
+
+    # the handler that runs 'first' and 'second' as one, None if there is none for this pair
+    def GetFusedHandler(self, first: Instruction, second: Instruction):
+        if first.prefixes or second.prefixes:
+            return None
+
+        a = first.opcode
+        b = second.opcode
+
+        if b >= 0x60 and b <= 0x7f:
+            # CMP, TEST
+            if (a >= 0x38 and a <= 0x3d) or a in (0x84, 0x85, 0xa8, 0xa9) or (a >= 0x80 and a <= 0x83 and first.reg == 7):
+                return self.Fused_CMP_Jcc
+            # DEC reg, followed by JZ or JNZ
+            if a >= 0x48 and a <= 0x4f and (b & 15) in (4, 5):
+                return self.Fused_DEC_Jcc
+
+        if a == 0xac and b == 0xaa:
+            return self.Fused_LODSB_STOSB
+
+        # XOR reg,reg followed by a MOV between registers and/or memory, or MOV reg,imm
+        if a >= 0x30 and a <= 0x33 and first.mod == 3 and first.reg == first.rm and ((b >= 0x88 and b <= 0x8b) or (b >= 0xb0 and b <= 0xbf)):
+            return self.Fused_XOR_MOV
+
+        return None
+
+    # what the block loop does between the two instructions of fused 'i', for when a device event
+    # is due after the first (that took 'cycles'); returns the cycles of both, or of the first only
+    # if the block got invalidated or an interrupt is to be started before the second
+    def RunFusedSecond(self, i: Instruction, cycles: int) -> int:
+        state = self._state
+        second, block = i.parts[1:]
+
+        # the block loop adds all cycles to the clock afterwards
+        state._clock += cycles
+        self._io.RunEvents()
+        state._clock -= cycles
+
+        if block.valid == False or (state._flags & 0x200 and self._pic._pending != 255):
+            state._ip -= second.length
+            return cycles
 
-        if mod == 3:
-            v = self.GetRegister(reg, w)
+        return cycles + (second.handler(second) or 1)
 
-            return (v, False, 0, 0, 0)
+    # CMP or TEST followed by a Jcc: Z and C are taken from the lazy flags without resolving them
+    def Fused_CMP_Jcc(self, i: Instruction) -> int:
+        first, second = i.parts[:2]
+        state = self._state
 
-    def GetRegisterMem(self, reg: int, mod: int, w: bool):
-        if mod == 0:
-            a, cycles = self.GetDoubleRegisterMod00(reg)
+        cycles = first.handler(first)
+        if state._clock + cycles >= self._io._next_event:
+            return self.RunFusedSecond(i, cycles)
 
-            segment = self._state._segment_override if self._state._segment_override_set else self._state._ds
+        condition = second.opcode & 15
+        if condition == 4 or condition == 5:
+            taken = state.GetFlagZ() == (condition == 4)
+        elif condition == 2 or condition == 3:
+            taken = state.GetFlagC() == (condition == 2)
+        else:
+            taken = _jcc_taken[condition << 12 | (state.GetFlags() & JCC_FLAGS)]
 
-            if self._state._segment_override_set == False and (reg == 2 or reg == 3):  # BP uses SS
-                segment = self._state._ss
+        if taken:
+            state._ip = (state._ip + self.ToSigned8(second.imm)) & 0xffff
+            return cycles + 16
 
-            v = self.ReadMemWord(segment, a) if w else self.ReadMemByte(segment, a)
+        return cycles + 4
 
-            cycles += 6
+    # DEC reg16 followed by JZ or JNZ, these test the result itself instead of the Z flag
+    def Fused_DEC_Jcc(self, i: Instruction) -> int:
+        first, second = i.parts[:2]
+        state = self._state
+        regs = state._regs
 
-            return (v, True, segment, a, cycles)
+        reg = first.opcode & 7
+        v = (regs[reg] - 1) & 0xffff
+        regs[reg] = v
 
-        if mod == 1 or mod == 2:
-            word = mod == 2
+        # as Op_INC_DEC: O, S, Z, A and P, C is kept
+        if state._lazy:
+            state.ResolveFlags()
+        flags = (state._flags & ~0x08d4) | state8088.State8088.SZP16[v]
+        if v == 0x7fff:
+            flags |= 0x0800
+        if v & 15 == 15:
+            flags |= 0x0010
+        state._flags = flags
 
-            a, cycles, override_segment, new_segment = self.GetDoubleRegisterMod01_02(reg, word)
+        if state._clock + 3 >= self._io._next_event:
+            return self.RunFusedSecond(i, 3)
 
-            segment = self._state._segment_override if self._state._segment_override_set else self._state._ds
+        # JNZ (0x75) jumps when the result is not zero, JZ (0x74) when it is
+        if (v != 0) == (second.opcode & 1 == 1):
+            state._ip = (state._ip + self.ToSigned8(second.imm)) & 0xffff
+            return 19
 
-            if self._state._segment_override_set == False and override_segment:
-                segment = new_segment
+        return 7
 
-            if self._state._segment_override_set == False and (reg == 2 or reg == 3):  # BP uses SS
-                segment = self._state._ss
+    # LODSB followed by STOSB (without REP), copies a byte from DS:SI to ES:DI through AL
+    def Fused_LODSB_STOSB(self, i: Instruction) -> int:
+        state = self._state
+        regs = state._regs
+        step = -1 if state._flags & 0x400 else 1
 
-            v = self.ReadMemWord(segment, a) if w else self.ReadMemByte(segment, a)
+        v = self.ReadMemByte(state._ds_base, regs[6])
+        regs[0] = (regs[0] & 0xff00) | v
+        regs[6] = (regs[6] + step) & 0xffff
 
-            cycles += 6
+        if state._clock + 5 >= self._io._next_event:
+            return self.RunFusedSecond(i, 5)
 
-            return (v, True, segment, a, cycles)
+        self.WriteMemByte(state._es_base, regs[7], v)
+        regs[7] = (regs[7] + step) & 0xffff
 
-        if mod == 3:
-            v = self.GetRegister(reg, w)
+        return 16
 
-            return (v, False, 0, 0, 0)
+    # XOR reg,reg (which clears it) followed by a MOV
+    def Fused_XOR_MOV(self, i: Instruction) -> int:
+        first, second = i.parts[:2]
+        state = self._state
 
-        return (0, False, 0, 0, 0)
+        word = (first.opcode & 1) == 1
+        self.PutRegister(first.reg, word, 0)
+        state.SetLogicFuncFlags(word, 0)
 
-    def UpdateRegisterMem(self, reg: int, mod: int, a_valid: bool, seg: int, addr: int, word: bool, v: int) -> int:
-        if a_valid:
-            assert seg >= 0 and seg <= 65535
-            assert addr >= 0 and addr <= 65535
-            if word:
-                self.WriteMemWord(seg, addr, v)
-            else:
-                self.WriteMemByte(seg, addr, v & 0xff)
-            return 4
+        if state._clock + 3 >= self._io._next_event:
+            return self.RunFusedSecond(i, 3)
 
-        return self.PutRegisterMem(reg, mod, word, v)
+        return 3 + (second.handler(second) or 1)
 
-    def PutRegister(self, reg: int, w: bool, val: int):
-        if reg == 0:
-            if w:
-                self._state.SetAX(val)
-            else:
-                self._state.SetAL(val & 0xff)
-        elif reg == 1:
-            if w:
-                self._state.SetCX(val)
-            else:
-                self._state._cl = val & 0xff
-        elif reg == 2:
-            if w:
-                self._state.SetDX(val)
-            else:
-                self._state._dl = val & 0xff
-        elif reg == 3:
-            if w:
-                self._state.SetBX(val)
-            else:
-                self._state._bl = val & 0xff
-        elif reg == 4:
-            if w:
-                self._state._sp = val
-            else:
-                self._state.SetAH(val & 0xff)
-        elif reg == 5:
-            if w:
-                self._state._bp = val
-            else:
-                self._state._ch = val
-        elif reg == 6:
-            if w:
-                self._state._si = val
-            else:
-                self._state._dh = val
-        elif reg == 7:
-            if w:
-                self._state._di = val
-            else:
-                self._state._bh = val
+    def GetRegister(self, reg: int, w: bool) -> int:
+        if w:
+            return self._state._regs[reg]
+        return (self._state._regs[reg & 3] >> ((reg & 4) << 1)) & 0xff
 
-    def PutSRegister(self, reg: int, v: int):
+    def GetSRegister(self, reg: int) -> int:
         reg &= 0b00000011
 
         if reg == 0b000:
-            self._state._es = v
-        elif reg == 0b001:
-            self._state._cs = v
-        elif reg == 0b010:
-            self._state._ss = v
-        elif reg == 0b011:
-            self._state._ds = v
-
-    # returns cycle count
-    def PutRegisterMem(self, reg: int, mod: int, w: bool, val: int) -> int:
-        if mod == 0:
-            (a, cycles) = self.GetDoubleRegisterMod00(reg)
-
-            segment = self._state._segment_override if self._state._segment_override_set else self._state._ds
-
-            if self._state._segment_override_set == False and (reg == 2 or reg == 3):  # BP uses SS
-                segment = self._state._ss
-
-            if w:
-                self.WriteMemWord(segment, a, val)
-            else:
-                self.WriteMemByte(segment, a, val)
-
-            cycles += 4
+            return self._state._es
+        if reg == 0b001:
+            return self._state._cs
+        if reg == 0b010:
+            return self._state._ss
+        if reg == 0b011:
+            return self._state._ds
 
-            return cycles
+    # effective address functions of the ModRM table, mod 0 has a displacement of 0
+    def EA_BX_SI(self, i: Instruction) -> int:
+        return (self._state.GetBX() + self._state._regs[6] + i.disp) & 0xffff
 
-        if mod == 1 or mod == 2:
-            (a, cycles, override_segment, new_segment) = self.GetDoubleRegisterMod01_02(reg, mod == 2)
+    def EA_BX_DI(self, i: Instruction) -> int:
+        return (self._state.GetBX() + self._state._regs[7] + i.disp) & 0xffff
 
-            segment = self._state._segment_override if self._state._segment_override_set else self._state._ds
+    def EA_BP_SI(self, i: Instruction) -> int:
+        return (self._state._regs[5] + self._state._regs[6] + i.disp) & 0xffff
 
-            if self._state._segment_override_set == False and override_segment:
-                segment = new_segment
+    def EA_BP_DI(self, i: Instruction) -> int:
+        return (self._state._regs[5] + self._state._regs[7] + i.disp) & 0xffff
 
-            if self._state._segment_override_set == False and (reg == 2 or reg == 3):  # BP uses SS
-                segment = self._state._ss
+    def EA_SI(self, i: Instruction) -> int:
+        return (self._state._regs[6] + i.disp) & 0xffff
 
-            if w:
-                self.WriteMemWord(segment, a, val)
-            else:
-                self.WriteMemByte(segment, a, val)
+    def EA_DI(self, i: Instruction) -> int:
+        return (self._state._regs[7] + i.disp) & 0xffff
 
-            cycles += 4
+    def EA_BP(self, i: Instruction) -> int:
+        return (self._state._regs[5] + i.disp) & 0xffff
 
-            return cycles
+    def EA_BX(self, i: Instruction) -> int:
+        return (self._state.GetBX() + i.disp) & 0xffff
 
-        if mod == 3:
-            self.PutRegister(reg, w, val)
-            return 0  # TODO
+    def EA_direct(self, i: Instruction) -> int:
+        return i.disp
 
-    # value, cycles
-    def GetDoubleRegisterMod00(self, reg: int) -> Tuple[int, int]:
-        a = None
-        cycles = None
+    # puts the segment base and offset of the memory operand of 'i' in the operand slot
+    def SetOperandAddress(self, i: Instruction):
+        m = i.address_mode
+        state = self._state
+        if state._segment_override_set:
+            self._operand_base = state._segment_override_base
+        elif m.ss:
+            self._operand_base = state._ss_base
+        else:
+            self._operand_base = state._ds_base
+        self._operand_offset = m.ea(i)
 
-        if reg == 0:
-            a = self._state.GetBX() + self._state._si
-            cycles = 7
+    # for the far pointers of LES, LDS, CALL FAR and JMP FAR with a register operand (undefined on the 8088):
+    # these read the segment word from 0000:0002
+    def SetNullOperandAddress(self):
+        self._operand_base = 0
+        self._operand_offset = 0
 
-        elif reg == 1:
-            a = self._state.GetBX() + self._state._di
-            cycles = 8
+    # value of the register or memory operand of 'i', the cycles are in i.address_mode.read_cycles
+    # the address of a memory operand is kept in the operand slot, so that a read-modify-write can
+    # store its result with WriteOperand without computing it again (and without allocating a tuple)
+    def ReadOperand(self, i: Instruction, w: bool) -> int:
+        if i.address_mode.ea == None:
+            return self.GetRegister(i.address_mode.rm, w)
 
-        elif reg == 2:
-            a = self._state._bp + self._state._si
-            cycles = 8
+        self.SetOperandAddress(i)
 
-        elif reg == 3:
-            a = self._state._bp + self._state._di
-            cycles = 7
+        if w:
+            return self.ReadMemWord(self._operand_base, self._operand_offset)
+        return self.ReadMemByte(self._operand_base, self._operand_offset)
 
-        elif reg == 4:
-            a = self._state._si
-            cycles = 5
+    # stores 'v' in the operand of 'i' that ReadOperand read, returns the cycles
+    def WriteOperand(self, i: Instruction, w: bool, v: int) -> int:
+        if i.address_mode.ea == None:
+            self.PutRegister(i.address_mode.rm, w, v)
+            return 0
 
-        elif reg == 5:
-            a = self._state._di
-            cycles = 5
+        if w:
+            self.WriteMemWord(self._operand_base, self._operand_offset, v)
+        else:
+            self.WriteMemByte(self._operand_base, self._operand_offset, v & 0xff)
+        return 4
 
-        elif reg == 6:
-            a = self.GetPcWord()
-            cycles = 6
+    def PutRegister(self, reg: int, w: bool, val: int):
+        if w:
+            self._state._regs[reg] = val
+        else:
+            shift = (reg & 4) << 1
+            self._state._regs[reg & 3] = (self._state._regs[reg & 3] & (0xff00 >> shift)) | ((val & 0xff) << shift)
 
-        elif reg == 7:
-            a = self._state.GetBX()
-            cycles = 5
+    def PutSRegister(self, reg: int, v: int):
+        reg &= 0b00000011
 
-        a &= 0xffff
+        if reg == 0b000:
+            self._state.SetES(v)
+        elif reg == 0b001:
+            self._state.SetCS(v)
+        elif reg == 0b010:
+            self._state.SetSS(v)
+        elif reg == 0b011:
+            self._state.SetDS(v)
 
-        return (a, cycles)
+    # stores 'val' in the operand of 'i' without reading it first, returns the cycles
+    def PutRegisterMem(self, i: Instruction, w: bool, val: int) -> int:
+        if i.address_mode.ea == None:
+            self.PutRegister(i.address_mode.rm, w, val)
+            return 0  # TODO
 
-    def SetLogicFuncFlags(self, word: bool, result: int):
-        self._state.SetFlagO(False)
-        self._state.SetFlagS(((result & 0x8000) if word else (result & 0x80)) != 0)
-        self._state.SetFlagZ(result == 0 if word else (result & 0xff) == 0)
-        self._state.SetFlagP(result)
+        self.SetOperandAddress(i)
 
-        self._state.SetFlagA(False)  # undefined
+        if w:
+            self.WriteMemWord(self._operand_base, self._operand_offset, val)
+        else:
+            self.WriteMemByte(self._operand_base, self._operand_offset, val)
 
-        self._state.SetFlagC(False)
+        return i.address_mode.cycles + 4
 
     def push(self, v: int):
-        self._state._sp -= 2
-        self._state._sp &= 0xffff
-        self.WriteMemWord(self._state._ss, self._state._sp, v)
+        self._state._regs[4] -= 2
+        self._state._regs[4] &= 0xffff
+        self.WriteMemWord(self._state._ss_base, self._state._regs[4], v)
 
     def pop(self) -> int:
-        v = self.ReadMemWord(self._state._ss, self._state._sp)
-        self._state._sp += 2
-        self._state._sp &= 0xffff
+        v = self.ReadMemWord(self._state._ss_base, self._state._regs[4])
+        self._state._regs[4] += 2
+        self._state._regs[4] &= 0xffff
         return v
 
+    # the entry of hardware interrupts, INT, INTO, divide errors and single steps: pushes FLAGS, CS and
+    # the return address and continues at the vector of 'interrupt_nr'; when the stack and the vector
+    # are in plain RAM, these are written and read directly instead of per word through push/ReadMemWord
     def InvokeInterrupt(self, instr_start: int, interrupt_nr: int, pic: bool):
-        self._state._segment_override_set = False
+        state = self._state
+        state._segment_override_set = False
 
         if pic:
-            self._io.GetPIC().SetIRQBeingServiced(interrupt_nr)
-            interrupt_nr += self._io.GetPIC().GetInterruptOffset()
-
-        self.push(self._state._flags)
-        self.push(self._state._cs)
-        if self._state._rep:
-            self.push(self._state._rep_addr)
-            self._state._rep = False
+            self._pic.SetIRQBeingServiced(interrupt_nr)
+            interrupt_nr += self._pic.GetInterruptOffset()
 
+        flags = state.GetFlags()
+        if state._rep:
+            ip = state._rep_addr
+            state._rep = False
         else:
-            self.push(instr_start)
+            ip = instr_start
+
+        sp = state._regs[4]
+        a = state._ss_base + sp - 6
+        if sp >= 6 and a + 5 <= self._MemMask and self._ram_write_pages[a >> bus.Bus.PAGE_SHIFT] and self._ram_write_pages[(a + 5) >> bus.Bus.PAGE_SHIFT]:
+            # IP, CS and FLAGS, from low to high
+            self._ram[a:a + 6] = (ip | (state._cs << 16) | (flags << 32)).to_bytes(6, 'little')
+            state._regs[4] = sp - 6
+        else:
+            self.push(flags)
+            self.push(state._cs)
+            self.push(ip)
 
-        self._state.SetFlagI(False)
-        self._state.SetFlagT(False)
+        # I and T, these are never evaluated lazily
+        state._flags &= ~0x0300
 
         addr = interrupt_nr * 4
-
-        self._state._ip = self.ReadMemWord(0, addr)
-        self._state._cs = self.ReadMemWord(0, (addr + 2) & 0xffff)
+        if self._ram_pages[addr >> bus.Bus.PAGE_SHIFT]:
+            ram = self._ram
+            state._ip = ram[addr] | (ram[addr + 1] << 8)
+            state.SetCS(ram[addr + 2] | (ram[addr + 3] << 8))
+        else:
+            state._ip = self.ReadMemWord(0, addr)
+            state.SetCS(self.ReadMemWord(0, (addr + 2) & 0xffff))
 
     def IsProcessingRep(self) -> bool:
         return self._state._rep
@@ -670,6 +1192,187 @@ class i8088:
         if self._state._rep:
             self._state._ip = self._state._rep_addr
 
+    # sets up segment override and REP state for the prefixes of 'i', returns the cycles used
+    def ApplyPrefixes(self, i: Instruction, instr_start: int) -> int:
+        cycles = 0
+
+        for prefix, next_opcode in i.prefixes:
+            if prefix == 0x26:
+                self._state._segment_override_base = self._state._es_base
+            elif prefix == 0x2e:
+                self._state._segment_override_base = self._state._cs_base
+            elif prefix == 0x36:
+                self._state._segment_override_base = self._state._ss_base
+            elif prefix == 0x3e:
+                self._state._segment_override_base = self._state._ds_base
+            elif prefix in (0xf2, 0xf3):
+                self._state._rep = True
+                self._state._rep_mode = state8088.State8088.RepMode.NotSet
+                cycles += 9
+                self._state._rep_do_nothing = self._state.GetCX() == 0
+
+            self._state._rep_opcode = next_opcode  # TODO: only allow for certain instructions
+
+            if prefix == 0xf2:
+                self._state._rep_addr = instr_start
+                if next_opcode in (0xa6, 0xa7, 0xae, 0xaf):
+                    self._state._rep_mode = state8088.State8088.RepMode.REPNZ
+                else:
+                    self._state._rep_mode = state8088.State8088.RepMode.REP
+            elif prefix == 0xf3:
+                self._state._rep_addr = instr_start
+                if next_opcode in (0xa6, 0xa7, 0xae, 0xaf):
+                    self._state._rep_mode = state8088.State8088.RepMode.REPE_Z
+                else:
+                    self._state._rep_mode = state8088.State8088.RepMode.REP
+            else:
+                self._state._segment_override_set = True  # TODO: move up
+                cycles += 2
+
+        return cycles
+
+    # tests if the linear range first...last is all plain RAM (writable too when 'write' is set)
+    def IsRamRange(self, first: int, last: int, write: bool) -> bool:
+        if first < 0 or last > self._MemMask:
+            return False
+
+        pages = self._ram_write_pages if write else self._ram_pages
+        for page in range(first >> bus.Bus.PAGE_SHIFT, (last >> bus.Bus.PAGE_SHIFT) + 1):
+            if not pages[page]:
+                return False
+
+        return True
+
+    # runs as many elements of a REP string instruction as possible in one go, when all memory
+    # involved is plain RAM; device events and interrupts are still handled between elements
+    # returns the cycles used, 0 when the instruction has to run element by element
+    def RunRepBulk(self, i: Instruction, prefix_cycles: int) -> int:
+        state = self._state
+        regs = state._regs
+        opcode = i.opcode
+
+        if state._flags & 0x100 or len(self._breakpoints) > 0 or state._rep_mode == state8088.State8088.RepMode.NotSet:
+            return 0
+
+        size = 1 + (opcode & 1)
+        step = -size if state._flags & 0x400 else size
+        has_source = opcode not in (0xaa, 0xab, 0xae, 0xaf)  # MOVS, CMPS, LODS
+        has_destination = opcode not in (0xac, 0xad)  # MOVS, CMPS, STOS, SCAS
+        writes = opcode in (0xa4, 0xa5, 0xaa, 0xab)
+        compare = opcode in (0xa6, 0xa7, 0xae, 0xaf)
+
+        # stop before SI or DI wraps around in its segment
+        n = regs[1]
+        for offset, used in ((regs[6], has_source), (regs[7], has_destination)):
+            if used:
+                if step > 0:
+                    n = min(n, (0x10000 - offset) // size)
+                else:
+                    n = min(n, offset // size + 1 if offset + size <= 0x10000 else 0)
+        if n < 2:
+            return 0
+
+        source = (state._segment_override_base if state._segment_override_set else state._ds_base) + regs[6]
+        destination = state._es_base + regs[7]
+        length = n * size
+        source_first = source if step > 0 else source + size - length
+        destination_first = destination if step > 0 else destination + size - length
+
+        if has_source and not self.IsRamRange(source_first, source_first + length - 1, False):
+            return 0
+        if has_destination and not self.IsRamRange(destination_first, destination_first + length - 1, writes):
+            return 0
+        # overlapping copies would need to be done element by element
+        if writes and has_source and source_first != destination_first and source_first < destination_first + length and destination_first < source_first + length:
+            return 0
+
+        ram = self._ram
+        word = size == 2
+
+        # REPE stops after the first element that differs, REPNZ after the first that is equal
+        # (a REP prefix followed by a segment override leaves the mode at REP, which never stops)
+        stop_when_equal = state._rep_mode == state8088.State8088.RepMode.REPNZ
+        terminated = False
+        if compare and state._rep_mode != state8088.State8088.RepMode.REP:
+            a1 = source
+            a2 = destination
+            for element in range(n):
+                if opcode >= 0xae:
+                    v1 = regs[0] if word else regs[0] & 0xff
+                else:
+                    v1 = ram[a1] | (ram[a1 + 1] << 8) if word else ram[a1]
+                v2 = ram[a2] | (ram[a2 + 1] << 8) if word else ram[a2]
+                if (v1 == v2) == stop_when_equal:
+                    n = element + 1
+                    terminated = True
+                    break
+                a1 += step
+                a2 += step
+
+        # the elements up to the next device event are accounted for at once, only then can an interrupt become pending
+        cycles = prefix_cycles + self._rep_cycles[opcode]
+        io = self._io
+        pic = io.GetPIC()
+        done = 0
+        while True:
+            count = min(n - done, max(1, (io._next_event - state._clock + cycles - 1) // cycles))
+            state._clock += count * cycles
+            done += count
+            if state._clock >= io._next_event:
+                io.RunEvents()
+
+            if done == n:
+                break
+
+            if state._flags & 0x200 and pic._pending != 255:
+                n = done
+                terminated = False
+                break
+
+        total = n * cycles
+
+        length = n * size
+        source_first = source if step > 0 else source + size - length
+        destination_first = destination if step > 0 else destination + size - length
+        source_last = source + (n - 1) * step
+        destination_last = destination + (n - 1) * step
+
+        if opcode == 0xa4 or opcode == 0xa5:
+            ram[destination_first:destination_first + length] = ram[source_first:source_first + length]
+
+        elif opcode == 0xaa or opcode == 0xab:
+            ram[destination_first:destination_first + length] = bytes((regs[0] & 0xff, regs[0] >> 8)[0:size]) * n
+
+        elif opcode == 0xac:
+            state.SetAL(ram[source_last])
+
+        elif opcode == 0xad:
+            state.SetAX(ram[source_last] | (ram[source_last + 1] << 8))
+
+        else:
+            if opcode >= 0xae:
+                v1 = regs[0] if word else regs[0] & 0xff
+            else:
+                v1 = ram[source_last] | (ram[source_last + 1] << 8) if word else ram[source_last]
+            v2 = ram[destination_last] | (ram[destination_last + 1] << 8) if word else ram[destination_last]
+            state.SetAddSubFlags(word, v1, v2, v1 - v2, True, False)
+
+        regs[1] -= n
+        if has_source:
+            regs[6] = (regs[6] + step * n) & 0xffff
+        if has_destination:
+            regs[7] = (regs[7] + step * n) & 0xffff
+
+        state._rep_do_nothing = False
+
+        if regs[1] == 0 or terminated:
+            state._rep = False
+            state._segment_override_set = False
+        else:
+            state._ip = state._rep_addr
+
+        return total
+
     def ResetCrashCounter(self):
         self._state._crash_counter = 0
 
@@ -680,78 +1383,53 @@ class i8088:
 
         # check for interrupt
         if self._state.GetFlagI() == True and self._state._inhibit_interrupts == False:
-            irq = self._io.GetPIC().GetPendingInterrupt()
+            irq = self._pic._pending
             if irq != 255:
-                for device in self._devices:
-                    if device.GetIRQNumber() != irq:
-                        continue
+                self._state._in_hlt = False
+                self.InvokeInterrupt(self._state._ip, irq, True)
+                self._interrupt_started = True
+                cycle_count += 60
+                self._state._clock += cycle_count
 
-                    self._state._in_hlt = False
-                    self.InvokeInterrupt(self._state._ip, irq, True)
-                    cycle_count += 60
-                    self._state._clock += cycle_count
-
-                    return cycle_count
+                return cycle_count
 
         self._state._inhibit_interrupts = False
 
         # T-flag produces an interrupt after each instruction
         if self._state.GetInHlt():
             cycle_count += 2
+
+            # with interrupts enabled nothing happens until the next device event, skip to it
+            if self._state.GetFlagI():
+                if self._io._next_event == pc_io.IO.NO_EVENT:
+                    self._io.WaitForEvent(0.1)  # e.g. keyboard input
+
+                if self._io._next_event != pc_io.IO.NO_EVENT:
+                    cycle_count = max(cycle_count, self._io._next_event - self._state._clock)
+                    self._idle_cycles += cycle_count - 2
+
             self._state._clock += cycle_count  # time needs to progress for timers etc
-            self._io.Tick(cycle_count, self._state._clock)
+            if self._state._clock >= self._io._next_event:
+                self._io.RunEvents()
             return cycle_count
 
         instr_start = self._state._ip
-        address = (self._state._cs * 16 + self._state._ip) & self._MemMask
-        opcode = self.GetPcByte()
+        address = (self._state._cs_base + self._state._ip) & self._MemMask
+        i = self.GetInstruction(address)
+        opcode = i.opcode
 
         if self._ignore_breakpoints:
             self._ignore_breakpoints = False
 
         else:
             if instr_start in self._breakpoints:
-                self._stop_reason = f'Breakpoint reached at address {check_address:06x}'
+                self._state._ip = instr_start
+                self._stop_reason = f'Breakpoint reached at address {address:06x}'
                 return -1
 
         # handle prefixes
-        while opcode in (0x26, 0x2e, 0x36, 0x3e, 0xf2, 0xf3):
-            if opcode == 0x26:
-                self._state._segment_override = self._state._es
-            elif opcode == 0x2e:
-                self._state._segment_override = self._state._cs
-            elif opcode == 0x36:
-                self._state._segment_override = self._state._ss
-            elif opcode == 0x3e:
-                self._state._segment_override = self._state._ds
-            elif opcode in (0xf2, 0xf3):
-                self._state._rep = True
-                self._state._rep_mode = state8088.State8088.RepMode.NotSet
-                cycle_count += 9
-                self._state._rep_do_nothing = self._state.GetCX() == 0
-
-            address = (self._state._cs * 16 + self._state._ip) & self._MemMask
-            next_opcode = self.GetPcByte()
-
-            self._state._rep_opcode = next_opcode  # TODO: only allow for certain instructions
-
-            if opcode == 0xf2:
-                self._state._rep_addr = instr_start
-                if next_opcode in (0xa6, 0xa7, 0xae, 0xaf):
-                    self._state._rep_mode = state8088.State8088.RepMode.REPNZ
-                else:
-                    self._state._rep_mode = state8088.State8088.RepMode.REP
-            elif opcode == 0xf3:
-                self._state._rep_addr = instr_start
-                if next_opcode in (0xa6, 0xa7, 0xae, 0xaf):
-                    self._state._rep_mode = state8088.State8088.RepMode.REPE_Z
-                else:
-                    self._state._rep_mode = state8088.State8088.RepMode.REP
-            else:
-                self._state._segment_override_set = True  # TODO: move up
-                cycle_count += 2
-
-            opcode = next_opcode
+        if len(i.prefixes) > 0:
+            cycle_count += self.ApplyPrefixes(i, instr_start)
 
         if opcode == 0x00:
             if self._terminate_on_off_the_rails == True:
@@ -762,13 +1440,19 @@ class i8088:
         else:
             self._state._crash_counter = 0
 
+        # REP string instructions on plain RAM run in bulk
+        if self._state._rep and self._state._rep_do_nothing == False and self._rep_cycles[opcode]:
+            cycles = self.RunRepBulk(i, cycle_count)
+            if cycles > 0:
+                return cycles
+
         # main instruction handling
-        if self._ops[opcode] != None:
-            cycle_count += self._ops[opcode](opcode)
+        if i.handler != None:
+            cycle_count += i.handler(i)
         # special cases
         elif opcode == 0x9d:
             before = self._state.GetFlagT()
-            self._state._flags = self.pop()
+            self._state.SetFlags(self.pop())
             if self._state.GetFlagT() and before == False:
                 back_from_trace = True
             self._state.FixFlags()
@@ -780,8 +1464,8 @@ class i8088:
             before = self._state.GetFlagT()
 
             self._state._ip = self.pop()
-            self._state._cs = self.pop()
-            self._state._flags = self.pop()
+            self._state.SetCS(self.pop())
+            self._state.SetFlags(self.pop())
             self._state.FixFlags()
 
             if self._state.GetFlagT() and before == False:
@@ -799,18 +1483,446 @@ class i8088:
 
         self._state._clock += cycle_count
 
-        # tick I/O
-        self._io.Tick(cycle_count, self._state._clock)
+        # tick the devices that have an event due
+        if self._state._clock >= self._io._next_event:
+            self._io.RunEvents()
 
         if self._state.GetFlagT() and back_from_trace == False and self._state._inhibit_interrupts == False:
             self.InvokeInterrupt(self._state._ip, 1, False)
 
         return cycle_count
 
+    # runs a whole translated basic block, or a single instruction through Tick() when that's not
+    # possible (interrupts, trap flag, REP, HLT, breakpoints, uncachable code)
+    # Tick() remains the reference; both leave the emulated system in the same state
+    # with a 'budget' (the cycles left of a slice of the flat interpreter) it stays within it up to the last
+    # instruction: when less than a trace slice is left, it runs one instruction instead of a block or trace,
+    # and idle loops are skipped up to the budget only
+    def TickBlock(self, budget: int = None) -> int:
+        state = self._state
+
+        if state._in_hlt or state._inhibit_interrupts or state._rep or state._segment_override_set or state._flags & 0x100 or self._ignore_breakpoints or len(self._breakpoints) > 0:
+            self._trace_recording = None
+            return self.Tick()
+
+        if state._flags & 0x200 and self._pic._pending != 255:
+            self._trace_recording = None
+            return self.Tick()
+
+        if budget != None and budget < i8088.Trace.CYCLE_BUDGET:
+            self._trace_recording = None
+            return self.Tick()
+
+        address = (state._cs_base + state._ip) & self._MemMask
+
+        trace = self._traces.get(address)
+        if trace != None and trace.cs == state._cs:
+            self._trace_recording = None
+            state._crash_counter = 0
+            return trace.run()
+
+        block = self._blocks.get(address)
+        if block == None:
+            block = self.TranslateBlock(address)
+
+        if block == None or block.run == None or state._ip + block.length >= 0x10000:
+            self._trace_recording = None
+            return self.Tick()
+
+        state._crash_counter = 0
+
+        if block.idle:
+            before = (state.GetFlags(), *state._regs)
+
+            cycles = block.run()
+
+            # back at its start with nothing changed: it keeps doing this until an interrupt
+            # (and it is not worth compiling into a trace)
+            if (state._cs_base + state._ip) & self._MemMask == address and (state.GetFlags(), *state._regs) == before:
+                cycles += self.SkipIdleLoop(cycles, budget - cycles if budget != None else None)
+                self._loop_counts[address] = 0
+
+        else:
+            cycles = block.run()
+
+        if self._trace_recording != None:
+            self.RecordTrace(block)
+
+        elif block.backward:
+            self.CountBackwardJump(block)
+
+        return cycles
+
+    # counts taken backward jumps at the end of 'block', hot loops get compiled into a trace
+    def CountBackwardJump(self, block: Block):
+        state = self._state
+        target = (state._cs_base + state._ip) & self._MemMask
+        if target < block.address + block.length:
+            count = self._loop_counts.get(target, 0) + 1
+            self._loop_counts[target] = count
+            if count >= i8088.Trace.THRESHOLD:
+                self._trace_recording = i8088.Trace(target, state._cs, state._ip, [])
+
+    # runs blocks and instructions until at least 'cycle_budget' cycles have passed
+    # returns why it stopped and the cycles used: 'budget', 'interrupt' when a hardware interrupt
+    # was started, or 'stop' for breakpoints and the like (see GetStopReason())
+    # there is no reason for device events: the blocks run io.RunEvents() themselves as soon as the
+    # clock reaches io._next_event, so Run() keeps going and the caller never has to
+    def Run(self, cycle_budget: int) -> Tuple[str, int]:
+        if self._interpreter != None:
+            return self._interpreter(cycle_budget)
+
+        tick_block = self.TickBlock
+        total = 0
+        self._interrupt_started = False
+
+        while total < cycle_budget:
+            cycles = tick_block()
+            if cycles == -1:
+                return ('stop', total)
+
+            total += cycles
+
+            if self._interrupt_started:
+                return ('interrupt', total)
+
+        return ('budget', total)
+
+    # sha256 of the source of this file, see GetRomCacheKey
+    _decoder_hash: str = None
+
+    # instructions that the flat interpreter runs inline: opcodes, and opcode << 3 | reg for the groups
+    _inline = list(range(0x00, 0x04)) + list(range(0x08, 0x0c)) + list(range(0x28, 0x2c)) + list(range(0x30, 0x34)) + list(range(0x38, 0x3e)) + \
+              list(range(0x40, 0x60)) + list(range(0x70, 0x80)) + [ 0x88, 0x89, 0x8a, 0x8b, 0xac, 0xad ] + list(range(0xb0, 0xc0)) + \
+              [ 0xc3, 0xe2, 0xe8, 0xeb ] + [ 0x80 << 3 | reg for reg in range(8) ] + [ 0x83 << 3 | reg for reg in range(8) ]
+
+    # methods that get inlined into these instructions
+    _inline_calls = [ 'self.GetRegister', 'self.PutRegister', 'self.ReadOperand', 'self.WriteOperand', 'self.PutRegisterMem', 'self.SetOperandAddress',
+                      'self.ReadMemByte', 'self.ReadMemWord', 'self.WriteMemByte', 'self.WriteMemWord', 'self.push', 'self.pop' ] + \
+                    [ f'self._state.{name}' for name in ('GetAL', 'SetAL', 'GetAH', 'SetAH', 'GetAX', 'SetAX', 'GetBX', 'GetCX', 'SetCX', 'GetDX', 'SetDX',
+                                                         'GetFlagC', 'GetFlagD', 'GetFlags', 'SetAddSubFlags', 'SetLogicFuncFlags') ]
+
+    # variables of the flat interpreter that replace attributes in the inlined handlers
+    _inline_aliases = { 'self._state._regs': 'regs', 'self._state': 'state', 'self._ram': 'ram', 'self._ram_pages': 'ram_pages',
+                        'self._ram_write_pages': 'ram_write_pages', 'self._MemMask': 'mem_mask' }
+
+    # the flat interpreter, without the setup of its variables: Run() with TickBlock() and the block
+    # functions folded into one loop that stops after the instruction that uses up the budget; what
+    # TickBlock() does besides running a block (traces, idle loops, interrupts, prefixes that span
+    # instructions, ...) is left to TickBlock(), with the cycles left so that it keeps to the budget too
+    # (a trace may still run one loop iteration past it)
+    _interpreter_loop = [
+        'while total < cycle_budget:',
+        '    if state._in_hlt or state._inhibit_interrupts or state._rep or state._segment_override_set or state._flags & 0x100 or self._ignore_breakpoints or self._breakpoints or self._trace_recording != None or (state._flags & 0x200 and pic._pending != 255):',
+        '        c = tick_block(cycle_budget - total)',
+        '    else:',
+        '        address = (state._cs_base + state._ip) & mem_mask',
+        '        block = self._blocks.get(address)',
+        '        if block == None:',
+        '            block = self.TranslateBlock(address)',
+        '        if block == None or block.run == None or block.idle or address in self._traces or state._ip + block.length >= 0x10000:',
+        '            c = tick_block(cycle_budget - total)',
+        '        else:',
+        '            state._crash_counter = 0',
+        '            c = 0',
+        '            for i in block.instructions:',
+        '                if i.prefixes:',
+        '                    r = prefixes(i, state._ip)',
+        '                    state._ip += i.length',
+        '                    r += i.handler(i)',
+        '                    state._segment_override_set = False',
+        '                else:',
+        '                    state._ip += i.length',
+        '                    k = i.inline',
+        '                    if k == 0:',
+        '                        r = i.handler(i)',
+        '                    else:',
+        '@CASES@',
+        '                if r == 0:',
+        '                    r = 1',
+        '                state._clock += r',
+        '                if state._clock >= io._next_event:',
+        '                    events()',
+        '                c += r',
+        '                if block.valid == False or (state._flags & 0x200 and pic._pending != 255) or total + c >= cycle_budget:',
+        '                    break',
+        '            if block.backward and i is block.instructions[-1]:',
+        '                self.CountBackwardJump(block)',
+        '    if c == -1:',
+        "        return ('stop', total)",
+        '    total += c',
+        '    if self._interrupt_started:',
+        "        return ('interrupt', total)",
+        "return ('budget', total)" ]
+
+    # generates the source of the flat interpreter, see UseFlatInterpreter
+    def GenerateInterpreter(self) -> Tuple[str, List[int]]:
+        calls = dict()
+        for path in i8088._inline_calls:
+            names = path.split('.')
+            receiver = self
+            for name in names[1:-1]:
+                receiver = getattr(receiver, name)
+            calls[path] = getattr(type(receiver), names[-1])
+
+        cases = []
+        for key in i8088._inline:
+            opcode = key >> 3 if key >= 0x100 else key
+            fields = { 'opcode': opcode, 'reg': key & 7 } if key >= 0x100 else { 'opcode': opcode }
+            source = _specializer.Inline(self._ops[opcode], fields, 'r', 'h_', i8088._inline_aliases, calls)
+            if source != None:
+                cases.append((key, source.split('\n')))
+
+        # binary search over the case numbers
+        def tree(first: int, last: int) -> List[str]:
+            if first == last:
+                key = cases[first - 1][0]
+                return [ f'# {key >> 3:02x}/{key & 7}' if key >= 0x100 else f'# {key:02x}' ] + cases[first - 1][1]
+            middle = (first + last) // 2
+            return [ f'if k <= {middle}:' ] + [ '    ' + line for line in tree(first, middle) ] + [ 'else:' ] + [ '    ' + line for line in tree(middle + 1, last) ]
+
+        lines = [ 'def interpreter(cycle_budget):',
+                  '    self = cpu',
+                  '    state = self._state',
+                  '    regs = state._regs',
+                  '    io = self._io',
+                  '    pic = self._pic',
+                  '    events = io.RunEvents',
+                  '    tick_block = self.TickBlock',
+                  '    prefixes = self.ApplyPrefixes',
+                  '    mem_mask = self._MemMask',
+                  '    ram = self._ram',
+                  '    ram_pages = self._ram_pages',
+                  '    ram_write_pages = self._ram_write_pages',
+                  '    total = 0',
+                  '    self._interrupt_started = False' ]
+        for line in i8088._interpreter_loop:
+            if line == '@CASES@':
+                lines += [ ' ' * 28 + line for line in tree(1, len(cases)) ]
+            else:
+                lines.append('    ' + line)
+
+        return '\n'.join(lines) + '\n', [ key for key, source in cases ]
+
+    # switches Run() to a single generated function that runs blocks, with the most frequent instructions
+    # inlined, instead of calling TickBlock() for each; both run the same instructions, but this one ends a
+    # slice after the instruction that uses up the budget (Run() can go over it by a block, trace or idle loop)
+    def UseFlatInterpreter(self, enable: bool):
+        if enable:
+            if i8088._interpreter_code == None:
+                source, keys = self.GenerateInterpreter()
+                i8088._interpreter_code = (compile(source, '<flat interpreter>', 'exec'), keys)
+
+            code, keys = i8088._interpreter_code
+            namespace = dict(globals())
+            namespace['cpu'] = self
+            exec(code, namespace)
+            self._interpreter = namespace['interpreter']
+
+            for case, key in enumerate(keys):
+                # a key below 0x100 is an opcode, for each value of the reg field
+                for slot in ([ key ] if key >= 0x100 else range(key << 3, (key << 3) + 8)):
+                    self._inline_cases[slot] = case + 1
+
+        else:
+            self._interpreter = None
+            self._inline_cases = [ 0 ] * 2048
+
+        self.ClearInstructionCache()
+
+    # compiled source of the flat interpreter and the instructions of its cases, see _inline
+    _interpreter_code = None
+
+    # fast-forwards a loop that got confirmed idle to the next device event, returns the cycles skipped
+    # (a whole number of iterations of 'iteration_cycles' each)
+    # skips whole iterations up to the next event, or up to 'limit' cycles when that is not None
+    def SkipIdleLoop(self, iteration_cycles: int, limit: int = None) -> int:
+        state = self._state
+        io = self._io
+
+        if state._flags & 0x200 and self._pic._pending != 255:
+            return 0
+
+        if io._next_event == pc_io.IO.NO_EVENT:
+            io.WaitForEvent(0.1)  # e.g. keyboard input
+            if io._next_event == pc_io.IO.NO_EVENT:
+                return 0
+
+        skipped = max(0, (io._next_event - state._clock + iteration_cycles - 1) // iteration_cycles) * iteration_cycles
+        if limit != None:
+            skipped = min(skipped, max(0, limit // iteration_cycles) * iteration_cycles)
+        state._clock += skipped
+        self._idle_cycles += skipped
+
+        if state._clock >= io._next_event:
+            io.RunEvents()
+
+        return skipped
+
+    # cycles that were skipped instead of emulated because the guest was idle
+    def GetIdleCycles(self) -> int:
+        return self._idle_cycles
+
+    # adds a just executed block to the trace being recorded, compiles it once the loop is closed
+    def RecordTrace(self, block: Block):
+        state = self._state
+        trace = self._trace_recording
+
+        if block.valid == False or (len(trace.blocks) == 0 and block.address != trace.address):
+            self._trace_recording = None
+            return
+
+        trace.blocks.append(block)
+
+        # too long, or it doesn't stay in blocks (segment register loads and STI inhibit interrupts)
+        if len(trace.blocks) > i8088.Trace.MAX_BLOCKS or block.instructions[-1].opcode in (0x07, 0x0f, 0x17, 0x1f, 0x8e, 0xf4, 0xfb):
+            self._trace_recording = None
+            self._loop_counts[trace.address] = -4 * i8088.Trace.THRESHOLD
+            return
+
+        address = (state._cs_base + state._ip) & self._MemMask
+        if address == trace.address and state._cs == trace.cs:
+            self._trace_recording = None
+            self._loop_counts[trace.address] = 0
+            self.CompileTrace(trace)
+
+    # the check that ends every instruction of a trace: clock, device events, invalidation and interrupts
+    _trace_epilogue = [
+        'state._clock += c',
+        'if state._clock >= io._next_event:',
+        '    events()',
+        'total += c',
+        'if trace.valid == False:',
+        '    return total',
+        'if state._flags & 0x200 and pic._pending != 255:',
+        '    return total' ]
+
+    # returns Python source that reads a 16 bit register
+    def TraceGetRegister(self, reg: int) -> str:
+        return f'state._regs[{reg}]'
+
+    # returns Python source that stores 'v' in a 16 bit register
+    def TracePutRegister(self, reg: int, v: str) -> List[str]:
+        return [ f'state._regs[{reg}] = {v}' ]
+
+    # returns the Python source for instruction 'i' at 'ip', it leaves the cycles used in 'c'
+    # frequent simple instructions are generated inline, the others call their handler
+    def TraceInstruction(self, i: Instruction, n: int, ip: int) -> List[str]:
+        opcode = i.opcode
+        next_ip = (ip + i.length) & 0xffff
+
+        if len(i.prefixes) == 0:
+            if (opcode >= 0x60 and opcode <= 0x7f) or opcode == 0xeb or (opcode >= 0xe0 and opcode <= 0xe2):
+                taken = (next_ip + self.ToSigned8(i.imm)) & 0xffff
+
+                if opcode == 0xeb:
+                    return [ f'state._ip = 0x{taken:04x}', 'c = 15' ]
+
+                if opcode >= 0xe0:
+                    # LOOPNZ, LOOPZ, LOOP
+                    condition = i8088._loop_conditions[opcode - 0xe0]
+                    return [ f'cx = {self.TraceGetRegister(1)} - 1 & 0xffff' ] + self.TracePutRegister(1, 'cx') + [
+                             f'if cx and jcc[0x{condition:x} | state.GetFlags() & 0x{JCC_FLAGS:x}]:',
+                             f'    state._ip = 0x{taken:04x}',
+                              '    c = 8',
+                              'else:',
+                             f'    state._ip = 0x{next_ip:04x}',
+                              '    c = 4' ]
+
+                return [ f'if jcc[0x{(opcode & 15) << 12:x} | state.GetFlags() & 0x{JCC_FLAGS:x}]:',
+                         f'    state._ip = 0x{taken:04x}',
+                          '    c = 16',
+                          'else:',
+                         f'    state._ip = 0x{next_ip:04x}',
+                          '    c = 4' ]
+
+            if opcode >= 0x40 and opcode <= 0x4f:
+                # INC/DEC reg16
+                reg = opcode & 7
+                if opcode >= 0x48:
+                    flag_checks = [ 'v = v - 1', 'if v == 0x7fff:', '    f |= 0x800', 'if v & 15 == 15:', '    f |= 0x10' ]
+                else:
+                    flag_checks = [ 'v = v + 1', 'if v == 0x8000:', '    f |= 0x800', 'if v & 15 == 0:', '    f |= 0x10' ]
+
+                return [ f'state._ip = 0x{next_ip:04x}', f'v = {self.TraceGetRegister(reg)}', 'f = state.GetFlags() & ~0x8d4' ] + flag_checks + [
+                         'v &= 0xffff',
+                         'state._flags = f | szp16[v]' ] + self.TracePutRegister(reg, 'v') + [ 'c = 3' ]
+
+            if opcode >= 0xb0 and opcode <= 0xbf:
+                # MOV reg,imm
+                reg = opcode & 7
+                if opcode >= 0xb8:
+                    put = self.TracePutRegister(reg, f'0x{i.imm:04x}')
+                else:
+                    shift = (reg & 4) << 1
+                    put = [ f'state._regs[{reg & 3}] = state._regs[{reg & 3}] & 0x{0xff00 >> shift:04x} | 0x{(i.imm & 0xff) << shift:04x}' ]
+                return [ f'state._ip = 0x{next_ip:04x}' ] + put + [ 'c = 2' ]
+
+            if opcode == 0x90:
+                return [ f'state._ip = 0x{next_ip:04x}', 'c = 4' ]
+
+            if opcode in (0xf8, 0xf9, 0xfc, 0xfd):
+                # CLC, STC, CLD, STD
+                bit = 1 if opcode <= 0xf9 else 0x400
+                update = f'state._flags = state.GetFlags() & ~0x{bit:x}' if (opcode & 1) == 0 else f'state._flags = state.GetFlags() | 0x{bit:x}'
+                return [ f'state._ip = 0x{next_ip:04x}', update, 'c = 2' ]
+
+            return [ f'state._ip = 0x{next_ip:04x}', f'c = h{n}(i{n}) or 1' ]
+
+        return [ f'c = prefixes(i{n}, 0x{ip:04x})',
+                 f'state._ip = 0x{next_ip:04x}',
+                 f'c += h{n}(i{n})',
+                  'state._segment_override_set = False',
+                  'if c == 0:',
+                  '    c = 1' ]
+
+    # generates, compiles and installs the function that runs the loop recorded in 'trace'
+    def CompileTrace(self, trace: Trace):
+        namespace = { 'state': self._state, 'io': self._io, 'events': self._io.RunEvents, 'pic': self._pic,
+                      'trace': trace, 'prefixes': self.ApplyPrefixes,
+                      'szp16': state8088.State8088.SZP16, 'jcc': _jcc_taken }
+
+        lines = [ 'def run():', '    total = 0', '    while True:' ]
+
+        ip = trace.ip
+        n = 0
+        pages = set()
+        for nr, block in enumerate(trace.blocks):
+            for i in block.instructions:
+                namespace[f'h{n}'] = i.handler
+                namespace[f'i{n}'] = i
+
+                lines.append(f'        # {trace.cs:04x}:{ip:04x} opcode {i.opcode:02x}')
+                for line in self.TraceInstruction(i, n, ip) + i8088._trace_epilogue:
+                    lines.append('        ' + line)
+
+                ip = (ip + i.length) & 0xffff
+                n += 1
+
+            for offset in range(block.length):
+                pages.add(((block.address + offset) & self._MemMask) >> bus.Bus.PAGE_SHIFT)
+
+            # leave the trace when the branch at the end of the block went elsewhere than recorded
+            next_block = trace.blocks[nr + 1] if nr + 1 < len(trace.blocks) else trace.blocks[0]
+            ip = (trace.ip + next_block.address - trace.address) & 0xffff
+            lines.append(f'        if state._ip != 0x{ip:04x} or state._cs != 0x{trace.cs:04x}:')
+            lines.append('            return total')
+
+        lines.append(f'        if total >= {i8088.Trace.CYCLE_BUDGET}:')
+        lines.append('            return total')
+
+        trace.source = '\n'.join(lines) + '\n'
+        exec(compile(trace.source, f'<trace {trace.cs:04x}:{trace.ip:04x}>', 'exec'), namespace)
+        trace.run = namespace['run']
+
+        self._traces[trace.address] = trace
+        self.AddToBlockPages(trace, pages)
+
     def Reset(self):
         self._state.Reset()
-        self._state._cs = 0xf000
+        self._state.SetCS(0xf000)
         self._state._ip = 0xfff0
+        self.ClearInstructionCache()
 
     def GetStopReason(self) -> str:
         rc = self._stop_reason
@@ -833,32 +1945,32 @@ class i8088:
     def SetIgnoreBreakpoints(self):
         self._ignore_breakpoints = True
 
-    def Op_NOP(self, opcode: int) -> int:  # 0x90
+    def Op_NOP(self, i: Instruction) -> int:  # 0x90
         return 4
 
-    def Op_ADD_AL_xx(self, opcode: int) -> int:  # 0x04, 0x14
+    def Op_ADD_AL_xx(self, i: Instruction) -> int:  # 0x04, 0x14
         # ADD AL,xx
-        v = self.GetPcByte()
+        v = i.imm
 
         flag_c = self._state.GetFlagC()
         use_flag_c = False
 
         result = self._state.GetAL() + v
 
-        if opcode == 0x14:
+        if i.opcode == 0x14:
             if flag_c:
                 result += 1
             use_flag_c = True
 
-        self.SetAddSubFlags(False, self._state.GetAL(), v, result, False, flag_c if use_flag_c else False)
+        self._state.SetAddSubFlags(False, self._state.GetAL(), v, result, False, flag_c if use_flag_c else False)
 
         self._state.SetAL(result & 255)
 
         return 3
 
-    def Op_ADD_AX_xxxx(self, opcode: int) -> int:  # 0x05, 0x15
+    def Op_ADD_AX_xxxx(self, i: Instruction) -> int:  # 0x05, 0x15
         # ADD AX,xxxx
-        v = self.GetPcWord()
+        v = i.imm
 
         flag_c = self._state.GetFlagC()
         use_flag_c = False
@@ -866,43 +1978,31 @@ class i8088:
 
         result = before + v
 
-        if opcode == 0x15:
+        if i.opcode == 0x15:
             if flag_c:
                 result += 1
             use_flag_c = True
 
-        self.SetAddSubFlags(True, before, v, result, False, flag_c if use_flag_c else False)
+        self._state.SetAddSubFlags(True, before, v, result, False, flag_c if use_flag_c else False)
         self._state.SetAX(result & 0xffff)
 
         return 3
 
-    def Op_MOV_reg_ib(self, opcode: int) -> int:  # 0xb.
+    def Op_MOV_reg_ib(self, i: Instruction) -> int:  # 0xb.
         # MOV reg,ib
-        reg = opcode & 0x07
-        word = (opcode & 0x08) == 0x08
+        reg = i.opcode & 0x07
+        word = (i.opcode & 0x08) == 0x08
 
-        v = self.GetPcByte()
-        if word:
-            v |= self.GetPcByte() << 8
-
-        self.PutRegister(reg, word, v)
+        self.PutRegister(reg, word, i.imm)
 
         return 2
 
-    def Op_CMP_OR_XOR_etc(self, opcode: int) -> int:  # 0x80-0x83
+    def Op_CMP_OR_XOR_etc(self, i: Instruction) -> int:  # 0x80-0x83
         # CMP and others
-        o1 = self.GetPcByte()
-
-        mod = o1 >> 6
-        reg = o1 & 7
-
-        function = (o1 >> 3) & 7
+        opcode = i.opcode
+        function = i.reg
 
         r1 = 0
-        a_valid = False
-        seg = 0
-        addr = 0
-
         r2 = 0
 
         word = False
@@ -914,22 +2014,26 @@ class i8088:
         cycles = 0
 
         if opcode == 0x80:
-            (r1, a_valid, seg, addr, cycles) = self.GetRegisterMem(reg, mod, False)
-            r2 = self.GetPcByte()
+            r1 = self.ReadOperand(i, False)
+            cycles = i.address_mode.read_cycles
+            r2 = i.imm
 
         elif opcode == 0x81:
-            (r1, a_valid, seg, addr, cycles) = self.GetRegisterMem(reg, mod, True)
-            r2 = self.GetPcWord()
+            r1 = self.ReadOperand(i, True)
+            cycles = i.address_mode.read_cycles
+            r2 = i.imm
             word = True
 
         elif opcode == 0x82:
-            (r1, a_valid, seg, addr, cycles) = self.GetRegisterMem(reg, mod, False)
-            r2 = self.GetPcByte()
+            r1 = self.ReadOperand(i, False)
+            cycles = i.address_mode.read_cycles
+            r2 = i.imm
 
         elif opcode == 0x83:
-            (r1, a_valid, seg, addr, cycles) = self.GetRegisterMem(reg, mod, True)
+            r1 = self.ReadOperand(i, True)
+            cycles = i.address_mode.read_cycles
 
-            r2 = self.GetPcByte()
+            r2 = i.imm
             if (r2 & 128) == 128:
                 r2 |= 0xff00
 
@@ -975,28 +2079,29 @@ class i8088:
         mask = 0xffff if word else 0xff
 
         if is_logic:
-            self.SetLogicFuncFlags(word, result & mask)
+            self._state.SetLogicFuncFlags(word, result & mask)
         else:
-            self.SetAddSubFlags(word, r1, r2, result, is_sub, self._state.GetFlagC() if use_flag_c else False)
+            self._state.SetAddSubFlags(word, r1, r2, result, is_sub, self._state.GetFlagC() if use_flag_c else False)
 
         if apply:
-            put_cycles = self.UpdateRegisterMem(reg, mod, a_valid, seg, addr, word, result & mask)
+            put_cycles = self.WriteOperand(i, word, result & mask)
             cycles += put_cycles
 
         return 3 + cycles
 
-    def Op_ADD_SUB_ADC_SBC(self, opcode: int) -> int:
+    def Op_ADD_SUB_ADC_SBC(self, i: Instruction) -> int:
         cycle_count = 0
 
+        opcode = i.opcode
         word = (opcode & 1) == 1
         direction = (opcode & 2) == 2
-        o1 = self.GetPcByte()
 
-        mod = o1 >> 6
-        reg1 = (o1 >> 3) & 7
-        reg2 = o1 & 7
+        mod = i.mod
+        reg1 = i.reg
+        reg2 = i.rm
 
-        (r1, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg2, mod, word)
+        r1 = self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
         r2 = self.GetRegister(reg1, word)
 
         cycle_count += get_cycles
@@ -1033,9 +2138,9 @@ class i8088:
 
         new_flag_c = self._state.GetFlagC() if use_flag_c else False
         if direction:
-            self.SetAddSubFlags(word, r2, r1, result, is_sub, new_flag_c)
+            self._state.SetAddSubFlags(word, r2, r1, result, is_sub, new_flag_c)
         else:
-            self.SetAddSubFlags(word, r1, r2, result, is_sub, new_flag_c)
+            self._state.SetAddSubFlags(word, r1, r2, result, is_sub, new_flag_c)
 
         # 0x38...0x3b are CMP
         if apply:
@@ -1043,59 +2148,51 @@ class i8088:
             if direction:
                 self.PutRegister(reg1, word, result)
             else:
-                override_to_ss = a_valid and word and self._state._segment_override_set == False and ((reg2 == 2 or reg2 == 3) and mod == 0)
+                override_to_ss = i.address_mode.ea != None and word and self._state._segment_override_set == False and ((reg2 == 2 or reg2 == 3) and mod == 0)
                 if override_to_ss:
-                    seg = self._state._ss
+                    self._operand_base = self._state._ss_base
 
-                put_cycles = self.UpdateRegisterMem(reg2, mod, a_valid, seg, addr, word, result)
+                put_cycles = self.WriteOperand(i, word, result)
                 cycle_count += put_cycles
 
         return cycle_count
 
-    def Op_TEST(self, opcode: int) -> int:  # 0x84, 0x85
+    def Op_TEST(self, i: Instruction) -> int:  # 0x84, 0x85
         # TEST ...,...
-        word = (opcode & 1) == 1
-        o1 = self.GetPcByte()
+        word = (i.opcode & 1) == 1
 
-        mod = o1 >> 6
-        reg1 = (o1 >> 3) & 7
-        reg2 = o1 & 7
-
-        (r1, a_valid, seg, addr, cycles) = self.GetRegisterMem(reg2, mod, word)
-        r2 = self.GetRegister(reg1, word)
+        r1 = self.ReadOperand(i, word)
+        cycles = i.address_mode.read_cycles
+        r2 = self.GetRegister(i.reg, word)
 
         if word:
             result = r1 & r2
-            self.SetLogicFuncFlags(True, result)
+            self._state.SetLogicFuncFlags(True, result)
         else:
             result = (r1 & r2) & 0xff
-            self.SetLogicFuncFlags(False, result)
+            self._state.SetLogicFuncFlags(False, result)
 
         self._state.SetFlagC(False)
 
         return 3 + cycles
 
-    def Op_XCHG(self, opcode: int) -> int:
+    def Op_XCHG(self, i: Instruction) -> int:
         # XCHG
-        word = (opcode & 1) == 1
-        o1 = self.GetPcByte()
-
-        mod = o1 >> 6
-        reg1 = (o1 >> 3) & 7
-        reg2 = o1 & 7
+        word = (i.opcode & 1) == 1
 
-        (r1, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg2, mod, word)
-        r2 = self.GetRegister(reg1, word)
+        r1 = self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
+        r2 = self.GetRegister(i.reg, word)
 
-        put_cycles = self.UpdateRegisterMem(reg2, mod, a_valid, seg, addr, word, r2)
+        put_cycles = self.WriteOperand(i, word, r2)
 
-        self.PutRegister(reg1, word, r1)
+        self.PutRegister(i.reg, word, r1)
 
         return 3 + get_cycles + put_cycles
 
-    def Op_XCHG_AX(self, opcode: int) -> int:  # 91...97
+    def Op_XCHG_AX(self, i: Instruction) -> int:  # 91...97
         # XCHG AX,...
-        reg_nr = opcode & 0x07
+        reg_nr = i.opcode & 0x07
         v = self.GetRegister(reg_nr, True)
 
         old_ax = self._state.GetAX()
@@ -1105,17 +2202,17 @@ class i8088:
 
         return 3
 
-    def Op_fe_ff(self, opcode: int) -> int:
+    def Op_fe_ff(self, i: Instruction) -> int:
         cycle_count = 0
 
         # DEC and others
-        word = (opcode & 1) == 1
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        reg = o1 & 7
-        function = (o1 >> 3) & 7
+        word = (i.opcode & 1) == 1
+        mod = i.mod
+        reg = i.rm
+        function = i.reg
 
-        (v, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg, mod, word)
+        v = self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
         cycle_count += get_cycles
 
         if function == 0:
@@ -1159,7 +2256,9 @@ class i8088:
             self.push(self._state._ip)
 
             self._state._ip = v
-            self._state._cs = self.ReadMemWord(seg, (addr + 2) & 0xffff)
+            if i.address_mode.ea == None:
+                self.SetNullOperandAddress()
+            self._state.SetCS(self.ReadMemWord(self._operand_base, (self._operand_offset + 2) & 0xffff))
 
             cycle_count += 37
 
@@ -1170,15 +2269,17 @@ class i8088:
 
         elif function == 5:
             # JMP
-            self._state._cs = self.ReadMemWord(seg, (addr + 2) & 0xffff)
-            self._state._ip = self.ReadMemWord(seg, addr)
+            if i.address_mode.ea == None:
+                self.SetNullOperandAddress()
+            self._state.SetCS(self.ReadMemWord(self._operand_base, (self._operand_offset + 2) & 0xffff))
+            self._state._ip = self.ReadMemWord(self._operand_base, self._operand_offset)
             cycle_count += 15
 
         elif function == 6 or function == 7:
             # PUSH rmw
             if reg == 4 and mod == 3 and word == True:  # PUSH SP
                 v -= 2
-                self.WriteMemWord(self._state._ss, v, v)
+                self.WriteMemWord(self._state._ss_base, v, v)
 
             else:
                 self.push(v)
@@ -1190,100 +2291,44 @@ class i8088:
         if mod == 3 and reg == 4 and word:
             put_cycles = 0
         else:
-            put_cycles = self.UpdateRegisterMem(reg, mod, a_valid, seg, addr, word, v)
+            put_cycles = self.WriteOperand(i, word, v)
 
         return cycle_count + put_cycles
 
-    def Op_LOOP(self, opcode: int) -> int:  # e0/e1/e2
-        # LOOP
-        cycle_count = 0
-
-        to = self.GetPcByte()
-
-        cx = self._state.GetCX()
-        cx -= 1
-        cx &= 0xffff
-        self._state.SetCX(cx)
+    # _jcc_taken conditions of LOOPNZ, LOOPZ and LOOP (0xe0-0xe2), already shifted
+    _loop_conditions = [ 5 << 12, 4 << 12, JCC_ALWAYS << 12 ]
 
-        newAddresses = (self._state._ip + self.ToSigned8(to)) & 0xffff
+    def Op_LOOP(self, i: Instruction) -> int:  # e0/e1/e2
+        # LOOPNZ, LOOPZ, LOOP: the conditions of JNZ and JZ, or always
+        cx = (self._state._regs[1] - 1) & 0xffff
+        self._state._regs[1] = cx
 
-        cycle_count += 4
+        if cx and _jcc_taken[i8088._loop_conditions[i.opcode & 3] | (self._state.GetFlags() & JCC_FLAGS)]:
+            self._state._ip = (self._state._ip + self.ToSigned8(i.imm)) & 0xffff
+            return 8
 
-        if opcode == 0xe2:
-            if cx > 0:
-                self._state._ip = newAddresses
-                cycle_count += 4
-
-        elif opcode == 0xe1:
-            if cx > 0 and self._state.GetFlagZ() == True:
-                self._state._ip = newAddresses
-                cycle_count += 4
-
-        elif opcode == 0xe0:
-            if cx > 0 and self._state.GetFlagZ() == False:
-                self._state._ip = newAddresses
-                cycle_count += 4
-
-        return cycle_count
+        return 4
 
-    def Op_Jxx(self, opcode: int) -> int:
+    def Op_Jxx(self, i: Instruction) -> int:
         # J..., 0x70/0x60
-        to = self.GetPcByte()
-
-        state = False
-        if opcode == 0x70 or opcode == 0x60:
-            state = self._state.GetFlagO()
-        elif opcode == 0x71 or opcode == 0x61:
-            state = self._state.GetFlagO() == False
-        elif opcode == 0x72 or opcode == 0x62:
-            state = self._state.GetFlagC()
-        elif opcode == 0x73 or opcode == 0x63:
-            state = self._state.GetFlagC() == False
-        elif opcode == 0x74 or opcode == 0x64:
-            state = self._state.GetFlagZ()
-        elif opcode == 0x75 or opcode == 0x65:
-            state = self._state.GetFlagZ() == False
-        elif opcode == 0x76 or opcode == 0x66:
-            state = self._state.GetFlagC() or self._state.GetFlagZ()
-        elif opcode == 0x77 or opcode == 0x67:
-            state = self._state.GetFlagC() == False and self._state.GetFlagZ() == False
-        elif opcode == 0x78 or opcode == 0x68:
-            state = self._state.GetFlagS()
-        elif opcode == 0x79 or opcode == 0x69:
-            state = self._state.GetFlagS() == False
-        elif opcode == 0x7a or opcode == 0x6a:
-            state = self._state.GetFlagP()
-        elif opcode == 0x7b or opcode == 0x6b:
-            state = self._state.GetFlagP() == False
-        elif opcode == 0x7c or opcode == 0x6c:
-            state = self._state.GetFlagS() != self._state.GetFlagO()
-        elif opcode == 0x7d or opcode == 0x6d:
-            state = self._state.GetFlagS() == self._state.GetFlagO()
-        elif opcode == 0x7e or opcode == 0x6e:
-            state = self._state.GetFlagZ() == True or self._state.GetFlagS() != self._state.GetFlagO()
-        elif opcode == 0x7f or opcode == 0x6f:
-            state = self._state.GetFlagZ() == False and self._state.GetFlagS() == self._state.GetFlagO()
-
-        if state:
-            self._state._ip = (self._state._ip + self.ToSigned8(to)) & 0xffff
+        if _jcc_taken[(i.opcode & 15) << 12 | (self._state.GetFlags() & JCC_FLAGS)]:
+            self._state._ip = (self._state._ip + self.ToSigned8(i.imm)) & 0xffff
             return 16
 
         return 4
 
-    def Op_shift(self, opcode: int) -> int:
+    def Op_shift(self, i: Instruction) -> int:
         cycle_count = 0
+        opcode = i.opcode
         word = (opcode & 1) == 1
-        o1 = self.GetPcByte()
-
-        mod = o1 >> 6
-        reg1 = o1 & 7
 
-        (v1, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg1, mod, word)
+        v1 = self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
         cycle_count += get_cycles
 
         count = 1
         if (opcode & 2) == 2:
-            count = self._state._cl
+            count = self._state._regs[1] & 0xff
 
         count_1_of = opcode in (0xd0, 0xd1, 0xd2, 0xd3)
 
@@ -1291,14 +2336,14 @@ class i8088:
 
         set_flags = False
 
-        mode = (o1 >> 3) & 7
+        mode = i.reg
 
         check_bit = 32768 if word else 128
         check_bit2 = 16384 if word else 64
 
         if mode == 0:
             # ROL
-            for i in range(count):
+            for _ in range(count):
                 b7 = (v1 & check_bit) == check_bit
 
                 self._state.SetFlagC(b7)
@@ -1314,7 +2359,7 @@ class i8088:
 
         elif mode == 1:
             # ROR
-            for i in range(count):
+            for _ in range(count):
                 b0 = (v1 & 1) == 1
 
                 self._state.SetFlagC(b0)
@@ -1330,7 +2375,7 @@ class i8088:
 
         elif mode == 2:
             # RCL
-            for i in range(count):
+            for _ in range(count):
                 new_carry = (v1 & check_bit) == check_bit
                 v1 <<= 1
 
@@ -1348,7 +2393,7 @@ class i8088:
 
         elif mode == 3:
             # RCR
-            for i in range(count):
+            for _ in range(count):
                 new_carry = (v1 & 1) == 1
                 v1 >>= 1
 
@@ -1367,7 +2412,7 @@ class i8088:
             prev_v1 = v1
 
             # SAL/SHL
-            for i in range(count):
+            for _ in range(count):
                 new_a_carry = (v1 & 0x08) == 0x08
                 new_carry = (v1 & check_bit) == check_bit
                 v1 <<= 1
@@ -1384,7 +2429,7 @@ class i8088:
             org_v1 = v1
 
             # SHR
-            for i in range(count):
+            for _ in range(count):
                 new_carry = (v1 & 1) == 1
                 v1 >>= 1
                 self._state.SetFlagC(new_carry)
@@ -1403,7 +2448,7 @@ class i8088:
         elif mode == 6:
             if opcode >= 0xd2:
                 # SETMOC
-                if self._state._cl != 0:
+                if self._state._regs[1] & 0xff != 0:
                     self._state.SetFlagC(False)
                     self._state.SetFlagA(False)
                     self._state.SetFlagZ(False)
@@ -1431,7 +2476,7 @@ class i8088:
             # SAR
             mask = check_bit if (v1 & check_bit) != 0 else 0
 
-            for i in range(count):
+            for _ in range(count):
                 new_carry = (v1 & 0x01) == 0x01
                 v1 >>= 1
                 v1 |= mask
@@ -1448,71 +2493,58 @@ class i8088:
         v1 &= 0xffff if word else 0xff
 
         if set_flags:
-            self._state.SetFlagS((v1 & 0x8000 if word else v1 & 0x80) != 0)
-            self._state.SetFlagZ(v1 == 0)
-            self._state.SetFlagP(v1)
+            self._state.SetSZPFlags(word, v1)
 
-        put_cycles = self.UpdateRegisterMem(reg1, mod, a_valid, seg, addr, word, v1)
+        put_cycles = self.WriteOperand(i, word, v1)
         return cycle_count + put_cycles
 
-    def Op_FPU(self, opcode: int) -> int:
+    def Op_FPU(self, i: Instruction) -> int:
         # FPU
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        reg1 = o1 & 7
-        (v1, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg1, mod, False)
+        v1 = self.ReadOperand(i, False)
+        get_cycles = i.address_mode.read_cycles
         return get_cycles + 2
 
-    def Op_FWAIT(self, opcode: int) -> int:  # 0x9b
+    def Op_FWAIT(self, i: Instruction) -> int:  # 0x9b
         # FWAIT
         return 2  # TODO
 
-    def Op_REFT(self, opcode: int) -> int:
+    def Op_REFT(self, i: Instruction) -> int:
         # RETF n / RETF
-        nToRelease = self.GetPcWord() if (opcode == 0xca or opcode == 0xc8) else 0
+        opcode = i.opcode
+        nToRelease = i.imm if (opcode == 0xca or opcode == 0xc8) else 0
 
         self._state._ip = self.pop()
-        self._state._cs = self.pop()
+        self._state.SetCS(self.pop())
 
         if opcode == 0xca or opcode == 0xc8:
-            self._state._sp += nToRelease
-            self._state._sp &= 0xffff
+            self._state._regs[4] += nToRelease
+            self._state._regs[4] &= 0xffff
             return 33 if opcode == 0xca else 24
 
         return 34 if opcode == 0xcb else 20
 
-    def Op_MOV(self, opcode: int) -> int:
+    def Op_MOV(self, i: Instruction) -> int:
         # MOV
-        word = (opcode & 1) == 1
-
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        mreg = o1 & 7
+        word = (i.opcode & 1) == 1
 
         cycle_count = 2  # base (correct?)
 
-        # get address to write to ('seg, addr')
-        (dummy, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(mreg, mod, word)
+        # get address to write to (in the operand slot)
+        self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
         cycle_count += get_cycles
 
-        if word:
-            # the value follows
-            v = self.GetPcWord()
-            put_cycles = self.UpdateRegisterMem(mreg, mod, a_valid, seg, addr, word, v)
-            cycle_count += put_cycles
-        else:
-            # the value follows
-            v = self.GetPcByte()
-            put_cycles = self.UpdateRegisterMem(mreg, mod, a_valid, seg, addr, word, v)
-            cycle_count += put_cycles
+        # the value follows
+        put_cycles = self.WriteOperand(i, word, i.imm)
+        cycle_count += put_cycles
 
         return cycle_count
 
-    def Op_INC_DEC(self, opcode: int) ->int:
+    def Op_INC_DEC(self, i: Instruction) -> int:
         # INC/DECw
-        reg = (opcode - 0x40) & 7
+        reg = (i.opcode - 0x40) & 7
         v = self.GetRegister(reg, True)
-        isDec = opcode >= 0x48
+        isDec = i.opcode >= 0x48
 
         if isDec:
             v -= 1
@@ -1525,23 +2557,19 @@ class i8088:
 
         v &= 0xffff
 
-        self._state.SetFlagS((v & 0x8000) == 0x8000)
-        self._state.SetFlagZ(v == 0)
-        self._state.SetFlagP(v)
+        self._state.SetSZPFlags(True, v)
 
         self.PutRegister(reg, True, v)
 
         return 3
 
-    def Op_MOV2(self, opcode: int) -> int:
+    def Op_MOV2(self, i: Instruction) -> int:
         cycle_count = 0
+        opcode = i.opcode
         dir = (opcode & 2) == 2 # direction
         word = (opcode & 1) == 1 # b/w
 
-        o1 = self.GetPcByte()
-        mode = o1 >> 6
-        reg = (o1 >> 3) & 7
-        rm = o1 & 7
+        reg = i.reg
 
         sreg = opcode == 0x8e or opcode == 0x8c
         if sreg:
@@ -1559,7 +2587,8 @@ class i8088:
 
         if dir:
             # to 'rm' from 'REG'
-            (v, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(rm, mode, word)
+            v = self.ReadOperand(i, word)
+            get_cycles = i.address_mode.read_cycles
             cycle_count += get_cycles
 
             if sreg:
@@ -1574,52 +2603,49 @@ class i8088:
             else:
                 v = self.GetRegister(reg, word)
 
-            put_cycles = self.PutRegisterMem(rm, mode, word, v)
+            put_cycles = self.PutRegisterMem(i, word, v)
             cycle_count += put_cycles
 
         return cycle_count
 
-    def Op_TEST_others(self, opcode: int) -> int:
+    def Op_TEST_others(self, i: Instruction) -> int:
         # TEST and others
         cycle_count = 0
-        word = (opcode & 1) == 1
-
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        reg1 = o1 & 7
+        word = (i.opcode & 1) == 1
 
-        (r1, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg1, mod, word)
+        r1 = self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
         cycle_count += get_cycles
 
-        function = (o1 >> 3) & 7
+        function = i.reg
         if function == 0 or function == 1:
             # TEST
             if word:
-                r2 = self.GetPcWord()
+                r2 = i.imm
 
                 result = r1 & r2
-                self.SetLogicFuncFlags(True, result)
+                self._state.SetLogicFuncFlags(True, result)
 
                 self._state.SetFlagC(False)
             else:
-                r2 = self.GetPcByte()
+                r2 = i.imm
                 result = r1 & r2
-                self.SetLogicFuncFlags(word, result)
+                self._state.SetLogicFuncFlags(word, result)
 
                 self._state.SetFlagC(False)
 
         elif function == 2:
             # NOT
-            put_cycles = self.UpdateRegisterMem(reg1, mod, a_valid, seg, addr, word, ~r1 & (0xffff if word else 0xff))
+            put_cycles = self.WriteOperand(i, word, ~r1 & (0xffff if word else 0xff))
             cycle_count += put_cycles
         elif function == 3:
             # NEG
             result = -r1 & (0xffff if word else 0xff)
 
-            self.SetAddSubFlags(word, 0, r1, -r1, True, False)
+            self._state.SetAddSubFlags(word, 0, r1, -r1, True, False)
             self._state.SetFlagC(r1 != 0)
 
-            put_cycles = self.UpdateRegisterMem(reg1, mod, a_valid, seg, addr, word, result)
+            put_cycles = self.WriteOperand(i, word, result)
             cycle_count += put_cycles
 
         elif function == 4:
@@ -1776,8 +2802,9 @@ class i8088:
 
         return cycle_count + 4
 
-    def Op_INT(self, opcode: int) -> int:
+    def Op_INT(self, i: Instruction) -> int:
         # INT 0x..
+        opcode = i.opcode
         if opcode != 0xce or self._state.GetFlagO():
             int = 0
 
@@ -1786,28 +2813,17 @@ class i8088:
             elif opcode == 0xce:
                 int = 4
             else:
-                int = self.GetPcByte()
-
-            addr = (int * 4) & 0xffff
-
-            self.push(self._state._flags)
-            self.push(self._state._cs)
-            if self._state._rep:
-                self.push(self._state._rep_addr)
-            else:
-                self.push(self._state._ip)
-
-            self._state.SetFlagI(False)
+                int = i.imm
 
-            self._state._ip = self.ReadMemWord(0, addr)
-            self._state._cs = self.ReadMemWord(0, addr + 2)
+            self.InvokeInterrupt(self._state._ip, int, False)
 
             return 51  # 71  TODO
 
         return 0  # TODO
 
-    def Op_CMP(self, opcode: int) -> int:
+    def Op_CMP(self, i: Instruction) -> int:
         # CMP
+        opcode = i.opcode
         word = (opcode & 1) == 1
 
         result = 0
@@ -1819,30 +2835,29 @@ class i8088:
 
         if opcode == 0x3d:
             r1 = self._state.GetAX()
-            r2 = self.GetPcWord()
+            r2 = i.imm
 
             result = r1 - r2
 
         elif opcode == 0x3c:
             r1 = self._state.GetAL()
-            r2 = self.GetPcByte()
+            r2 = i.imm
 
             result = r1 - r2
 
-        self.SetAddSubFlags(word, r1, r2, result, True, False)
+        self._state.SetAddSubFlags(word, r1, r2, result, True, False)
 
         return cycle_count
 
-    def Op_logic_functions(self, opcode: int) -> int:
+    def Op_logic_functions(self, i: Instruction) -> int:
+        opcode = i.opcode
         word = (opcode & 1) == 1
         direction = (opcode & 2) == 2
-        o1 = self.GetPcByte()
 
-        mod = o1 >> 6
-        reg1 = (o1 >> 3) & 7
-        reg2 = o1 & 7
+        reg1 = i.reg
 
-        (r1, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(reg2, mod, word)
+        r1 = self.ReadOperand(i, word)
+        get_cycles = i.address_mode.read_cycles
         r2 = self.GetRegister(reg1, word)
 
         cycle_count = get_cycles + 3
@@ -1857,143 +2872,134 @@ class i8088:
         elif function == 3:
             result = r2 ^ r1
 
-        self.SetLogicFuncFlags(word, result)
+        self._state.SetLogicFuncFlags(word, result)
 
         if direction:
             self.PutRegister(reg1, word, result)
         else:
-            put_cycles = self.UpdateRegisterMem(reg2, mod, a_valid, seg, addr, word, result)
+            put_cycles = self.WriteOperand(i, word, result)
             cycle_count += put_cycles
 
         return cycle_count
 
-    def Op_OR_AND_XOR(self, opcode: int) -> int:
-        word = (opcode & 1) == 1
+    def Op_OR_AND_XOR(self, i: Instruction) -> int:
+        word = (i.opcode & 1) == 1
 
-        bLow = self.GetPcByte()
-        bHigh = self.GetPcByte() if word else 0
+        regs = self._state._regs
 
-        function = opcode >> 4
+        function = i.opcode >> 4
         if function == 0:
-            self._state._al |= bLow
-
-            if word:
-                self._state._ah |= bHigh
+            regs[0] |= i.imm
 
         elif function == 2:
-            self._state._al &= bLow
-
-            if word:
-                self._state._ah &= bHigh
+            regs[0] &= i.imm if word else i.imm | 0xff00
 
             self._state.SetFlagC(False)
 
         elif function == 3:
-            self._state._al ^= bLow
-
-            if word:
-                self._state._ah ^= bHigh
+            regs[0] ^= i.imm
 
-        self.SetLogicFuncFlags(word, self._state.GetAX() if word else self._state.GetAL())
+        self._state.SetLogicFuncFlags(word, self._state.GetAX() if word else self._state.GetAL())
 
         self._state.SetFlagP(self._state.GetAL())
 
         return 4
 
-    def Op_RET2(self, opcode: int) -> int:
-        nToRelease = self.GetPcWord()
+    def Op_RET2(self, i: Instruction) -> int:
+        nToRelease = i.imm
 
         # RET
         self._state._ip = self.pop()
-        self._state._sp += nToRelease
-        self._state._sp &= 0xffff
+        self._state._regs[4] += nToRelease
+        self._state._regs[4] &= 0xffff
 
         return 16
 
-    def Op_RET3(self, opcode: int) -> int:
+    def Op_RET3(self, i: Instruction) -> int:
         # RET
         self._state._ip = self.pop()
 
         return 16
 
-    def Op_LES_LDS(self, opcode: int) -> int:  # c4/c5
+    def Op_LES_LDS(self, i: Instruction) -> int:  # c4/c5
         # LES (c4) / LDS (c5)
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        reg = (o1 >> 3) & 7
-        rm = o1 & 7
+        reg = i.reg
 
-        (val, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(rm, mod, True)
+        val = self.ReadOperand(i, True)
+        get_cycles = i.address_mode.read_cycles
 
-        if opcode == 0xc4:
-            self._state._es = self.ReadMemWord(seg, (addr + 2) & 0xffff)
+        if i.address_mode.ea == None:
+            self.SetNullOperandAddress()
+
+        if i.opcode == 0xc4:
+            self._state.SetES(self.ReadMemWord(self._operand_base, (self._operand_offset + 2) & 0xffff))
         else:
-            self._state._ds = self.ReadMemWord(seg, (addr + 2) & 0xffff)
+            self._state.SetDS(self.ReadMemWord(self._operand_base, (self._operand_offset + 2) & 0xffff))
 
         self.PutRegister(reg, True, val)
 
         return 24 + get_cycles
 
-    def Op_IN_AL_DX(self, opcode: int) -> int:  # 0xec
+    def Op_IN_AL_DX(self, i: Instruction) -> int:  # 0xec
         # IN AL,DX
         val = self._io.In(self._state.GetDX(), False)
         self._state.SetAL(val & 0xff)
 
         return 12
 
-    def Op_IN_AX_DX(self, opcode: int) -> int:  # 0xed
+    def Op_IN_AX_DX(self, i: Instruction) -> int:  # 0xed
         # IN AX,DX
         val = self._io.In(self._state.GetDX(), True)
         self._state.SetAX(val)
         return 12
 
-    def Op_OUT_DX_AL(self, opcode: int) -> int:  # 0xee
+    def Op_OUT_DX_AL(self, i: Instruction) -> int:  # 0xee
         # OUT
         self._io.Out(self._state.GetDX(), self._state.GetAL(), False)
         return 12
 
-    def Op_OUT_DX_AX(self, opcode: int) -> int:  # 0xef
+    def Op_OUT_DX_AX(self, i: Instruction) -> int:  # 0xef
         # OUT
         self._io.Out(self._state.GetDX(), self._state.GetAX(), True)
         return 12
 
-    def Op_TEST_AL(self, opcode: int) -> int:  # 0xa8
+    def Op_TEST_AL(self, i: Instruction) -> int:  # 0xa8
         # TEST AL,..
-        v = self.GetPcByte()
+        v = i.imm
         result = self._state.GetAL() & v
-        self.SetLogicFuncFlags(False, result)
+        self._state.SetLogicFuncFlags(False, result)
         self._state.SetFlagC(False)
         return 5
 
-    def Op_TEST_AX(self, opcode: int) -> int:  # 0xa9
+    def Op_TEST_AX(self, i: Instruction) -> int:  # 0xa9
         # TEST AX,..
-        v = self.GetPcWord()
+        v = i.imm
         result = self._state.GetAX() & v
-        self.SetLogicFuncFlags(True, result)
+        self._state.SetLogicFuncFlags(True, result)
         self._state.SetFlagC(False)
         return 5
 
-    def Op_STOSB(self, opcode: int) -> int:  # 0xaa
+    def Op_STOSB(self, i: Instruction) -> int:  # 0xaa
         if self.PrefixMustRun():
             # STOSB
-            self.WriteMemByte(self._state._es, self._state._di, self._state.GetAL())
-            self._state._di += -1 if self._state.GetFlagD() else 1
-            self._state._di &= 0xffff
+            self.WriteMemByte(self._state._es_base, self._state._regs[7], self._state.GetAL())
+            self._state._regs[7] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[7] &= 0xffff
             return 11
         return 0  # TODO
 
-    def Op_STOSW(self, opcode: int) -> int:  # 0xab
+    def Op_STOSW(self, i: Instruction) -> int:  # 0xab
         if self.PrefixMustRun():
             # STOSW
-            self.WriteMemWord(self._state._es, self._state._di, self._state.GetAX())
-            self._state._di += -2 if self._state.GetFlagD() else 2
-            self._state._di &= 0xffff
+            self.WriteMemWord(self._state._es_base, self._state._regs[7], self._state.GetAX())
+            self._state._regs[7] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[7] &= 0xffff
             return 11
         return 0  # TODO
 
-    def Op_JCXZ(self, opcode: int) -> int:  # 0xe3
+    def Op_JCXZ(self, i: Instruction) -> int:  # 0xe3
         # JCXZ np
-        offset = self.ToSigned8(self.GetPcByte())
+        offset = self.ToSigned8(i.imm)
 
         addr = self._state._ip + offset
 
@@ -2003,324 +3009,320 @@ class i8088:
 
         return 6
 
-    def Op_IN_AL_ib(self, opcode: int) -> int:  # 0xe4
+    def Op_IN_AL_ib(self, i: Instruction) -> int:  # 0xe4
         # IN AL,ib
-        from_ = self.GetPcByte()
+        from_ = i.imm
 
         val = self._io.In(from_, False)
         self._state.SetAL(val & 0xff)
 
         return 14
 
-    def Op_IN_AX_ib(self, opcode: int) -> int:  #  0xe5
+    def Op_IN_AX_ib(self, i: Instruction) -> int:  #  0xe5
         # IN AX,ib
-        from_ = self.GetPcByte()
+        from_ = i.imm
 
         val = self._io.In(from_, True)
         self._state.SetAX(val)
 
         return 14
 
-    def Op_OUT_AL(self, opcode: int) -> int:  # 0xe6
+    def Op_OUT_AL(self, i: Instruction) -> int:  # 0xe6
         # OUT
-        to = self.GetPcByte()
+        to = i.imm
         self._io.Out(to, self._state.GetAL(), False)
         return 10  # max 14
 
-    def Op_OUT_AX(self, opcode: int) -> int:  # 0xe7
+    def Op_OUT_AX(self, i: Instruction) -> int:  # 0xe7
         # OUT
-        to = self.GetPcByte()
+        to = i.imm
         self._io.Out(to, self._state.GetAX(), True)
         return 10  # max 14
 
-    def Op_XLATB(self, opcode: int) -> int:  # 0xd7
+    def Op_XLATB(self, i: Instruction) -> int:  # 0xd7
         # XLATB
         old_al = self._state.GetAL()
-        self._state.SetAL(self.ReadMemByte(self._state._segment_override if self._state._segment_override_set else  self._state._ds, (self._state.GetBX() + self._state.GetAL()) & 0xffff))
+        self._state.SetAL(self.ReadMemByte(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, (self._state.GetBX() + self._state.GetAL()) & 0xffff))
         return 11
 
-    def Op_MOVSB(self, opcode: int) -> int:  # 0xa4
+    def Op_MOVSB(self, i: Instruction) -> int:  # 0xa4
         if self.PrefixMustRun():
             # MOVSB
-            segment = self._state._segment_override if self._state._segment_override_set else self._state._ds
-            v = self.ReadMemByte(segment, self._state._si)
-            self.WriteMemByte(self._state._es, self._state._di, v)
+            segment = self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base
+            v = self.ReadMemByte(segment, self._state._regs[6])
+            self.WriteMemByte(self._state._es_base, self._state._regs[7], v)
 
-            self._state._si += -1 if self._state.GetFlagD() else 1
-            self._state._si &= 0xffff
-            self._state._di += -1 if self._state.GetFlagD() else 1
-            self._state._di &= 0xffff
+            self._state._regs[6] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[6] &= 0xffff
+            self._state._regs[7] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[7] &= 0xffff
 
             return 18
 
         return 0  # TODO
 
-    def Op_MOVSW(self, opcode: int) -> int:  # 0xa5
+    def Op_MOVSW(self, i: Instruction) -> int:  # 0xa5
         if self.PrefixMustRun():
             # MOVSW
-            self.WriteMemWord(self._state._es, self._state._di, self.ReadMemWord(self._state._segment_override if self._state._segment_override_set else self._state._ds, self._state._si))
+            self.WriteMemWord(self._state._es_base, self._state._regs[7], self.ReadMemWord(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, self._state._regs[6]))
 
-            self._state._si += -2 if self._state.GetFlagD() else 2
-            self._state._si &= 0xffff
-            self._state._di += -2 if self._state.GetFlagD() else 2
-            self._state._di &= 0xffff
+            self._state._regs[6] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[6] &= 0xffff
+            self._state._regs[7] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[7] &= 0xffff
 
             return 26
 
         return 0  # TODO
 
-    def Op_CMPSB(self, opcode: int) -> int:  # 0xa6
+    def Op_CMPSB(self, i: Instruction) -> int:  # 0xa6
         if self.PrefixMustRun():
             # CMPSB
-            v1 = self.ReadMemByte(self._state._segment_override if self._state._segment_override_set else  self._state._ds, self._state._si)
-            v2 = self.ReadMemByte(self._state._es, self._state._di)
+            v1 = self.ReadMemByte(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, self._state._regs[6])
+            v2 = self.ReadMemByte(self._state._es_base, self._state._regs[7])
 
             result = v1 - v2
 
-            self._state._si += -1 if self._state.GetFlagD() else 1
-            self._state._si &= 0xffff
-            self._state._di += -1 if self._state.GetFlagD() else 1
-            self._state._di &= 0xffff
+            self._state._regs[6] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[6] &= 0xffff
+            self._state._regs[7] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[7] &= 0xffff
 
-            self.SetAddSubFlags(False, v1, v2, result, True, False)
+            self._state.SetAddSubFlags(False, v1, v2, result, True, False)
 
             return 30
 
         return 0  # TODO
 
-    def Op_CMPSW(self, opcode: int) -> int:  # 0xa7
+    def Op_CMPSW(self, i: Instruction) -> int:  # 0xa7
         if self.PrefixMustRun():
             # CMPSW
-            v1 = self.ReadMemWord(self._state._segment_override if self._state._segment_override_set else self._state._ds, self._state._si)
-            v2 = self.ReadMemWord(self._state._es, self._state._di)
+            v1 = self.ReadMemWord(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, self._state._regs[6])
+            v2 = self.ReadMemWord(self._state._es_base, self._state._regs[7])
 
             result = v1 - v2
 
-            self._state._si += -2 if self._state.GetFlagD() else 2
-            self._state._si &= 0xffff
-            self._state._di += -2 if self._state.GetFlagD() else 2
-            self._state._di &= 0xffff
+            self._state._regs[6] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[6] &= 0xffff
+            self._state._regs[7] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[7] &= 0xffff
 
-            self.SetAddSubFlags(True, v1, v2, result, True, False)
+            self._state.SetAddSubFlags(True, v1, v2, result, True, False)
 
             return 30
 
         return 0  # TODO
 
-    def Op_MOV_AL_mem(self, opcode: int) -> int:  # 0xa0
+    def Op_MOV_AL_mem(self, i: Instruction) -> int:  # 0xa0
         # MOV AL,[...]
-        a = self.GetPcWord()
-        self._state.SetAL(self.ReadMemByte(self._state._segment_override if self._state._segment_override_set else self._state._ds, a))
+        a = i.imm
+        self._state.SetAL(self.ReadMemByte(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, a))
         return 12
 
-    def Op_MOV_AX_mem(self, opcode: int) -> int:  # 0xa1
+    def Op_MOV_AX_mem(self, i: Instruction) -> int:  # 0xa1
         # MOV AX,[...]
-        a = self.GetPcWord()
-        self._state.SetAX(self.ReadMemWord(self._state._segment_override if self._state._segment_override_set else self._state._ds, a))
+        a = i.imm
+        self._state.SetAX(self.ReadMemWord(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, a))
         return 12
 
-    def Op_MOV_mem_AL(self, opcode: int) -> int:  # 0xa2
+    def Op_MOV_mem_AL(self, i: Instruction) -> int:  # 0xa2
         # MOV [...],AL
-        a = self.GetPcWord()
-        self.WriteMemByte(self._state._segment_override if self._state._segment_override_set else self._state._ds, a, self._state.GetAL())
+        a = i.imm
+        self.WriteMemByte(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, a, self._state.GetAL())
         return 13
 
-    def Op_MOV_mem_AX(self, opcode: int) -> int:  # 0xa3
+    def Op_MOV_mem_AX(self, i: Instruction) -> int:  # 0xa3
         # MOV [...],AX
-        a = self.GetPcWord()
-        self.WriteMemWord(self._state._segment_override if self._state._segment_override_set else self._state._ds, a, self._state.GetAX())
+        a = i.imm
+        self.WriteMemWord(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, a, self._state.GetAX())
         return 13
 
-    def Op_PUSH_ES(self, opcode: int) -> int:  # 0x06
+    def Op_PUSH_ES(self, i: Instruction) -> int:  # 0x06
         # PUSH ES
         self.push(self._state._es)
         return 15
 
-    def Op_POP_ES(self, opcode: int) -> int:  # 0x07
+    def Op_POP_ES(self, i: Instruction) -> int:  # 0x07
         # POP ES
-        self._state._es = self.pop()
+        self._state.SetES(self.pop())
         self._state._inhibit_interrupts = True
         return 12
 
-    def Op_PUSH_CS(self, opcode: int) -> int:  # 0x0e
+    def Op_PUSH_CS(self, i: Instruction) -> int:  # 0x0e
         # PUSH CS
         self.push(self._state._cs)
         return 15
 
-    def Op_POP_CS(self, opcode: int) -> int:  # 0x0f
+    def Op_POP_CS(self, i: Instruction) -> int:  # 0x0f
         # POP CS
-        self._state._cs = self.pop()
+        self._state.SetCS(self.pop())
         self._state._inhibit_interrupts = True
         return 12
 
-    def Op_PUSH_SS(self, opcode: int) -> int:  # 0x16
+    def Op_PUSH_SS(self, i: Instruction) -> int:  # 0x16
         # PUSH SS
         self.push(self._state._ss)
         return 15
 
-    def Op_POP_SS(self, opcode: int) -> int:  # 0x17
+    def Op_POP_SS(self, i: Instruction) -> int:  # 0x17
         # POP SS
-        self._state._ss = self.pop()
+        self._state.SetSS(self.pop())
         self._state._inhibit_interrupts = True
         return 12
 
-    def Op_PUSH_DS(self, opcode: int) -> int:  # 0x1e
+    def Op_PUSH_DS(self, i: Instruction) -> int:  # 0x1e
         # PUSH DS
         self.push(self._state._ds)
         return 11  # 15
 
-    def Op_POP_DS(self, opcode: int) -> int:  # 0x1f
+    def Op_POP_DS(self, i: Instruction) -> int:  # 0x1f
         # POP DS
-        self._state._ds = self.pop()
+        self._state.SetDS(self.pop())
         self._state._inhibit_interrupts = True
         return 8
 
-    def Op_PUSH_AX(self, opcode: int) -> int:  # 0x50
+    def Op_PUSH_AX(self, i: Instruction) -> int:  # 0x50
         # PUSH AX
         self.push(self._state.GetAX())
         return 15
 
-    def Op_PUSH_CX(self, opcode: int) -> int:  # 0x51
+    def Op_PUSH_CX(self, i: Instruction) -> int:  # 0x51
         # PUSH CX
         self.push(self._state.GetCX())
         return 15
 
-    def Op_PUSH_DX(self, opcode: int) -> int:  # 0x52
+    def Op_PUSH_DX(self, i: Instruction) -> int:  # 0x52
         # PUSH DX
         self.push(self._state.GetDX())
         return 15
 
-    def Op_PUSH_BX(self, opcode: int) -> int:  # 0x53
+    def Op_PUSH_BX(self, i: Instruction) -> int:  # 0x53
         # PUSH BX
         self.push(self._state.GetBX())
         return 15
 
-    def Op_PUSH_SP(self, opcode: int) -> int:  # 0x54
+    def Op_PUSH_SP(self, i: Instruction) -> int:  # 0x54
         # PUSH SP
         # special case, see:
         # https:#c9x.me/x86/html/file_module_x86_id_269.html
-        self._state._sp -= 2
-        self.WriteMemWord(self._state._ss, self._state._sp, self._state._sp)
+        self._state._regs[4] -= 2
+        self.WriteMemWord(self._state._ss_base, self._state._regs[4], self._state._regs[4])
         return 15
 
-    def Op_PUSH_BP(self, opcode: int) -> int:  # 0x55
+    def Op_PUSH_BP(self, i: Instruction) -> int:  # 0x55
         # PUSH BP
-        self.push(self._state._bp)
+        self.push(self._state._regs[5])
         return 15
 
-    def Op_PUSH_SI(self, opcode: int) -> int:  # 0x56
+    def Op_PUSH_SI(self, i: Instruction) -> int:  # 0x56
         # PUSH SI
-        self.push(self._state._si)
+        self.push(self._state._regs[6])
         return 15
 
-    def Op_PUSH_DI(self, opcode: int) -> int:  # 0x57
+    def Op_PUSH_DI(self, i: Instruction) -> int:  # 0x57
         # PUSH DI
-        self.push(self._state._di)
+        self.push(self._state._regs[7])
         return 15
 
-    def Op_POP_rmw(self, opcode: int) -> int:  # 0x8f
+    def Op_POP_rmw(self, i: Instruction) -> int:  # 0x8f
         # POP rmw
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        reg2 = o1 & 7
-
-        put_cycles = self.PutRegisterMem(reg2, mod, True, self.pop())
+        put_cycles = self.PutRegisterMem(i, True, self.pop())
         return put_cycles + 17
 
-    def Op_PUSHF(self, opcode: int) -> int:  # 0x9c
+    def Op_PUSHF(self, i: Instruction) -> int:  # 0x9c
         # PUSHF
-        self.push(self._state._flags)
+        self.push(self._state.GetFlags())
         return 14
 
-    def Op_POP_AX(self, opcode: int) -> int:  # 0x58
+    def Op_POP_AX(self, i: Instruction) -> int:  # 0x58
         # POP AX
         self._state.SetAX(self.pop())
         return 8
 
-    def Op_POP_CX(self, opcode: int) -> int:  # 0x59
+    def Op_POP_CX(self, i: Instruction) -> int:  # 0x59
         # POP CX
         self._state.SetCX(self.pop())
         return 8
 
-    def Op_POP_DX(self, opcode: int) -> int:  # 0x5a
+    def Op_POP_DX(self, i: Instruction) -> int:  # 0x5a
         # POP DX
         self._state.SetDX(self.pop())
         return 8
 
-    def Op_POP_BX(self, opcode: int) -> int:  # 0x5b
+    def Op_POP_BX(self, i: Instruction) -> int:  # 0x5b
         # POP BX
         self._state.SetBX(self.pop())
         return 8
 
-    def Op_POP_SP(self, opcode: int) -> int:  # 0x5c
+    def Op_POP_SP(self, i: Instruction) -> int:  # 0x5c
         # POP SP
-        self._state._sp = self.pop()
+        self._state._regs[4] = self.pop()
         return 8
 
-    def Op_POP_BP(self, opcode: int) -> int:  # 0x5d
+    def Op_POP_BP(self, i: Instruction) -> int:  # 0x5d
         # POP BP
-        self._state._bp = self.pop()
+        self._state._regs[5] = self.pop()
         return 8
 
-    def Op_POP_SI(self, opcode: int) -> int:  # 0x5e
+    def Op_POP_SI(self, i: Instruction) -> int:  # 0x5e
         # POP SI
-        self._state._si = self.pop()
+        self._state._regs[6] = self.pop()
         return 8
 
-    def Op_POP_DI(self, opcode: int) -> int:  # 0x5f
+    def Op_POP_DI(self, i: Instruction) -> int:  # 0x5f
         # POP DI
-        self._state._di = self.pop()
+        self._state._regs[7] = self.pop()
         return 8
 
-    def Op_SBB_AL_ib(self, opcode: int) -> int:  # 0x1c
+    def Op_SBB_AL_ib(self, i: Instruction) -> int:  # 0x1c
         # SBB AL,ib
-        v = self.GetPcByte()
+        v = i.imm
         flag_c = self._state.GetFlagC()
         result = self._state.GetAL() - v
         if flag_c:
             result -= 1
 
-        self.SetAddSubFlags(False, self._state.GetAL(), v, result, True, flag_c)
+        self._state.SetAddSubFlags(False, self._state.GetAL(), v, result, True, flag_c)
         self._state.SetAL(result & 0xff)
 
         return 3
 
-    def Op_SBB_AX_iw(self, opcode: int) -> int:  # 0x1d
+    def Op_SBB_AX_iw(self, i: Instruction) -> int:  # 0x1d
         # SBB AX,iw
-        v = self.GetPcWord()
+        v = i.imm
         AX = self._state.GetAX()
         flag_c = self._state.GetFlagC()
         result = AX - v
         if flag_c:
             result -= 1
 
-        self.SetAddSubFlags(True, AX, v, result, True, flag_c)
+        self._state.SetAddSubFlags(True, AX, v, result, True, flag_c)
         self._state.SetAX(result & 0xffff)
 
         return 3
 
-    def Op_SUB_AL_ib(self, opcode: int) -> int:  # 0x2c
+    def Op_SUB_AL_ib(self, i: Instruction) -> int:  # 0x2c
         # SUB AL,ib
-        v = self.GetPcByte()
+        v = i.imm
         result = self._state.GetAL() - v
 
-        self.SetAddSubFlags(False, self._state.GetAL(), v, result, True, False)
+        self._state.SetAddSubFlags(False, self._state.GetAL(), v, result, True, False)
         self._state.SetAL(result & 0xff)
 
         return 3
 
-    def Op_SUB_AX_iw(self, opcode: int) -> int:  # 0x2d
+    def Op_SUB_AX_iw(self, i: Instruction) -> int:  # 0x2d
         # SUB AX,iw
-        v = self.GetPcWord()
+        v = i.imm
         before = self._state.GetAX()
         result = before - v
 
-        self.SetAddSubFlags(True, before, v, result, True, False)
+        self._state.SetAddSubFlags(True, before, v, result, True, False)
         self._state.SetAX(result & 0xffff)
 
         return 3
 
-    def Op_DAA(self, opcode: int) -> int:  # 0x27
+    def Op_DAA(self, i: Instruction) -> int:  # 0x27
         # DAA
         # https://www.felixcloutier.com/x86/daa
         old_al = self._state.GetAL()
@@ -2356,7 +3358,7 @@ class i8088:
 
         return 4
 
-    def Op_DAS(self, opcode: int) -> int:  # 0x2f
+    def Op_DAS(self, i: Instruction) -> int:  # 0x2f
         old_al = self._state.GetAL()
         old_af = self._state.GetFlagA()
         old_cf = self._state.GetFlagC()
@@ -2385,7 +3387,7 @@ class i8088:
 
         return 4
 
-    def Op_AAA(self, opcode: int) -> int:  # 0x37
+    def Op_AAA(self, i: Instruction) -> int:  # 0x37
         plus = 0
         old_al = self._state.GetAL()
         if (self._state.GetAL() & 0x0f) > 9 or self._state.GetFlagA():
@@ -2400,16 +3402,14 @@ class i8088:
             self._state.SetFlagC(False)
 
         new_al = self._state.GetAL()
-        self._state.SetFlagP(new_al)
-        self._state.SetFlagS((new_al & 0x80) != 0)
-        self._state.SetFlagZ(new_al == 0)
+        self._state.SetSZPFlags(False, new_al)
         self._state.SetFlagO(((old_al ^ new_al) & (plus ^ new_al) & 0x80) != 0)
 
-        self._state._al &= 0x0f
+        self._state._regs[0] &= 0xff0f
 
         return 8
 
-    def Op_AAS(self, opcode: int) -> int:  # 0x3f
+    def Op_AAS(self, i: Instruction) -> int:  # 0x3f
         min_ = 0
         old_al = self._state.GetAL()
         if (self._state.GetAL() & 0x0f) > 9 or self._state.GetFlagA():
@@ -2424,100 +3424,98 @@ class i8088:
             self._state.SetFlagC(False)
 
         new_al = self._state.GetAL()
-        self._state.SetFlagP(new_al)
-        self._state.SetFlagS((new_al & 0x80) != 0)
-        self._state.SetFlagZ(new_al == 0)
+        self._state.SetSZPFlags(False, new_al)
         self._state.SetFlagO(((old_al ^ min_) & (old_al ^ new_al) & 0x80) != 0)
 
-        self._state._al &= 0x0f
+        self._state._regs[0] &= 0xff0f
 
         return 8
 
-    def Op_JMP_np(self, opcode: int) -> int:  # 0xe9
+    def Op_JMP_np(self, i: Instruction) -> int:  # 0xe9
         # JMP np
-        offset = self.GetPcWord()
+        offset = i.imm
         self._state._ip = (self._state._ip + offset) & 0xffff
         return 15
 
-    def Op_CALL_far(self, opcode: int) -> int:  # 0x9a
+    def Op_CALL_far(self, i: Instruction) -> int:  # 0x9a
         # CALL far ptr
-        temp_ip = self.GetPcWord()
-        temp_cs = self.GetPcWord()
+        temp_ip = i.imm
+        temp_cs = i.imm2
 
         self.push(self._state._cs)
         self.push(self._state._ip)
 
         self._state._ip = temp_ip
-        self._state._cs = temp_cs
+        self._state.SetCS(temp_cs)
 
         return 37
 
-    def Op_CALL(self, opcode: int) -> int:  # 0xe8
+    def Op_CALL(self, i: Instruction) -> int:  # 0xe8
         # CALL
-        a = self.GetPcWord()
+        a = i.imm
         self.push(self._state._ip)
         self._state._ip = (a + self._state._ip) & 0xffff
 
         return 16
 
-    def Op_JMP_far(self, opcode: int) -> int:  # 0xea
+    def Op_JMP_far(self, i: Instruction) -> int:  # 0xea
         # JMP far ptr
-        temp_ip = self.GetPcWord()
-        temp_cs = self.GetPcWord()
+        temp_ip = i.imm
+        temp_cs = i.imm2
 
         self._state._ip = temp_ip
-        self._state._cs = temp_cs
+        self._state.SetCS(temp_cs)
 
         return 15
 
-    def Op_JMP(self, opcode: int) -> int:  # 0xeb
+    def Op_JMP(self, i: Instruction) -> int:  # 0xeb
         # JMP
-        to = self.GetPcByte()
+        to = i.imm
         self._state._ip = (self._state._ip + self.ToSigned8(to)) & 0xffff
         return 15
 
-    def Op_HLT(self, opcode: int) -> int:  # 0xf4
+    def Op_HLT(self, i: Instruction) -> int:  # 0xf4
         # HLT
         self._state._in_hlt = True
         return 2
 
-    def Op_CMC(self, opcode: int) -> int:  # 0xf5
+    def Op_CMC(self, i: Instruction) -> int:  # 0xf5
         # CMC
         self._state.SetFlagC(not self._state.GetFlagC())
         return 2
 
-    def Op_CLC(self, opcode: int) -> int:  # 0xf8
+    def Op_CLC(self, i: Instruction) -> int:  # 0xf8
         # CLC
         self._state.SetFlagC(False)
         return 2
 
-    def Op_STC(self, opcode: int) -> int:  # 0xf9
+    def Op_STC(self, i: Instruction) -> int:  # 0xf9
         # STC
         self._state.SetFlagC(True)
         return 2
 
-    def Op_CLI(self, opcode: int) -> int:  # 0xfa
+    def Op_CLI(self, i: Instruction) -> int:  # 0xfa
         # CLI
         self._state.SetFlagI(False) # IF
         return 2
 
-    def Op_STI(self, opcode: int) -> int:  # 0xfb
+    def Op_STI(self, i: Instruction) -> int:  # 0xfb
         # STI
         self._state.SetFlagI(True) # IF
         self._state._inhibit_interrupts = True
         return 2
 
-    def Op_CLD(self, opcode: int) -> int:  # 0xfc
+    def Op_CLD(self, i: Instruction) -> int:  # 0xfc
         # CLD
         self._state.SetFlagD(False)
         return 2
 
-    def Op_STD(self, opcode: int) -> int:  # 0xfd
+    def Op_STD(self, i: Instruction) -> int:  # 0xfd
         # STD
         self._state.SetFlagD(True)
         return 2
 
-    def Op_CBW(self, opcode: int) -> int:  # 0x98
+    def Op_CBW(self, i: Instruction) -> int:  # 0x98
         # CBW
         new_value = self._state.GetAL()
         if (self._state.GetAL() & 128) == 128:
@@ -2526,7 +3524,7 @@ class i8088:
 
         return 2
 
-    def Op_CWD(self, opcode: int) -> int:  # 0x99
+    def Op_CWD(self, i: Instruction) -> int:  # 0x99
         # CWD
         if (self._state.GetAH() & 128) == 128:
             self._state.SetDX(0xffff)
@@ -2535,85 +3533,81 @@ class i8088:
 
         return 5
 
-    def Op_LODSB(self, opcode: int) -> int:  # 0xac
+    def Op_LODSB(self, i: Instruction) -> int:  # 0xac
         if self.PrefixMustRun():
             # LODSB
-            self._state.SetAL(self.ReadMemByte(self._state._segment_override if self._state._segment_override_set else self._state._ds, self._state._si))
-            self._state._si += -1 if self._state.GetFlagD() else 1
-            self._state._si &= 0xffff
+            self._state.SetAL(self.ReadMemByte(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, self._state._regs[6]))
+            self._state._regs[6] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[6] &= 0xffff
 
             return 5
 
         return 0  # TODO
 
-    def Op_LODSW(self, opcode: int) -> int:  # 0xad
+    def Op_LODSW(self, i: Instruction) -> int:  # 0xad
         if self.PrefixMustRun():
             # LODSW
-            self._state.SetAX(self.ReadMemWord(self._state._segment_override if self._state._segment_override_set else self._state._ds, self._state._si))
-            self._state._si += -2 if self._state.GetFlagD() else 2
-            self._state._si &= 0xffff
+            self._state.SetAX(self.ReadMemWord(self._state._segment_override_base if self._state._segment_override_set else self._state._ds_base, self._state._regs[6]))
+            self._state._regs[6] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[6] &= 0xffff
 
             return 5
 
         return 0  # TODO
 
-    def Op_LEA(self, opcode: int) -> int:  # 0x8d
+    def Op_LEA(self, i: Instruction) -> int:  # 0x8d
         # LEA
-        o1 = self.GetPcByte()
-        mod = o1 >> 6
-        reg = (o1 >> 3) & 7
-        rm = o1 & 7
-
-        (val, a_valid, seg, addr, get_cycles) = self.GetRegisterMem(rm, mod, True)
-        self.PutRegister(reg, True, addr)
+        val = self.ReadOperand(i, True)
+        get_cycles = i.address_mode.read_cycles
+        self.PutRegister(i.reg, True, self._operand_offset if i.address_mode.ea != None else 0)
 
         return get_cycles + 3
 
-    def Op_SAHF(self, opcode: int) -> int:  # 0x9e
+    def Op_SAHF(self, i: Instruction) -> int:  # 0x9e
         # SAHF
-        keep = self._state._flags & 0b1111111100101010
+        keep = self._state.GetFlags() & 0b1111111100101010
         add = self._state.GetAH() & 0b11010101
 
-        self._state._flags = keep | add
+        self._state.SetFlags(keep | add)
         self._state.FixFlags()
 
         return 4
 
-    def Op_LAHF(self, opcode: int) -> int:  # 0x9f
+    def Op_LAHF(self, i: Instruction) -> int:  # 0x9f
         # LAHF
-        self._state.SetAH(self._state._flags & 0xff)
+        self._state.SetAH(self._state.GetFlags() & 0xff)
         return 2
 
-    def Op_SCASB(self, opcode: int) -> int:  # 0xae
+    def Op_SCASB(self, i: Instruction) -> int:  # 0xae
         if self.PrefixMustRun():
             # SCASB
-            v = self.ReadMemByte(self._state._es, self._state._di)
+            v = self.ReadMemByte(self._state._es_base, self._state._regs[7])
             result = self._state.GetAL() - v
-            self.SetAddSubFlags(False, self._state.GetAL(), v, result, True, False)
-            self._state._di += -1 if self._state.GetFlagD() else 1
-            self._state._di &= 0xffff
+            self._state.SetAddSubFlags(False, self._state.GetAL(), v, result, True, False)
+            self._state._regs[7] += -1 if self._state.GetFlagD() else 1
+            self._state._regs[7] &= 0xffff
 
             return 15
 
         return 0
 
-    def Op_SCASW(self, opcode: int) -> int:  # 0xaf
+    def Op_SCASW(self, i: Instruction) -> int:  # 0xaf
         if self.PrefixMustRun():
             # SCASW
             ax = self._state.GetAX()
-            v = self.ReadMemWord(self._state._es, self._state._di)
+            v = self.ReadMemWord(self._state._es_base, self._state._regs[7])
             result = ax - v
-            self.SetAddSubFlags(True, ax, v, result, True, False)
-            self._state._di += -2 if self._state.GetFlagD() else 2
-            self._state._di &= 0xffff
+            self._state.SetAddSubFlags(True, ax, v, result, True, False)
+            self._state._regs[7] += -2 if self._state.GetFlagD() else 2
+            self._state._regs[7] &= 0xffff
 
             return 15
 
         return 0
 
-    def Op_AAM(self, opcode: int) -> int:  # 0xd4
+    def Op_AAM(self, i: Instruction) -> int:  # 0xd4
         # AAM
-        b2 = self.GetPcByte()
+        b2 = i.imm
 
         self._state.SetFlagO(False)
         self._state.SetFlagA(False)
@@ -2621,7 +3615,7 @@ class i8088:
 
         if b2 != 0:
             self._state.SetAH(self._state.GetAL() // b2)
-            self._state._al %= b2
+            self._state.SetAL(self._state.GetAL() % b2)
 
             self._state.SetZSPFlags(self._state.GetAL())
 
@@ -2632,9 +3626,9 @@ class i8088:
 
         return 83
 
-    def Op_AAD(self, opcode: int) -> int:  # 0xd5
+    def Op_AAD(self, i: Instruction) -> int:  # 0xd5
         # AAD
-        b2 = self.GetPcByte()
+        b2 = i.imm
 
         org_al = self._state.GetAL()
         mul_result = self._state.GetAH() * b2
@@ -2650,7 +3644,7 @@ class i8088:
 
         return 60
 
-    def Op_SALC(self, opcode: int) -> int:  # 0xd6
+    def Op_SALC(self, i: Instruction) -> int:  # 0xd6
         # SALC
         if self._state.GetFlagC():
             self._state.SetAL(0xff)
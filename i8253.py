@@ -77,6 +77,8 @@ class i8253(device.Device):
         else:
             print(f'error {port:04x}')
 
+        self.ScheduleTimer0()
+
         return self._timers[0].is_pending or self._timers[1].is_pending or self._timers[2].is_pending
 
     @override
@@ -181,6 +183,7 @@ class i8253(device.Device):
     def Tick(self, ticks: int, ignored):
         self._clock += ticks
         if self._clock < 4:
+            self.ScheduleTimer0()
             return False
 
         interrupt = False
@@ -191,21 +194,25 @@ class i8253(device.Device):
             if self._timers[i].is_running == False:
                 continue
 
-            self._timers[i].counter_cur -= n_to_subtract
+            # a timer goes off when its counter reaches -divider, it then continues from 'restart'
+            divider = self.GetDivider(i)
+            restart = self.GetRestartValue(i)
+
+            n_interrupts = 0
+            n = n_to_subtract
+            if self._timers[i].counter_cur - n <= -divider:
+                n -= self._timers[i].counter_cur + divider
+                n_interrupts = 1 + n // (restart + divider)
+                n %= restart + divider
+                self._timers[i].counter_cur = restart
 
-            divider = 0x10000 if self._timers[i].counter_ini == 0 else self._timers[i].counter_ini
-            n_interrupts = -self._timers[i].counter_cur // divider
+            self._timers[i].counter_cur -= n
 
             if n_interrupts > 0:
                 # timer 1 is RAM refresh counter
                 if i == 1:
                     self._i8237.TickChannel0(n_interrupts)
 
-                if self._timers[i].mode != 1:
-                    self._timers[i].counter_cur = self._timers[i].counter_ini - (-self._timers[i].counter_cur % divider)
-                else:
-                    self._timers[i].counter_cur &= 0xffff
-
                 if i == 0:
                     self._timers[i].is_pending = True
                     interrupt = True
@@ -215,4 +222,24 @@ class i8253(device.Device):
         if interrupt:
             self._pic.RequestInterruptPIC(self._irq_nr)  # Timers are on IRQ0
 
+        self.ScheduleTimer0()
+
         return interrupt
+
+    def GetDivider(self, nr: int) -> int:
+        return 0x10000 if self._timers[nr].counter_ini == 0 else self._timers[nr].counter_ini
+
+    # counter value right after a timer went off
+    def GetRestartValue(self, nr: int) -> int:
+        if self._timers[nr].mode != 1:
+            return self._timers[nr].counter_ini
+        return -self.GetDivider(nr) & 0xffff
+
+    # timer 0 is the only one that interrupts, the others are brought up to date when accessed
+    def ScheduleTimer0(self):
+        if self._timers[0].is_running == False:
+            self._scheduler.CancelEvent(self)
+            return
+
+        n_ticks = max(1, self._timers[0].counter_cur + self.GetDivider(0))
+        self.ScheduleEvent(self._scheduler.GetClock() + n_ticks * 4 - self._clock)
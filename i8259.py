@@ -2,6 +2,9 @@
 from typing import override, List, Tuple
 import device
 
+# number of the lowest set bit for each byte value, 255 for 0 (IRQ 0 has the highest priority)
+_lowest_bit = bytes([ 255 ] + [ (n & -n).bit_length() - 1 for n in range(1, 256) ])
+
 class i8259(device.Device):
     def __init__(self):
         self._int_offset = 8  # TODO updaten bij ICW (OCW?) en dan XT::Tick() de juiste vector
@@ -26,6 +29,8 @@ class i8259(device.Device):
         self._ocw2 = 0
         self._ocw3 = 0
 
+        self._pending = 255  # deliverable IRQ, the CPU checks this before every instruction
+
     @override
     def GetIRQNumber(self) -> int:
         return -1
@@ -49,14 +54,15 @@ class i8259(device.Device):
         mappings[0x0020] = self
         mappings[0x0021] = self
 
-    def GetPendingInterrupt(self) -> int:
-        if self._irr == 0 or self._int_in_service != -1:
-            return 255
+    # to be invoked after each change of IRR, ISR, IMR or the interrupt in service
+    def UpdatePendingInterrupt(self):
+        if self._int_in_service != -1:
+            self._pending = 255
+        else:
+            self._pending = _lowest_bit[self._irr & ~self._isr & ~self._imr & 0xff]
 
-        for i in range(8):
-            mask = 1 << i
-            if (self._irr & mask) == mask and (self._isr & mask) == 0 and (self._imr & mask) == 0:
-                return i
+    def GetPendingInterrupt(self) -> int:
+        return self._pending
 
     def GetInterruptLevel(self) -> int:
         return self._irq_request_level
@@ -64,6 +70,7 @@ class i8259(device.Device):
     def RequestInterruptPIC(self, interrupt_nr: int):
         mask = 1 << interrupt_nr
         self._irr |= mask
+        self.UpdatePendingInterrupt()
 
     def SetIRQBeingServiced(self, interrupt_nr: int):
         if self._auto_eoi == False:
@@ -76,6 +83,8 @@ class i8259(device.Device):
             self._isr &= mask
             self._int_in_service = -1
 
+        self.UpdatePendingInterrupt()
+
     @override
     def IO_Read(self, addr: int) -> int:
         rc = 0
@@ -161,6 +170,8 @@ class i8259(device.Device):
             else:
                 self._imr = value
 
+        self.UpdatePendingInterrupt()
+
         # when reconfiguring the PIC8259, force an interrupt recheck
         return True
 
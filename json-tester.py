@@ -1,6 +1,7 @@
 #! /usr/bin/python3
 
 import bus
+import dis
 import i8088
 import json
 import pprint
@@ -38,16 +39,31 @@ def my_assert_flags(state, test, is_, exp, what):
 
     return my_assert(state, test, is_, exp, what)
 
-def do(file):
+# bytecodes that create an object (a tuple, list, ...) each time they run; ints are not counted
+ALLOCATING = { dis.opmap[name] for name in ('BUILD_TUPLE', 'BUILD_LIST', 'BUILD_MAP', 'BUILD_CONST_KEY_MAP', 'BUILD_SET', 'BUILD_SLICE', 'BUILD_STRING', 'FORMAT_VALUE', 'MAKE_FUNCTION') }
+allocation_count = 0
+
+# sys.monitoring callback for each bytecode that runs, see --allocations
+def count_allocation(code, offset: int):
+    global allocation_count
+    if code.co_code[offset] not in ALLOCATING:
+        return sys.monitoring.DISABLE  # for this bytecode from now on
+    allocation_count += 1
+
+def do(file, flat: bool, allocations: bool, generic: bool):
     start = time.time()
 
     j = json.loads(open(file, 'r').read())
 
     count = 0
     ok = 0
+    allocated = 0  # objects, see --allocations
+    allocation_free = 0
 
     b = bus.Bus(1024 * 1024, [], [])
     p = i8088.i8088(b, [], False)
+    p.UseFlatInterpreter(flat)
+    p.UseSpecializedHandlers(not generic)
     state = p.GetState()
 
     for test in j:
@@ -90,13 +106,30 @@ def do(file):
         for ram in test['initial']['ram']:
             b.WriteByte(ram[0], ram[1])
 
+        if allocations:
+            # decode first, only the execution of the instruction is measured
+            ip = state.GetIP()
+            p.GetInstruction((state.GetCS() * 16 + ip) & 0xfffff)
+            state.SetIP(ip)
+
+            before = allocation_count
+
         while True:
-            rc = p.Tick()
+            if flat:
+                # the generated interpreter stops after the instruction that uses up the budget
+                rc = -1 if p.Run(1)[0] == 'stop' else 0
+            else:
+                rc = p.Tick()
             if rc == -1:
                 break
             if p.IsProcessingRep() == False:
                 break
 
+        if allocations:
+            n = allocation_count - before
+            allocated += n
+            allocation_free += n == 0
+
         regs = test['final']['regs']
         failed = False
         for reg in regs:
@@ -139,7 +172,17 @@ def do(file):
 
     print(f'Total count: {count}, ok: {ok}, failed: {(count - ok) / count * 100:.2f}%')
     print(f'Took: {time.time() - start:.2f}')
+    if allocations:
+        print(f'Allocations: {allocated / count:.2f} objects per test on average, none in {allocation_free} of {count} tests')
 
     sys.exit(0 if ok == count else 1)
 
-do(sys.argv[1])
+# --allocations counts the objects created while executing each test
+allocations = '--allocations' in sys.argv[2:]
+if allocations:
+    sys.monitoring.use_tool_id(sys.monitoring.PROFILER_ID, 'json-tester')
+    sys.monitoring.register_callback(sys.monitoring.PROFILER_ID, sys.monitoring.events.INSTRUCTION, count_allocation)
+    sys.monitoring.set_events(sys.monitoring.PROFILER_ID, sys.monitoring.events.INSTRUCTION)
+
+# --generic runs the generic ALU handlers instead of the per-opcode copies generated from them
+do(sys.argv[1], '--flat' in sys.argv[2:], allocations, '--generic' in sys.argv[2:])
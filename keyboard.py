@@ -49,6 +49,10 @@ class Keyboard(device.Device):
             if (value & 0x80) != 0:
                 self._last_scan_code = 0
 
+            # an interrupt that came due while the keyboard was disabled goes off now
+            elif len(self._next_interrupt) > 0:
+                self.ScheduleEvent(self._next_interrupt_clock)
+
         return False
 
     @override
@@ -88,7 +92,7 @@ class Keyboard(device.Device):
 
     @override
     def Tick(self, cycles: int, clock: int) -> bool:
-        if (self._0x61_bits & 0x80) == 0 and self.CheckScheduledInterrupt(cycles):
+        if (self._0x61_bits & 0x80) == 0 and self.CheckScheduledInterrupt(clock):
             self._pic.RequestInterruptPIC(self._irq_nr)
 
         return False
@@ -1,5 +1,6 @@
 #! /usr/bin/python3
 
+import atexit
 import bus
 import i8088
 import i8253
@@ -7,6 +8,7 @@ import i8255
 import keyboard
 import mda
 import rom
+import sys
 import telnet
 import time
 import vncserver
@@ -40,6 +42,15 @@ roms.append(rom.Rom('roms/ide_xt.bin', 0xd000 * 16 + 0x0000))
 
 b = bus.Bus(1024 * 1024, devices, roms)
 p = i8088.i8088(b, devices, True)
+if '--flat' in sys.argv[1:]:
+    p.UseFlatInterpreter(True)  # generated interpreter with the frequent instructions inlined
+
+# the ROM code decoded in previous runs, the cache files are updated when the emulator ends
+for r in roms:
+    cache_file = r.GetFilename() + '.cache'
+    print(f'{p.LoadRomCache(r, cache_file)} instructions of {r.GetFilename()} loaded from {cache_file}')
+    atexit.register(p.SaveRomCache, r, cache_file)
+
 state = p.GetState()
 state.SetCS(0xf000)
 state.SetIP(0xfff0)
@@ -52,16 +63,20 @@ print('and/or connect using a VNC client to localhost:5902 (preferred)')
 
 p_time = time.time()
 p_cycles = 0
+p_idle_cycles = 0
 while True:
     # print(f'{state.GetCS():04x}:{state.GetIP():04x} {GetRegisters(state)}')
-    rc = p.Tick()
-    if rc == -1:
+    reason, cycles = p.Run(100000)  # runs TickBlock() until the cycles are used up or an interrupt is started
+    if reason == 'stop':
+        print(p.GetStopReason())
         break
     cur_cycles = state.GetClock()
     c_diff = cur_cycles - p_cycles
     if c_diff >= 4700000:
         p_cycles = cur_cycles
+        idle_cycles = p.GetIdleCycles()
         now = time.time()
         ##print(f'\033[1;82H{100 * c_diff / (now - p_time) / 4700000:.2f}%', end='')
-        print(f'{100 * c_diff / (now - p_time) / 4700000:.2f}%')
+        print(f'{100 * c_diff / (now - p_time) / 4700000:.2f}%, idle: {100 * (idle_cycles - p_idle_cycles) / c_diff:.2f}%')
+        p_idle_cycles = idle_cycles
         p_time = now
@@ -5,6 +5,17 @@ class Memory(Device):
     def __init__(self, size: int):
         self._m: bytearray = bytearray(b'\xff' * size)
 
+    def Clear(self):
+        # in place: the CPU keeps a reference to this buffer
+        self._m[:] = b'\xff' * len(self._m)
+
+    def GetBuffer(self) -> bytearray:
+        return self._m
+
+    @override
+    def GetFetchBuffer(self) -> Tuple[bytes, int]:
+        return (self._m, 0)
+
     @override
     def ReadByte(self, address: int) -> int:
         # print(f'READ {self._m[address]:02x} from {address:06x}')
@@ -16,6 +27,14 @@ class Memory(Device):
         # print(f'WRTE {v:02x} to {address:06x}')
         self._m[address] = v
 
+    @override
+    def ReadWord(self, address: int) -> int:
+        return int.from_bytes(self._m[address:address + 2], 'little')
+
+    @override
+    def WriteWord(self, address: int, v: int):
+        self._m[address:address + 2] = v.to_bytes(2, 'little')
+
     @override
     def GetName(self) -> str:
         return "RAM"
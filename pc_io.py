@@ -1,24 +1,44 @@
 from typing import List, Tuple
+import heapq
 import i8259
 import i8237
 import bus
 import device
+import state8088
+import threading
 
 class IO:
-    def __init__(self, b: bus.Bus, devices: List[device.Device], test_mode: bool):
+    NO_EVENT = 1 << 62  # _next_event when no device has an event scheduled
+
+    def __init__(self, b: bus.Bus, devices: List[device.Device], test_mode: bool, state: state8088.State8088):
         self._b = b
         self._io_map = dict()
         self._pic = i8259.i8259()
         self._i8237 = i8237.i8237(b)
         self._tick_devices = []
 
+        # the clock of the CPU is the time base for the devices
+        self._state = state
+        # clock up to which each tick device has been ticked
+        self._tick_clocks = dict()
+        # (clock, sequence number, device) of the scheduled events, a device has at most one valid
+        # entry: the one matching _event_clocks, others are left in the heap until they come up
+        self._events = []
+        self._event_clocks = dict()
+        self._event_sequence = 0
+        self._events_lock = threading.Condition()  # keyboard events are scheduled from other threads
+        # the CPU compares its clock against this after each instruction
+        self._next_event = IO.NO_EVENT
+
         for device in devices:
             device.SetDma(self._i8237)
             device.SetPic(self._pic)
             device.SetBus(self._b)
+            device.SetScheduler(self)
 
             if device.Ticks():
                 self._tick_devices.append(device)
+                self._tick_clocks[device] = 0
 
         devices.append(self._i8237)
         devices.append(self._pic);
@@ -38,6 +58,8 @@ class IO:
             return 65535
 
         if addr in self._io_map:
+            self.SyncDevices()
+
             rc = self._io_map[addr].IO_Read(addr)
 
             if b16:
@@ -55,10 +77,79 @@ class IO:
 
         return 0xffff if b16 else 0xff
 
-    def Tick(self, ticks: int, clock: int) -> bool:
-        rc = False
+    def GetClock(self) -> int:
+        return self._state._clock
+
+    # asks for 'device' to be ticked once the clock reaches 'clock', replaces an earlier request
+    def ScheduleEvent(self, device: device.Device, clock: int):
+        with self._events_lock:
+            self._event_clocks[device] = clock
+            self._event_sequence += 1
+            heapq.heappush(self._events, (clock, self._event_sequence, device))
+
+            if clock < self._next_event:
+                self._next_event = clock
+
+            self._events_lock.notify_all()
+
+    # blocks at most 'timeout' seconds until any event gets scheduled, for when the CPU is idle
+    def WaitForEvent(self, timeout: float):
+        if self._test_mode:
+            return
+
+        with self._events_lock:
+            if self._next_event == IO.NO_EVENT:
+                self._events_lock.wait(timeout)
+
+    def CancelEvent(self, device: device.Device):
+        with self._events_lock:
+            self._event_clocks.pop(device, None)
+            # the CPU must not skip ahead to the cancelled event (HLT, idle loops)
+            self.UpdateNextEvent()
+
+    # drops the stale events at the front of the heap and sets _next_event to the first valid one
+    # must be invoked with _events_lock held
+    def UpdateNextEvent(self):
+        while len(self._events) > 0 and self._event_clocks.get(self._events[0][2]) != self._events[0][0]:
+            heapq.heappop(self._events)
+
+        self._next_event = self._events[0][0] if len(self._events) > 0 else IO.NO_EVENT
+
+    # ticks 'device' from where it was left up to the current clock
+    def TickDevice(self, device: device.Device) -> bool:
+        clock = self._state._clock
+        cycles = clock - self._tick_clocks[device]
+        if cycles <= 0:
+            return False
+
+        self._tick_clocks[device] = clock
+        return device.Tick(cycles, clock)
+
+    # brings all tick devices up to date, before their registers get accessed
+    def SyncDevices(self):
         for device in self._tick_devices:
-            rc |= device.Tick(ticks, clock)
+            self.TickDevice(device)
+
+    # invoked by the CPU when its clock reached _next_event: ticks the devices that are due
+    def RunEvents(self) -> bool:
+        clock = self._state._clock
+
+        due = []
+        with self._events_lock:
+            while len(self._events) > 0 and self._events[0][0] <= clock:
+                event_clock, sequence, device = heapq.heappop(self._events)
+                if self._event_clocks.get(device) == event_clock:
+                    del self._event_clocks[device]
+                    due.append(device)
+
+        # ticking can schedule new events
+        rc = False
+        for device in due:
+            rc |= self.TickDevice(device)
+
+        with self._events_lock:
+            self.UpdateNextEvent()
+
         return rc
 
     def Out(self, addr: int, value: int, b16: bool) -> bool:
@@ -68,6 +159,8 @@ class IO:
         rc = False
 
         if addr in self._io_map:
+            self.SyncDevices()
+
             rc |= self._io_map[addr].IO_Write(addr, value & 255)
 
             if b16:
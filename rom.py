@@ -1,9 +1,11 @@
 from typing import override, List, Tuple
 from device import Device
+import hashlib
 
 class Rom(Device):
     def __init__(self, filename: str, offset: int):
-        self._contents: List[int] = [ b for b in open(filename, 'rb').read() ]
+        self._filename: str = filename
+        self._contents: bytes = open(filename, 'rb').read()
         self._offset: int = offset
 
         if self._contents[0] != 0x55 or self._contents[1] != 0xaa:
@@ -12,10 +14,25 @@ class Rom(Device):
             # Log.Cnsl(msg);
             pass
 
+    def GetFilename(self) -> str:
+        return self._filename
+
+    # sha256 of the contents, as hex
+    def GetHash(self) -> str:
+        return hashlib.sha256(self._contents).hexdigest()
+
     @override
     def ReadByte(self, address: int) -> int:
         return self._contents[address - self._offset]
 
+    @override
+    def ReadWord(self, address: int) -> int:
+        return self._contents[address - self._offset] | (self._contents[address - self._offset + 1] << 8)
+
+    @override
+    def GetFetchBuffer(self) -> Tuple[bytes, int]:
+        return (self._contents, self._offset)
+
     @override
     def GetName(self) -> str:
         return "ROM"
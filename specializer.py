@@ -0,0 +1,596 @@
+# makes copies of instruction handlers with the fields of the instruction that select what they do
+# (opcode, ModRM reg) fixed: the variables set from these become constants and the branches on them are
+# folded away, so that the copy only holds the code for that one opcode
+import ast
+import copy
+import inspect
+import textwrap
+from typing import Dict, List
+
+
+# True if evaluating expression 'node' has no side effects: arithmetic on variables, constants and attributes
+def _is_pure(node) -> bool:
+    return all(isinstance(n, (ast.Name, ast.Constant, ast.Attribute, ast.Compare, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.IfExp, ast.Tuple,
+                              ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)) for n in ast.walk(node))
+
+
+# 'a.b.c' for a chain of attributes starting at a name, None for other expressions
+def _dotted(node) -> str:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        path = _dotted(node.value)
+        return path + '.' + node.attr if path != None else None
+    return None
+
+
+# True if evaluating expression 'node' only reads: no calls (other than bool()), assignments or nested scopes
+# (subscripts may still raise)
+def _is_read_only(node) -> bool:
+    return not any((isinstance(n, ast.Call) and _dotted(n.func) != 'bool') or isinstance(n, (ast.NamedExpr, ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.Await, ast.Yield, ast.YieldFrom))
+                   for n in ast.walk(node))
+
+
+class Specializer:
+    # replaces variables with known values by constants and evaluates what only depends on constants
+    class Folder(ast.NodeTransformer):
+        def __init__(self, instruction: str, fields: Dict[str, int], env: Dict[str, object]):
+            self._instruction = instruction  # name of the Instruction parameter
+            self._fields = fields
+            self._env = env
+
+        def visit_Name(self, node: ast.Name):
+            if isinstance(node.ctx, ast.Load) and node.id in self._env:
+                return ast.copy_location(ast.Constant(self._env[node.id]), node)
+            return node
+
+        def visit_Attribute(self, node: ast.Attribute):
+            if isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name) and node.value.id == self._instruction and node.attr in self._fields:
+                return ast.copy_location(ast.Constant(self._fields[node.attr]), node)
+            return self.generic_visit(node)
+
+        # True for a constant or a tuple of constants
+        def IsConstant(self, node) -> bool:
+            if isinstance(node, ast.Tuple):
+                return all(self.IsConstant(element) for element in node.elts)
+            return isinstance(node, ast.Constant)
+
+        def Evaluate(self, node):
+            for child in ast.iter_child_nodes(node):
+                if not isinstance(child, (ast.operator, ast.unaryop, ast.cmpop)) and not self.IsConstant(child):
+                    return node
+            try:
+                value = eval(compile(ast.fix_missing_locations(ast.Expression(node)), '<fold>', 'eval'), {})
+            except Exception:
+                return node
+            return ast.copy_location(ast.Constant(value), node)
+
+        def visit_BinOp(self, node: ast.BinOp):
+            return self.Evaluate(self.generic_visit(node))
+
+        def visit_UnaryOp(self, node: ast.UnaryOp):
+            return self.Evaluate(self.generic_visit(node))
+
+        def visit_Compare(self, node: ast.Compare):
+            return self.Evaluate(self.generic_visit(node))
+
+        def visit_IfExp(self, node: ast.IfExp):
+            node = self.generic_visit(node)
+            if isinstance(node.test, ast.Constant):
+                return node.body if node.test.value else node.orelse
+            return node
+
+        # 'a and True and b' is 'a and b', 'a and False and b' is 'a and False' (and the same for 'or')
+        def visit_BoolOp(self, node: ast.BoolOp):
+            node = self.generic_visit(node)
+            is_and = isinstance(node.op, ast.And)
+            values = []
+            for n, value in enumerate(node.values):
+                last = n == len(node.values) - 1
+                if isinstance(value, ast.Constant) and not last:
+                    if bool(value.value) == is_and:
+                        continue  # doesn't change the outcome
+                    values.append(value)  # decides the outcome
+                    break
+                values.append(value)
+            if len(values) == 1:
+                return values[0]
+            node.values = values
+            return node
+
+        # as the condition of an if, 'a and False' is False when evaluating 'a' has no side effects
+        def VisitCondition(self, node):
+            node = self.visit(node)
+            if isinstance(node, ast.BoolOp) and isinstance(node.values[-1], ast.Constant):
+                is_and = isinstance(node.op, ast.And)
+                if _is_pure(node) and bool(node.values[-1].value) != is_and:
+                    return ast.copy_location(ast.Constant(not is_and), node)
+            return node
+
+    def __init__(self):
+        self._cache: Dict = dict()
+        self._loaded: Dict = dict()
+        self._expanded: int = 0  # number of method bodies inlined, to give their variables unique names
+        self._methods: Dict = dict()  # see ParseMethod
+
+    # returns 'handler' (a bound method) specialized for 'fields' (Instruction attribute -> value)
+    def Specialize(self, handler, fields: Dict[str, int]):
+        function = handler.__func__
+        key = (function, tuple(sorted(fields.items())))
+        if key not in self._cache:
+            self._cache[key] = self.Generate(function, fields)
+        return self._cache[key].__get__(handler.__self__)
+
+    def Generate(self, function, fields: Dict[str, int]):
+        tree = ast.Module([ self.Simplify(function, fields) ], [])
+        name = tree.body[0].name
+
+        ast.fix_missing_locations(tree)
+        namespace = dict()
+        exec(compile(tree, f'<specialized {name}>', 'exec'), function.__globals__, namespace)
+        return namespace[name]
+
+    # returns the definition of 'function' with 'fields' folded in, under a name that includes these
+    # 'calls' (see ExpandCalls) are inlined first
+    def Simplify(self, function, fields: Dict[str, int], calls: Dict[str, object] = None) -> ast.FunctionDef:
+        definition = ast.parse(textwrap.dedent(inspect.getsource(function))).body[0]
+
+        # annotations refer to names of the class
+        definition.decorator_list = []
+        definition.returns = None
+        for argument in definition.args.args:
+            argument.annotation = None
+
+        definition.name = function.__name__ + ''.join(f'_{k}_{v:02x}' for k, v in sorted(fields.items()))
+        definition.body = self.Block(definition.body, definition.args.args[1].arg, fields, dict())
+        # one level of calls at a time, so that the arguments of the next are folded first
+        for depth in range(4 if calls else 0):
+            expanded = self._expanded
+            definition.body = self.Block(self.ExpandCalls(definition.body, calls, function.__globals__), definition.args.args[1].arg, fields, dict())
+            if self._expanded == expanded:
+                break
+        while self.RemoveUnusedAssignments(definition, definition.body):
+            pass
+
+        return definition
+
+    # returns the statements of method 'handler' specialized for 'fields', as source to be pasted into a function
+    # that has the same 'self' and Instruction parameter ('i') as locals; its return value goes into variable
+    # 'result', its own variables get 'prefix' in front of their name and the attributes in 'aliases' (e.g.
+    # 'self._state') are replaced by the local variable they map to. None if it can't be inlined (a return from inside a loop, nested scopes).
+    # The methods in 'calls' that it invokes are inlined as well, see ExpandCalls.
+    def Inline(self, handler, fields: Dict[str, int], result: str, prefix: str, aliases: Dict[str, str], calls: Dict[str, object] = None) -> str:
+        definition = self.Simplify(handler.__func__, fields, calls)
+        if [ a.arg for a in definition.args.args ] != [ 'self', 'i' ]:
+            return None
+
+        for node in ast.walk(definition):
+            if isinstance(node, (ast.For, ast.While)) and any(isinstance(n, ast.Return) for n in ast.walk(node)):
+                return None
+            if node is not definition and isinstance(node, (ast.FunctionDef, ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.Global, ast.Nonlocal, ast.Try)):
+                return None
+
+        local_names = self.StoredNames(definition) - { 'self', 'i' }
+
+        class Rewriter(ast.NodeTransformer):
+            def visit_Name(self, node: ast.Name):
+                if node.id in local_names:
+                    node.id = prefix + node.id
+                return node
+
+            def visit_Attribute(self, node: ast.Attribute):
+                path = _dotted(node)
+                if path in aliases and isinstance(node.ctx, ast.Load):
+                    return ast.copy_location(ast.Name(aliases[path], ast.Load()), node)
+                return self.generic_visit(node)
+
+            def visit_Return(self, node: ast.Return):
+                node = self.generic_visit(node)
+                value = node.value if node.value != None else ast.Constant(None)
+                return [ ast.copy_location(ast.Assign([ ast.Name(result, ast.Store()) ], value), node), ast.copy_location(ast.Break(), node) ]
+
+        body = self.MoveIntoElse(definition.body)
+        tail_returns = self.EndsInReturn(body) and self.ReturnsAtEnd(body)
+
+        body = [ Rewriter().visit(statement) for statement in body ]
+        body = [ s for statement in body for s in (statement if isinstance(statement, list) else [ statement ]) ]
+
+        if tail_returns:
+            # every return ends the handler, so its 'break' would be the last statement anyway
+            class Unbreak(ast.NodeTransformer):
+                def visit_Break(self, node: ast.Break):
+                    return None
+            statements = [ Unbreak().visit(statement) for statement in body if not isinstance(statement, ast.Break) ]
+        else:
+            # 'while True' gives the returns something to break out of
+            if not self.EndsInReturn(definition.body):
+                body += [ ast.Assign([ ast.Name(result, ast.Store()) ], ast.Constant(None)), ast.Break() ]
+            statements = [ ast.While(ast.Constant(True), body, []) ]
+
+        module = ast.Module(statements, [])
+        ast.fix_missing_locations(module)
+        return ast.unparse(module)
+
+    # replaces calls of the methods in 'calls' (the call as it appears in the source, e.g. 'self._state.SetAX', -> the
+    # function) by their code: calls that make up a statement or the value of an assignment become the statements of
+    # the method, other calls are replaced by the expression of methods that are only 'return <expression>'; this
+    # recurses into the inlined code until 'depth' levels deep. 'namespace' holds the globals of the code that is
+    # generated, methods that use other globals are left alone
+    def ExpandCalls(self, statements: List[ast.stmt], calls: Dict[str, object], namespace: Dict[str, object]) -> List[ast.stmt]:
+        specializer = self
+
+        class ExpressionExpander(ast.NodeTransformer):
+            def visit_Call(self, node: ast.Call):
+                node = self.generic_visit(node)
+                function = calls.get(_dotted(node.func))
+                if function == None:
+                    return node
+                expression = specializer.ExpandExpression(node, function, namespace)
+                if expression == None:
+                    return node
+                return ast.copy_location(expression, node)
+
+        out = []
+        for statement in statements:
+            for field in ('body', 'orelse'):
+                block = getattr(statement, field, None)
+                if isinstance(block, list) and block and isinstance(block[0], ast.stmt):
+                    setattr(statement, field, self.ExpandCalls(block, calls, namespace))
+
+            if isinstance(statement, (ast.Expr, ast.Assign, ast.AugAssign, ast.Return, ast.If, ast.While, ast.For, ast.Assert)):
+                for field in ('value', 'test', 'iter', 'msg'):
+                    if getattr(statement, field, None) != None:
+                        setattr(statement, field, ExpressionExpander().visit(getattr(statement, field)))
+
+            call = statement.value if isinstance(statement, (ast.Expr, ast.Assign)) else None
+            if isinstance(call, ast.Call) and _dotted(call.func) in calls and (isinstance(statement, ast.Expr) or len(statement.targets) == 1):
+                target = statement.targets[0] if isinstance(statement, ast.Assign) else None
+                body = self.ExpandStatement(call, calls[_dotted(call.func)], target, namespace)
+                if body != None:
+                    out += body
+                    continue
+
+            out.append(statement)
+
+        return out
+
+    # returns the source of method 'function' without annotations, with the constants of classes (e.g.
+    # 'State8088.LAZY_NONE') filled in; None if it uses globals that are different in 'namespace'
+    def ParseMethod(self, function, namespace: Dict[str, object]) -> ast.FunctionDef:
+        key = (function, id(namespace))
+        if key not in self._methods:
+            definition = self.ParseMethodSource(function, namespace)
+            self._methods[key] = ast.unparse(definition) if definition != None else None
+        # parsed again for a fresh copy, that is faster than copy.deepcopy()
+        return ast.parse(self._methods[key]).body[0] if self._methods[key] != None else None
+
+    def ParseMethodSource(self, function, namespace: Dict[str, object]) -> ast.FunctionDef:
+        definition = ast.parse(textwrap.dedent(inspect.getsource(function))).body[0]
+        arguments = definition.args
+        if arguments.vararg or arguments.kwarg or arguments.kwonlyargs or arguments.posonlyargs or definition.decorator_list:
+            return None
+
+        for node in ast.walk(definition):
+            if node is not definition and isinstance(node, (ast.FunctionDef, ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.Global, ast.Nonlocal, ast.Try)):
+                return None
+            if isinstance(node, (ast.For, ast.While)) and any(isinstance(n, ast.Return) for n in ast.walk(node)):
+                return None
+
+        class Constants(ast.NodeTransformer):
+            def visit_Attribute(self, node: ast.Attribute):
+                path = (_dotted(node) or '').split('.')
+                if isinstance(node.ctx, ast.Load) and path[0] in function.__globals__:
+                    holder = function.__globals__[path[0]]
+                    for name in path[1:-1]:
+                        holder = getattr(holder, name, None)
+                    value = getattr(holder, path[-1], None)
+                    if inspect.isclass(holder) and isinstance(value, (bool, int, str)):
+                        return ast.copy_location(ast.Constant(value), node)
+                return self.generic_visit(node)
+
+        definition = Constants().visit(definition)
+
+        parameters = { a.arg for a in arguments.args }
+        for name in { n.id for n in ast.walk(definition) if isinstance(n, ast.Name) } - parameters - self.StoredNames(definition):
+            if namespace.get(name) is not function.__globals__.get(name):
+                return None
+
+        for argument in arguments.args:
+            argument.annotation = None
+        definition.returns = None
+        if definition.body and isinstance(definition.body[0], ast.Expr) and isinstance(definition.body[0].value, ast.Constant):
+            definition.body = definition.body[1:]  # docstring
+
+        return definition
+
+    # the object that 'call' invokes the method on followed by its arguments, None if these can't be matched to
+    # the parameters of 'definition'
+    def CallArguments(self, call: ast.Call, definition: ast.FunctionDef) -> List[ast.expr]:
+        if not isinstance(call.func, ast.Attribute) or call.keywords or any(isinstance(a, ast.Starred) for a in call.args):
+            return None
+        if len(call.args) + 1 != len(definition.args.args):
+            return None
+        return [ call.func.value ] + call.args
+
+    # the expression that 'call' of 'function' evaluates to, for a method that only returns an expression
+    def ExpandExpression(self, call: ast.Call, function, namespace: Dict[str, object]) -> ast.expr:
+        definition = self.ParseMethod(function, namespace)
+        if definition == None or len(definition.body) != 1 or not isinstance(definition.body[0], ast.Return) or definition.body[0].value == None:
+            return None
+        arguments = self.CallArguments(call, definition)
+        if arguments == None:
+            return None
+
+        expression = definition.body[0].value
+        if not _is_read_only(expression):
+            return None
+
+        substitutions = dict()
+        for parameter, argument in zip(definition.args.args, arguments):
+            uses = sum(1 for n in ast.walk(expression) if isinstance(n, ast.Name) and n.id == parameter.arg)
+            # arguments are evaluated once, before the method runs: only move the ones without side effects
+            if not _is_read_only(argument) or (uses > 1 and not isinstance(argument, (ast.Name, ast.Constant))):
+                return None
+            substitutions[parameter.arg] = argument
+
+        self._expanded += 1
+        return self.Substitute(expression, substitutions, dict())
+
+    # the statements that run 'call' of 'function' and store its return value in 'target' (if not None)
+    def ExpandStatement(self, call: ast.Call, function, target: ast.expr, namespace: Dict[str, object]) -> List[ast.stmt]:
+        definition = self.ParseMethod(function, namespace)
+        if definition == None:
+            return None
+        arguments = self.CallArguments(call, definition)
+        if arguments == None:
+            return None
+
+        body = self.MoveIntoElse(definition.body)
+        if not self.ReturnsAtEnd(body) or (target != None and not self.EndsInReturn(body)):
+            return None
+
+        self._expanded += 1
+        prefix = f'x{self._expanded}_'
+        stored = self.StoredNames(definition)
+
+        statements = []
+        substitutions = dict()
+        for parameter, argument in zip(definition.args.args, arguments):
+            # objects and values the method doesn't assign to are used as they are, the others are copied into a variable
+            if parameter.arg not in stored and (isinstance(argument, (ast.Name, ast.Constant)) or parameter is definition.args.args[0]):
+                substitutions[parameter.arg] = argument
+            else:
+                statements.append(ast.copy_location(ast.Assign([ ast.Name(prefix + parameter.arg, ast.Store()) ], argument), call))
+
+        renames = { name: prefix + name for name in stored | { a.arg for a in definition.args.args } if name not in substitutions }
+
+        class Returns(ast.NodeTransformer):
+            def visit_Return(self, node: ast.Return):
+                if target != None:
+                    return ast.copy_location(ast.Assign([ copy.deepcopy(target) ], node.value if node.value != None else ast.Constant(None)), node)
+                if node.value == None or _is_pure(node.value):
+                    return None
+                return ast.copy_location(ast.Expr(node.value), node)
+
+            def generic_visit(self, node):
+                node = super().generic_visit(node)
+                if isinstance(node, ast.If) and len(node.body) == 0:
+                    node.body = [ ast.Pass() ]
+                return node
+
+        for statement in body:
+            statement = Returns().visit(self.Substitute(statement, substitutions, renames))
+            if statement != None:
+                statements.append(statement)
+
+        return statements
+
+    # 'node' with the names in 'substitutions' replaced by (a copy of) an expression and those in 'renames' renamed
+    def Substitute(self, node, substitutions: Dict[str, ast.expr], renames: Dict[str, str]):
+        class Substituter(ast.NodeTransformer):
+            def visit_Name(self, node: ast.Name):
+                if node.id in substitutions and isinstance(node.ctx, ast.Load):
+                    value = substitutions[node.id]
+                    if isinstance(value, ast.Name):
+                        return ast.copy_location(ast.Name(value.id, ast.Load()), node)
+                    if isinstance(value, ast.Constant):
+                        return ast.copy_location(ast.Constant(value.value), node)
+                    return ast.copy_location(copy.deepcopy(value), node)
+                if node.id in renames:
+                    return ast.copy_location(ast.Name(renames[node.id], node.ctx), node)
+                return node
+
+        return Substituter().visit(node)
+
+    # 'if a: ...; return x' followed by more statements becomes 'if a: ...; return x; else: <the rest>'
+    def MoveIntoElse(self, statements: List[ast.stmt]) -> List[ast.stmt]:
+        out = []
+        for n, statement in enumerate(statements):
+            if isinstance(statement, ast.If):
+                statement.body = self.MoveIntoElse(statement.body)
+                statement.orelse = self.MoveIntoElse(statement.orelse)
+                if isinstance(statement.body[-1], ast.Return) and len(statement.orelse) == 0 and n + 1 < len(statements):
+                    statement.orelse = self.MoveIntoElse(statements[n + 1:])
+                    out.append(statement)
+                    break
+            out.append(statement)
+        return out
+
+    # True if each path through 'statements' ends in a return
+    def EndsInReturn(self, statements: List[ast.stmt]) -> bool:
+        if len(statements) == 0:
+            return False
+        last = statements[-1]
+        if isinstance(last, ast.If):
+            return self.EndsInReturn(last.body) and self.EndsInReturn(last.orelse)
+        return isinstance(last, ast.Return)
+
+    # True if there are no returns other than at the end of a path through 'statements'
+    def ReturnsAtEnd(self, statements: List[ast.stmt]) -> bool:
+        for n, statement in enumerate(statements):
+            if n == len(statements) - 1 and isinstance(statement, ast.If):
+                return self.ReturnsAtEnd(statement.body) and self.ReturnsAtEnd(statement.orelse)
+            if n < len(statements) - 1 and any(isinstance(node, ast.Return) for node in ast.walk(statement)):
+                return False
+        return True
+
+    def IsSingleIteration(self, statement: ast.For, folder: Folder) -> bool:
+        statement.iter = folder.visit(statement.iter)
+        if statement.orelse or not isinstance(statement.target, ast.Name):
+            return False
+        if any(isinstance(n, (ast.Break, ast.Continue)) for n in ast.walk(statement)):
+            return False
+        it = statement.iter
+        return isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == 'range' and len(it.args) == 1 and isinstance(it.args[0], ast.Constant) and it.args[0].value == 1
+
+    # names that 'node' assigns to
+    def StoredNames(self, node) -> set:
+        return { n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store) }
+
+    # True for 'a, b = x, y' where x and y don't use a or b
+    def IsParallelAssignment(self, statement: ast.Assign) -> bool:
+        if len(statement.targets) != 1 or not isinstance(statement.targets[0], ast.Tuple) or not isinstance(statement.value, ast.Tuple):
+            return False
+        targets = statement.targets[0].elts
+        if len(targets) != len(statement.value.elts) or not all(isinstance(t, ast.Name) for t in targets):
+            return False
+        return len(self.StoredNames(statement.targets[0]) & { n.id for n in ast.walk(statement.value) if isinstance(n, ast.Name) }) == 0
+
+    # propagates the known values of 'env' through 'statements', returns the simplified statements
+    def Block(self, statements: List[ast.stmt], instruction: str, fields: Dict[str, int], env: Dict[str, object]) -> List[ast.stmt]:
+        out = []
+
+        for statement in statements:
+            folder = Specializer.Folder(instruction, fields, env)
+
+            if isinstance(statement, ast.Assign) and self.IsParallelAssignment(statement):
+                # 'a, b = x, y' is 'a = x' followed by 'b = y', for when the value comes from an inlined method
+                assignments = [ ast.copy_location(ast.Assign([ target ], value), statement) for target, value in zip(statement.targets[0].elts, statement.value.elts) ]
+                out += self.Block(assignments, instruction, fields, env)
+
+            elif isinstance(statement, ast.Assign):
+                statement.value = folder.visit(statement.value)
+                statement.targets = [ folder.visit(target) for target in statement.targets ]
+                for name in self.StoredNames(statement):
+                    env.pop(name, None)
+                if len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name) and isinstance(statement.value, ast.Constant):
+                    env[statement.targets[0].id] = statement.value.value
+                out.append(statement)
+
+            elif isinstance(statement, ast.AugAssign):
+                statement.value = folder.visit(statement.value)
+                target = statement.target
+                if isinstance(target, ast.Name) and target.id in env and isinstance(statement.value, ast.Constant):
+                    value = folder.Evaluate(ast.BinOp(ast.Constant(env[target.id]), statement.op, statement.value))
+                    if isinstance(value, ast.Constant):
+                        env[target.id] = value.value
+                        out.append(ast.copy_location(ast.Assign([ ast.Name(target.id, ast.Store()) ], value), statement))
+                        continue
+                statement.target = folder.visit(target)
+                env.pop(target.id if isinstance(target, ast.Name) else None, None)
+                out.append(statement)
+
+            elif isinstance(statement, ast.If):
+                statement.test = folder.VisitCondition(statement.test)
+                if isinstance(statement.test, ast.Constant):
+                    out += self.Block(statement.body if statement.test.value else statement.orelse, instruction, fields, env)
+                    if out and isinstance(out[-1], ast.Return):
+                        break
+                    continue
+
+                env_body = dict(env)
+                env_else = dict(env)
+                statement.body = self.Block(statement.body, instruction, fields, env_body) or [ ast.Pass() ]
+                statement.orelse = self.Block(statement.orelse, instruction, fields, env_else)
+                env.clear()
+                env.update({ k: v for k, v in env_body.items() if k in env_else and env_else[k] == v and type(env_else[k]) == type(v) })
+                out.append(statement)
+
+            elif isinstance(statement, ast.For) and self.IsSingleIteration(statement, folder):
+                # 'for x in range(1)' is its body with x = 0
+                assign = ast.copy_location(ast.Assign([ statement.target ], ast.Constant(0)), statement)
+                out += self.Block([ assign ] + statement.body, instruction, fields, env)
+
+            elif isinstance(statement, (ast.For, ast.While)):
+                # the body can run any number of times
+                for name in self.StoredNames(statement):
+                    env.pop(name, None)
+                if isinstance(statement, ast.For):
+                    statement.iter = folder.visit(statement.iter)
+                else:
+                    statement.test = folder.visit(statement.test)
+                statement.body = self.Block(statement.body, instruction, fields, dict(env)) or [ ast.Pass() ]
+                statement.orelse = self.Block(statement.orelse, instruction, fields, dict(env))
+                out.append(statement)
+
+            elif isinstance(statement, (ast.Return, ast.Expr, ast.Assert, ast.Pass)):
+                out.append(folder.visit(statement))
+                if isinstance(statement, ast.Return):
+                    break  # the rest can't be reached
+
+            else:
+                # anything else is left as it is, without what it may assign
+                for name in self.StoredNames(statement):
+                    env.pop(name, None)
+                out.append(Specializer.Folder(instruction, fields, env).visit(statement))
+
+        return out
+
+    # drops assignments without side effects to variables that are not read (anymore) afterwards, returns True if any were found
+    def RemoveUnusedAssignments(self, definition: ast.FunctionDef, statements: List[ast.stmt]) -> bool:
+        self._loaded = dict()
+        used = self.LoadedNames(definition)
+        return self.RemoveAssignments(statements, used, True)
+
+    # names that 'node' reads, remembered for the duration of a RemoveUnusedAssignments pass
+    def LoadedNames(self, node) -> set:
+        if id(node) not in self._loaded:
+            self._loaded[id(node)] = { n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load) }
+        return self._loaded[id(node)]
+
+    # True if 'node' holds a break, continue or try, remembered like LoadedNames
+    def HasJumps(self, node) -> bool:
+        key = ('jumps', id(node))
+        if key not in self._loaded:
+            self._loaded[key] = any(isinstance(n, (ast.Break, ast.Continue, ast.Try)) for n in ast.walk(node))
+        return self._loaded[key]
+
+    # True if 'name' is assigned again (or the function returns) after statements[index] before it is read
+    def IsOverwritten(self, statements: List[ast.stmt], index: int, name: str, top: bool) -> bool:
+        for statement in statements[index + 1:]:
+            if name in self.LoadedNames(statement):
+                return False
+            # control flow that can lead to a read of the old value elsewhere
+            if self.HasJumps(statement):
+                return False
+            if isinstance(statement, ast.Return):
+                return True
+            if isinstance(statement, ast.Assign):
+                for target in statement.targets:
+                    elements = target.elts if isinstance(target, ast.Tuple) else [ target ]
+                    if any(isinstance(e, ast.Name) and e.id == name for e in elements):
+                        return True
+        return top  # at the end of the function it is gone
+
+    def RemoveAssignments(self, statements: List[ast.stmt], used: set, top: bool) -> bool:
+        removed = False
+
+        for statement in list(statements):
+            if isinstance(statement, (ast.Assign, ast.AugAssign)) and _is_pure(statement.value):
+                targets = statement.targets if isinstance(statement, ast.Assign) else [ statement.target ]
+                if all(isinstance(t, ast.Name) for t in targets):
+                    names = [ t.id for t in targets ]
+                    index = statements.index(statement)
+                    if all(n not in used for n in names) or (isinstance(statement, ast.Assign) and all(self.IsOverwritten(statements, index, n, top) for n in names)):
+                        statements.remove(statement)
+                        removed = True
+                        continue
+
+            for field in ('body', 'orelse'):
+                block = getattr(statement, field, None)
+                if isinstance(block, list) and block and isinstance(block[0], ast.stmt):
+                    removed |= self.RemoveAssignments(block, used, False)
+                    if field == 'body' and len(block) == 0:
+                        block.append(ast.Pass())
+
+        return removed
@@ -1,5 +1,21 @@
 from enum import Enum
 
+
+# S (0x80), Z (0x40) and P (0x04) flag bits for each value of a byte or word result
+def _build_szp_table(sign_bit: int, size: int) -> bytes:
+    table = bytearray(size)
+    for v in range(size):
+        bits = 0
+        if v & sign_bit:
+            bits |= 0x80
+        if v == 0:
+            bits |= 0x40
+        if bin(v & 0xff).count('1') % 2 == 0:
+            bits |= 0x04
+        table[v] = bits
+    return bytes(table)
+
+
 class State8088:
     class RepMode(Enum):
         NotSet = 0
@@ -7,23 +23,26 @@ class State8088:
         REPNZ = 2
         REP = 3
 
+    LAZY_NONE = 0
+    LAZY_ADD_SUB = 1
+    LAZY_LOGIC = 2
+
+    SZP8 = _build_szp_table(0x80, 0x100)
+    SZP16 = _build_szp_table(0x8000, 0x10000)
+
+    __slots__ = ( '_regs', '_ip', '_cs', '_ds', '_es', '_ss', '_cs_base', '_ds_base', '_es_base', '_ss_base',
+                  '_segment_override_base', '_segment_override_set', '_flags',
+                  '_lazy', '_lazy_word', '_lazy_r1', '_lazy_r2', '_lazy_result', '_lazy_issub', '_lazy_flag_c',
+                  '_in_hlt', '_inhibit_interrupts', '_rep', '_rep_do_nothing', '_rep_mode', '_rep_addr', '_rep_opcode',
+                  '_clock', '_crash_counter' )
+
     def __init__(self):
         self.Reset()
 
     def Reset(self):
-        self._ah: int = 0
-        self._al: int = 0
-        self._bh: int = 0
-        self._bl: int = 0
-        self._ch: int = 0
-        self._cl: int = 0
-        self._dh: int = 0
-        self._dl: int = 0
-
-        self._si: int = 0
-        self._di: int = 0
-        self._bp: int = 0
-        self._sp: int = 0
+        # AX, CX, DX, BX, SP, BP, SI and DI, in the order of the register numbers in ModRM bytes
+        # byte register n is in the low (n < 4) or high (n >= 4) half of word register n & 3
+        self._regs: list = [ 0 ] * 8
 
         self._ip: int = 0
 
@@ -32,12 +51,28 @@ class State8088:
         self._es: int = 0
         self._ss: int = 0
 
+        # linear addresses at which the segments start (segment << 4), only set through SetCS() etc.
+        self._cs_base: int = 0
+        self._ds_base: int = 0
+        self._es_base: int = 0
+        self._ss_base: int = 0
+
         # replace by an Optional-type when available
-        self._segment_override: int = 0
+        self._segment_override_base: int = 0
         self._segment_override_set: bool = False
 
         self._flags: int = 0
 
+        # the last flag producing ALU operation, its flags (C, P, A, Z, S and O) are only
+        # calculated when they're needed; when _lazy is set these bits in _flags are stale
+        self._lazy: int = State8088.LAZY_NONE
+        self._lazy_word: bool = False
+        self._lazy_r1: int = 0
+        self._lazy_r2: int = 0
+        self._lazy_result: int = 0
+        self._lazy_issub: bool = False
+        self._lazy_flag_c: bool = False
+
         self._in_hlt: bool = False
         self._inhibit_interrupts : bool = False  # for 1 instruction after loading segment registers
 
@@ -76,100 +111,90 @@ class State8088:
         print(f"{self.GetFlagsAsString()} AX:{self.GetAX():4x} BX:{self.GetBX():4x} CX:{self.GetCX():4x} DX:{self.GetDX():4x} SP:{self.GetSP():4x} BP:{self.GetBP():4x} SI:{self.GetSI():4x} DI:{self.GetDI():4x} flags:{self.GetFlags():4x} ES:{self.GetES():4x} CS:{self._cs:4x} SS:{self.GetSS():4x} DS:{self.GetDS():4x} IP:{self._ip:4x}")
         print(f"REP: {self._rep}, do-nothing: {self._rep_do_nothing}, mode: {self._rep_mode}, addr {self._rep_addr}, opcode {self._rep_opcode}")
         print(f"In HLT: {self._in_hlt}, inhibit interrupts: {self._inhibit_interrupts}")
-        print(f"Segment override: {self._segment_override_set}, value: {self._segment_override}")
+        print(f"Segment override: {self._segment_override_set}, base: {self._segment_override_base:05x}")
         print(f"Crash counter: {self._crash_counter}")
 
     def SetIP(self, cs_in: int, ip_in: int):
         assert cs_in >= 0 and cs_in <= 65535
         assert ip_in >= 0 and ip_in <= 65535
         self._cs = cs_in
+        self._cs_base = cs_in << 4
         self._ip = ip_in
 
     def FixFlags(self):
+        if self._lazy:
+            self.ResolveFlags()
         self._flags &= 0b1111111111010101
         self._flags |= 2  # bit 1 is always set
         self._flags |= 0xf000  # upper 4 bits are always 1
 
     def GetAL(self) -> int:
-        return self._al
+        return self._regs[0] & 0xff
 
     def SetAL(self, v: int):
-        assert v >= 0 and v <= 255
-        assert type(v) == int
-        self._al = v
+        self._regs[0] = (self._regs[0] & 0xff00) | v
 
     def GetAH(self) -> int:
-        return self._ah
+        return self._regs[0] >> 8
 
     def SetAH(self, v: int):
-        assert v >= 0 and v <= 255
-        assert type(v) == int
-        self._ah = v
+        self._regs[0] = (self._regs[0] & 0x00ff) | (v << 8)
 
     def GetAX(self) -> int:
-        return (self._ah << 8) | self._al
+        return self._regs[0]
 
     def SetAX(self, v: int):
-        assert v >= 0 and v <= 65535
-        assert type(v) == int
-        self._ah = v >> 8
-        self._al = v & 255
+        self._regs[0] = v
 
     def GetBX(self) -> int:
-        return (self._bh << 8) | self._bl
+        return self._regs[3]
 
     def SetBX(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._bh = v >> 8
-        self._bl = v & 255
+        self._regs[3] = v
 
     def GetCX(self) -> int:
-        return (self._ch << 8) | self._cl
+        return self._regs[1]
 
     def SetCX(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._ch = v >> 8
-        self._cl = v & 255
+        self._regs[1] = v
 
     def GetDX(self) -> int:
-        return (self._dh << 8) | self._dl
+        return self._regs[2]
 
     def SetDX(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._dh = v >> 8
-        self._dl = v & 255
+        self._regs[2] = v
 
     def SetSS(self, v: int):
         assert v >= 0 and v <= 65535
         self._ss = v
+        self._ss_base = v << 4
 
     def SetCS(self, v: int):
         assert v >= 0 and v <= 65535
         self._cs = v
+        self._cs_base = v << 4
 
     def SetDS(self, v: int):
         assert v >= 0 and v <= 65535
         self._ds = v
+        self._ds_base = v << 4
 
     def SetES(self, v: int):
         assert v >= 0 and v <= 65535
         self._es = v
+        self._es_base = v << 4
 
     def SetSP(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._sp = v
+        self._regs[4] = v
 
     def SetBP(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._bp = v
+        self._regs[5] = v
 
     def SetSI(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._si = v
+        self._regs[6] = v
 
     def SetDI(self, v: int):
-        assert v >= 0 and v <= 65535
-        self._di = v
+        self._regs[7] = v
 
     def SetIP(self, v: int):
         assert v >= 0 and v <= 65535
@@ -177,6 +202,7 @@ class State8088:
 
     def SetFlags(self, v: int):
         assert v >= 0 and v <= 65535
+        self._lazy = State8088.LAZY_NONE
         self._flags = v
 
     def GetSS(self) -> int:
@@ -192,53 +218,138 @@ class State8088:
         return self._es
 
     def GetSP(self) -> int:
-        return self._sp
+        return self._regs[4]
 
     def GetBP(self) -> int:
-        return self._bp
+        return self._regs[5]
 
     def GetSI(self) -> int:
-        return self._si
+        return self._regs[6]
 
     def GetDI(self) -> int:
-        return self._di
+        return self._regs[7]
 
     def GetIP(self) -> int:
         return self._ip
 
     def GetFlags(self) -> int:
+        if self._lazy:
+            self.ResolveFlags()
         return self._flags
 
+    def SetAddSubFlags(self, word: bool, r1: int, r2: int, result: int, issub: bool, flag_c: bool):
+        assert r1 >= 0 and r1 <= (65535 if word else 255)
+        assert r2 >= 0 and r2 <= (65535 if word else 255)
+
+        self._lazy = State8088.LAZY_ADD_SUB
+        self._lazy_word = word
+        self._lazy_r1 = r1
+        self._lazy_r2 = r2
+        self._lazy_result = result
+        self._lazy_issub = issub
+        self._lazy_flag_c = flag_c
+
+    def SetLogicFuncFlags(self, word: bool, result: int):
+        self._lazy = State8088.LAZY_LOGIC
+        self._lazy_word = word
+        self._lazy_result = result
+
+    # puts the flags of the last ALU operation in _flags
+    def ResolveFlags(self):
+        word = self._lazy_word
+        result = self._lazy_result
+        flags = self._flags & ~0x08d5
+
+        if self._lazy == State8088.LAZY_ADD_SUB:
+            r1 = self._lazy_r1
+            r2 = self._lazy_r2
+            u_result = result & 0xffffffff
+
+            if word:
+                if u_result >= 0x10000:
+                    flags |= 0x0001  # C
+                flags |= State8088.SZP16[result & 0xffff]
+                mask = 0x8000
+            else:
+                if u_result >= 0x100:
+                    flags |= 0x0001  # C
+                flags |= State8088.SZP8[result & 0xff]
+                mask = 0x80
+
+            # an add overflows when both operands have a sign that differs from the result,
+            # a subtraction when the operands differ in sign and the result differs from r1
+            if self._lazy_issub:
+                if (r1 ^ r2) & (r1 ^ result) & mask:
+                    flags |= 0x0800  # O
+            elif (r1 ^ result) & (r2 ^ result) & mask:
+                flags |= 0x0800  # O
+
+            # the carry (or borrow) into bit 4, also with the carry flag taken in
+            flags |= (r1 ^ r2 ^ result) & 0x0010  # A
+
+        else:
+            # O, A (undefined) and C are cleared
+            if word == False:
+                flags |= State8088.SZP8[result & 0xff]
+            elif result >= 0 and result <= 0xffff:
+                flags |= State8088.SZP16[result]
+            else:
+                flags |= State8088.SZP16[result & 0xffff] & ~0x40  # Z is of the unmasked result
+
+        self._flags = flags
+        self._lazy = State8088.LAZY_NONE
+
     def SetZSPFlags(self, v: int):
         assert v >= 0 and v <= 65535
-        self.SetFlagZ(v == 0)
-        self.SetFlagS(bool(v & 0x80))
-        self.SetFlagP(v)
-
+        bits = State8088.SZP8[v & 0xff]
+        if v > 0xff:
+            bits &= ~0x40
+        if self._lazy:
+            self.ResolveFlags()
+        self._flags = (self._flags & ~0x00c4) | bits
+
+    # S, Z and P of a byte (0...255) or word (0...65535) result
+    def SetSZPFlags(self, word: bool, v: int):
+        if self._lazy:
+            self.ResolveFlags()
+        self._flags = (self._flags & ~0x00c4) | (State8088.SZP16[v] if word else State8088.SZP8[v])
+
+    # only the bits of C, P, A, Z, S and O (0x08d5) are evaluated lazily
     def ClearFlagBit(self, bit: int):
+        if self._lazy and (1 << bit) & 0x08d5:
+            self.ResolveFlags()
         self._flags &= ~(1 << bit)
 
     def SetFlagBit(self, bit: int):
+        if self._lazy and (1 << bit) & 0x08d5:
+            self.ResolveFlags()
         self._flags |= 1 << bit
 
     def SetFlag(self, bit: int, state: bool):
+        if self._lazy and (1 << bit) & 0x08d5:
+            self.ResolveFlags()
         self._flags &= ~(1 << bit)
         self._flags |= state << bit
 
     def GetFlag(self, bit: int) -> bool:
+        if self._lazy and (1 << bit) & 0x08d5:
+            self.ResolveFlags()
         return bool(self._flags & (1 << bit))
 
     def SetFlagC(self, state: bool):
         self.SetFlag(0, state)
 
     def GetFlagC(self) -> bool:
-        return self.GetFlag(0)
+        if self._lazy == State8088.LAZY_ADD_SUB:
+            return (self._lazy_result & 0xffffffff) >= (0x10000 if self._lazy_word else 0x100)
+        if self._lazy == State8088.LAZY_LOGIC:
+            return False
+        return bool(self._flags & 1)
 
     def SetFlagP(self, v: int):
-        y = v ^ (v >> 1)
-        y = y ^ (y >> 2)
-        y = y ^ (y >> 4)
-        self.SetFlag(2, (y & 1) == 0)
+        if self._lazy:
+            self.ResolveFlags()
+        self._flags = (self._flags & ~0x0004) | (State8088.SZP8[v & 0xff] & 0x04)
 
     def GetFlagP(self) -> bool:
         return self.GetFlag(2)
@@ -253,31 +364,37 @@ class State8088:
         self.SetFlag(6, state)
 
     def GetFlagZ(self) -> bool:
-        return self.GetFlag(6)
+        if self._lazy == State8088.LAZY_ADD_SUB:
+            return (self._lazy_result & (0xffff if self._lazy_word else 0xff)) == 0
+        if self._lazy == State8088.LAZY_LOGIC:
+            return self._lazy_result == 0 if self._lazy_word else (self._lazy_result & 0xff) == 0
+        return bool(self._flags & 0x40)
 
     def SetFlagS(self, state: bool):
         self.SetFlag(7, state)
 
     def GetFlagS(self) -> bool:
-        return self.GetFlag(7)
+        if self._lazy:
+            return (self._lazy_result & (0x8000 if self._lazy_word else 0x80)) != 0
+        return bool(self._flags & 0x80)
 
     def SetFlagT(self, state: bool):
         self.SetFlag(8, state)
 
     def GetFlagT(self) -> bool:
-        return self.GetFlag(8)
+        return bool(self._flags & 0x100)
 
     def SetFlagI(self, state: bool):
         self.SetFlag(9, state)
 
     def GetFlagI(self) -> bool:
-        return self.GetFlag(9)
+        return bool(self._flags & 0x200)
 
     def SetFlagD(self, state: bool):
         self.SetFlag(10, state)
 
     def GetFlagD(self) -> bool:
-        return self.GetFlag(10)
+        return bool(self._flags & 0x400)
 
     def SetFlagO(self, state: bool):
         self.SetFlag(11, state)
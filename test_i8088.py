@@ -0,0 +1,33 @@
+#! /usr/bin/python3
+
+import bus
+import i8088
+import unittest
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self._b = bus.Bus(1024 * 1024, [], [])
+        self._p = i8088.i8088(self._b, [], False)
+        self._state = self._p.GetState()
+
+    def Load(self, code: list[int]):
+        for offset, byte in enumerate(code):
+            self._b.WriteByte(0x10100 + offset, byte)
+        self._state.SetCS(0x1000)
+        self._state.SetIP(0x100)
+
+    # INC CX, MOV SI,CX, JNZ back to the INC: a block that jumps back to itself, which TickBlock()
+    # runs as a whole (and would skip ahead in if it didn't change registers)
+    def test_flat_run_1_steps_an_idle_capable_block(self):
+        self._p.UseFlatInterpreter(True)
+        self.Load([ 0x41, 0x8b, 0xf1, 0x65, 0xfb ])
+
+        for ip in (0x101, 0x103, 0x100, 0x101):
+            reason, cycles = self._p.Run(1)
+            self.assertEqual(reason, 'budget')
+            self.assertEqual(self._state.GetIP(), ip)
+
+        self.assertEqual(self._state.GetCX(), 2)
+
+if __name__ == '__main__':
+    unittest.main()